@@ -1,23 +1,45 @@
 
-import time
 import os
-import glob
 import shutil
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.firefox.options import Options
 import argparse
 import datetime
+import queue
+import sys
+import threading
+from fs_watch import wait_for_new_file
+import bill_freshness
+import timings
+
+DEFAULT_BASE_URL = "https://mydei.dei.gr"
+BANNER_TIMEOUT = 10 # Δευτερόλεπτα αναμονής για το cookie banner (δεν εμφανίζεται πάντα)
+
+# Το selenium φορτώνεται μόνο όταν ξεκινά ο Firefox (όχι για --help ή --http)
+webdriver = By = WebDriverWait = EC = Options = None
+
+def _load_selenium():
+    global webdriver, By, WebDriverWait, EC, Options
+    if webdriver is None:
+        from selenium import webdriver
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.firefox.options import Options
+
+def dated_pdf_path(target_dir):
+    """Νέο όνομα αρχείου με την τρέχουσα ημερομηνία/ώρα μέσα στο target_dir."""
+    os.makedirs(target_dir, exist_ok=True)
+    current_date = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return os.path.join(target_dir, f"{current_date}.pdf")
 
 class TestAutodei:
-    def __init__(self, headless_mode=False, quiet_mode=False):
+    def __init__(self, headless_mode=False, quiet_mode=False, base_url=DEFAULT_BASE_URL, download_dir=None):
         self.headless_mode = headless_mode
         self.quiet_mode = quiet_mode
-        self.download_dir = None # Initialize to None
+        self.base_url = base_url.rstrip("/")
+        self.download_dir = download_dir # None: ./dei
         self.driver = None # Initialize to None
         self.wait = None # Initialize to None
+        self.http_session = None # Δημιουργείται με την πρώτη λήψη μέσω HTTP
         self.vars = {} # Initialize to empty dict
 
     def _print_message(self, message):
@@ -26,11 +48,13 @@ class TestAutodei:
 
     def setup_method(self, method):
         # 1. Ορισμός και δημιουργία του υποφακέλου 'dei' για τις λήψεις
-        self.download_dir = os.path.join(os.getcwd(), "dei")
+        if self.download_dir is None:
+            self.download_dir = os.path.join(os.getcwd(), "dei")
         os.makedirs(self.download_dir, exist_ok=True) # Δημιουργία φακέλου αν δεν υπάρχει
         self._print_message(f"Οι λήψεις PDF θα αποθηκευτούν στον κατάλογο: {self.download_dir}")
 
         # 2. Ρύθμιση επιλογών Firefox για αυτόματη λήψη PDF
+        _load_selenium()
         firefox_options = Options()
         # Ορισμός προτιμήσεων για τη διαχείριση λήψεων
         firefox_options.set_preference("browser.download.folderList", 2) # 0=Desktop, 1=Downloads, 2=Custom
@@ -53,96 +77,261 @@ class TestAutodei:
         # 5. Κλείσιμο του browser
         if self.driver: # Ensure driver exists before quitting
             self.driver.quit()
+            self.driver = None
+        if self.http_session:
+            self.http_session.close()
+            self.http_session = None
         # 6. Δεν γίνεται καθαρισμός του φακέλου λήψεων, καθώς ο χρήστης θέλει να διατηρήσει τα αρχεία.
 
-    def test_autodei(self, account_number): # Τροποποίηση για να δέχεται account_number
-        self.driver.get("https://mydei.dei.gr/el")
-        self.driver.set_window_size(650, 528) # Διατηρείται το αρχικό μέγεθος παραθύρου
+    def reset_session(self):
+        """
+        Επαναφέρει τον browser σε καθαρή κατάσταση ανάμεσα σε λογαριασμούς
+        (cookies, local/session storage) χωρίς νέα εκκίνηση του Firefox.
+        """
+        if self.driver.current_url.startswith("http"):
+            self.driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+            self.driver.delete_all_cookies()
+        self.driver.get("about:blank")
+
+    def download(self, account_number, target_dir=None, use_http=False, force=False, issue_days=bill_freshness.ISSUE_DAYS):
+        """
+        Κατεβάζει έναν λογαριασμό. Με use_http δοκιμάζεται πρώτα η λήψη χωρίς browser
+        (mydei_http: υποβολή φόρμας και λήψη PDF με HTTP, keep-alive και cookies)· αν η
+        ροή των σελίδων έχει αλλάξει, γίνεται λήψη με τον Firefox, που ξεκινά μόνο τότε.
+        Χωρίς force δεν γίνεται καμία λήψη όσο ο τελευταίος λογαριασμός στο target_dir
+        δεν έχει φτάσει την επόμενη καταμέτρηση (bill_freshness.py).
+        Το PDF αποθηκεύεται ως <συμβόλαιο>_<ΕΕΕΕ-ΜΜ>.pdf (μήνας εξόφλησης).
+        Επιστρέφει τη διαδρομή του PDF ή None.
+        """
+        target_dir = target_dir or self.download_dir or os.path.join(os.getcwd(), "dei")
+        if not force:
+            with timings.stage("freshness"):
+                known_path = self._known_bill(account_number, target_dir, issue_days)
+            if known_path:
+                return known_path
+        if use_http:
+            import http.client
+            from mydei_http import FlowChanged, HttpSession, fetch_bill
+            if self.http_session is None:
+                self.http_session = HttpSession(self.base_url)
+            self.http_session.clear_cookies()
+            try:
+                with timings.stage("http_fetch"):
+                    new_full_path = fetch_bill(self.http_session, account_number, dated_pdf_path(target_dir))
+                self._print_message(f"Το PDF κατέβηκε μέσω HTTP και αποθηκεύτηκε ως: {new_full_path}")
+                return self._file_by_period(new_full_path, target_dir)
+            except (FlowChanged, OSError, http.client.HTTPException) as e:
+                self._print_message(f"Η λήψη μέσω HTTP απέτυχε ({e}), χρήση του browser.")
+        if self.driver is None:
+            with timings.stage("browser_start"):
+                self.setup_method(None)
+        else:
+            with timings.stage("session_reset"):
+                self.reset_session()
+        return self._file_by_period(self.test_autodei(account_number, target_dir=target_dir), target_dir)
 
-        time.sleep(3) # Προσθήκη καθυστέρησης πριν το cookie banner
+    def _known_bill(self, account_number, target_dir, issue_days):
+        """Η διαδρομή του τελευταίου λογαριασμού στο δίσκο αν δεν μπορεί να υπάρχει νεότερος, αλλιώς None."""
+        try:
+            known = bill_freshness.latest_bill(target_dir, account_number)
+        except Exception as e:
+            self._print_message(f"Ο έλεγχος των αρχείων στο {target_dir} απέτυχε ({e}), γίνεται λήψη.")
+            return None
+        if known is None and bill_freshness.dated_files(target_dir):
+            self._print_message(f"Τα PDF στο {target_dir} έχουν ακόμη ονόματα με ημερομηνία και δεν ελέγχονται· "
+                                f"μετονομασία με: python3 bill_freshness.py {target_dir}")
+        if known is None or bill_freshness.new_bill_possible(known.data, issue_days=issue_days):
+            return None
+        self._print_message(f"Δεν υπάρχει ακόμη νέος λογαριασμός (επόμενη καταμέτρηση {known.data['nextMeasurement']}), "
+                            f"χωρίς λήψη: {known.path}")
+        return known.path
 
-        # 7. Αναμονή και κλικ στο κουμπί αποδοχής cookies (αν υπάρχει)
+    def _file_by_period(self, pdf_path, target_dir):
+        """Μετονομάζει το PDF που κατέβηκε σε <συμβόλαιο>_<ΕΕΕΕ-ΜΜ>.pdf."""
+        if pdf_path is None:
+            return None
         try:
-            accept_cookies_button = self.wait.until(
-                EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler"))
-            )
-            accept_cookies_button.click()
-            self._print_message("Το cookie banner έγινε αποδεκτό.")
-            time.sleep(2) # Προσθήκη καθυστέρησης μετά το κλικ στο cookie banner
-        except:
-            self._print_message("Το cookie banner δεν βρέθηκε ή δεν ήταν clickable.")
-            pass # Συνέχισε αν δεν υπάρχει cookie banner ή δεν μπορεί να γίνει κλικ
+            with timings.stage("file_by_period"):
+                filed_path, is_new = bill_freshness.file_by_period(pdf_path, target_dir)
+        except Exception as e:
+            self._print_message(f"Το PDF δεν διαβάστηκε ({e}), παραμένει ως: {pdf_path}")
+            return pdf_path
+        if not is_new:
+            self._print_message(f"Ο λογαριασμός υπάρχει ήδη, δεν έχει εκδοθεί νέος: {filed_path}")
+        elif filed_path != pdf_path:
+            self._print_message(f"Μετονομάστηκε σε: {filed_path}")
+        return filed_path
+
+    def test_autodei(self, account_number, target_dir=None): # Τροποποίηση για να δέχεται account_number
+        """
+        Κατεβάζει τον λογαριασμό και τον μετακινεί στο target_dir (προεπιλογή: self.download_dir).
+        Επιστρέφει τη διαδρομή του PDF ή None.
+        """
+        with timings.stage("page_load"):
+            self.driver.get(f"{self.base_url}/el")
+            self.driver.set_window_size(650, 528) # Διατηρείται το αρχικό μέγεθος παραθύρου
+
+        # 7. Αναμονή και κλικ στο κουμπί αποδοχής cookies (αν υπάρχει)
+        # Το banner φορτώνεται ασύγχρονα: αναμονή μέχρι να γίνει clickable (όχι σταθερή καθυστέρηση)
+        # και μετά μέχρι να φύγει μαζί με το σκούρο φόντο του, ώστε να μην εμποδίζει τα επόμενα κλικ.
+        with timings.stage("banner"):
+            try:
+                accept_cookies_button = WebDriverWait(self.driver, BANNER_TIMEOUT).until(
+                    EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler"))
+                )
+                accept_cookies_button.click()
+                self.wait.until(EC.invisibility_of_element_located((By.ID, "onetrust-banner-sdk")))
+                self.wait.until(EC.invisibility_of_element_located((By.CLASS_NAME, "onetrust-pc-dark-filter")))
+                self._print_message("Το cookie banner έγινε αποδεκτό.")
+            except:
+                self._print_message("Το cookie banner δεν βρέθηκε ή δεν ήταν clickable.")
+                pass # Συνέχισε αν δεν υπάρχει cookie banner ή δεν μπορεί να γίνει κλικ
 
         # 8. Κλικ στο κουμπί "Κοινόχρηστα"
         # Αναμονή μέχρι το κουμπί να είναι ορατό και clickable
-        koinoxrista_button = self.wait.until(
-            EC.element_to_be_clickable((By.XPATH, "//button[.//div[text()='Κοινόχρηστα']]"))
-        )
-        koinoxrista_button.click()
-
-        # 9. Αναμονή για το πεδίο εισαγωγής "ContractAccount" και εισαγωγή τιμής
-        contract_account_field = self.wait.until(
-            EC.element_to_be_clickable((By.ID, "ContractAccount"))
-        )
-        contract_account_field.send_keys(account_number) # Χρήση του account_number από το όρισμα
-
-        # 10. Κλικ στο κουμπί υποβολής
-        submit_button = self.wait.until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, ".b-login-panel__submit"))
-        )
-        submit_button.click()
+        with timings.stage("form"):
+            koinoxrista_button = self.wait.until(
+                EC.element_to_be_clickable((By.XPATH, "//button[.//div[text()='Κοινόχρηστα']]"))
+            )
+            koinoxrista_button.click()
+
+            # 9. Αναμονή για το πεδίο εισαγωγής "ContractAccount" και εισαγωγή τιμής
+            contract_account_field = self.wait.until(
+                EC.element_to_be_clickable((By.ID, "ContractAccount"))
+            )
+            contract_account_field.send_keys(account_number) # Χρήση του account_number από το όρισμα
+
+            # 10. Κλικ στο κουμπί υποβολής
+            submit_button = self.wait.until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, ".b-login-panel__submit"))
+            )
+            submit_button.click()
 
         # 11. Κλικ στον σύνδεσμο "Λήψη"
-        download_link = self.wait.until(
-            EC.element_to_be_clickable((By.LINK_TEXT, "Λήψη"))
-        )
-        download_link.click()
+        with timings.stage("download_link"):
+            download_link = self.wait.until(
+                EC.element_to_be_clickable((By.LINK_TEXT, "Λήψη"))
+            )
+            existing_files = set(os.listdir(self.download_dir)) # Ό,τι υπάρχει ήδη δεν είναι η νέα λήψη
+            download_link.click()
 
         # 12. Αναμονή για την ολοκλήρωση της λήψης του PDF
-        downloaded_file_path = self._wait_for_download_completion(self.download_dir, timeout=60) # Αυξήθηκε το timeout
+        with timings.stage("download_wait"):
+            downloaded_file_path = self._wait_for_download_completion(self.download_dir, existing_files, timeout=60) # Αυξήθηκε το timeout
 
         if downloaded_file_path:
             # 13. Μετονομασία του αρχείου σε ημερομηνία
-            current_date = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            new_filename = f"{current_date}.pdf"
-            new_full_path = os.path.join(self.download_dir, new_filename)
+            new_full_path = dated_pdf_path(target_dir or self.download_dir)
 
             # Μετακίνηση και μετονομασία του αρχείου
             shutil.move(downloaded_file_path, new_full_path)
             self._print_message(f"Το PDF κατέβηκε επιτυχώς και αποθηκεύτηκε ως: {new_full_path}")
+            return new_full_path
         else:
             self._print_message("Η λήψη του PDF απέτυχε ή έληξε το χρονικό όριο.")
+            return None
 
-    def _wait_for_download_completion(self, download_folder, timeout=30):
+    def _wait_for_download_completion(self, download_folder, existing_files, timeout=30):
         """
-        Περιμένει μέχρι να εμφανιστεί ένα αρχείο PDF στον καθορισμένο φάκελο λήψεων.
+        Περιμένει μέχρι να ολοκληρωθεί ένα νέο αρχείο PDF στον φάκελο λήψεων: να μην ήταν
+        στο existing_files, να μην υπάρχει το αντίστοιχο .part του Firefox και το μέγεθός του
+        να έχει σταθεροποιηθεί. Ξυπνά με inotify (ή σύντομο polling όπου δεν υπάρχει).
         Επιστρέφει την πλήρη διαδρομή του αρχείου αν βρεθεί, αλλιώς None.
         """
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            # Λίστα όλων των αρχείων στον κατάλογο λήψεων
-            list_of_files = glob.glob(os.path.join(download_folder, '*'))
-            # Φιλτράρισμα για αρχεία PDF
-            pdf_files = [f for f in list_of_files if f.endswith('.pdf')]
-
-            if pdf_files:
-                # Επιστρέφουμε το πρώτο αρχείο PDF που βρέθηκε
-                # Αν αναμένονται πολλαπλές λήψεις, ίσως χρειαστεί πιο σύνθετη λογική
-                return pdf_files[0]
-            time.sleep(1) # Ελέγχουμε κάθε δευτερόλεπτο
-        return None
+        return wait_for_new_file(download_folder, existing_files, suffix=".pdf", timeout=timeout)
+
+def read_accounts(accounts_file):
+    """Ένας λογαριασμός ανά γραμμή· κενές γραμμές και σχόλια (#) αγνοούνται."""
+    with open(accounts_file, "r", encoding="utf-8") as f:
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+def run_accounts(accounts, workers=2, headless_mode=False, quiet_mode=False, base_url=DEFAULT_BASE_URL, download_root=None, use_http=False,
+                 force=False, issue_days=bill_freshness.ISSUE_DAYS):
+    """
+    Κατεβάζει πολλούς λογαριασμούς με ένα σταθερό πλήθος (workers) ανοιχτών browser.
+
+    Κάθε browser ξεκινά μία φορά και κατεβάζει σε δικό του φάκελο (dei/.session-N), οπότε
+    ταυτόχρονες λήψεις δεν μπερδεύονται· ανάμεσα στους λογαριασμούς γίνεται μόνο reset_session().
+    Με use_http κάθε worker κρατά μία HTTP σύνδεση και ο browser ξεκινά μόνο αν χρειαστεί.
+    Το PDF κάθε λογαριασμού μετακινείται στο dei/<λογαριασμός>/· χωρίς force, λογαριασμοί
+    που δεν μπορεί να έχουν νέο PDF ακόμη (download()) δεν κρατούν κανέναν browser.
+    Επιστρέφει {λογαριασμός: διαδρομή PDF ή None}.
+    """
+    download_root = download_root or os.path.join(os.getcwd(), "dei")
+    pending = queue.Queue()
+    for account in accounts:
+        pending.put(account)
+    results = {}
+
+    def worker(session_number):
+        runner = TestAutodei(headless_mode=headless_mode, quiet_mode=quiet_mode, base_url=base_url,
+                             download_dir=os.path.join(download_root, f".session-{session_number}"))
+        try:
+            while True:
+                try:
+                    account = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    with timings.record(account) as record:
+                        results[account] = runner.download(account, target_dir=os.path.join(download_root, account), use_http=use_http,
+                                                           force=force, issue_days=issue_days)
+                    timings.emit(record)
+                except Exception as e:
+                    print(f"Σφάλμα στον λογαριασμό {account}: {e}", file=sys.stderr)
+                    results[account] = None
+                    # Ο browser μπορεί να έχει κλείσει· τότε ξεκινά ξανά με τον επόμενο λογαριασμό.
+                    if runner.driver is not None:
+                        try:
+                            runner.driver.current_url
+                        except Exception:
+                            runner.teardown_method(None)
+        finally:
+            runner.teardown_method(None)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(min(workers, len(accounts)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
 
 # Για να εκτελέσετε το script εκτός του pytest framework:
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Αυτοματοποίηση λήψης λογαριασμού από το myΔΕΗ.")
-    parser.add_argument("-a", "--account", required=True, help="Ο αριθμός λογαριασμού συμβολαίου (π.χ., 300004254333).")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-a", "--account", help="Ο αριθμός λογαριασμού συμβολαίου (π.χ., 300004254333).")
+    group.add_argument("--accounts-file", help="Αρχείο με έναν αριθμό λογαριασμού ανά γραμμή (μαζική λήψη).")
+    parser.add_argument("-w", "--workers", type=int, default=2, help="Πλήθος browser που τρέχουν παράλληλα με --accounts-file (προεπιλογή: %(default)s).")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="Διεύθυνση του myΔΕΗ (π.χ. τοπικό mock-mydei.py για δοκιμές).")
+    parser.add_argument("--http", action="store_true", help="Λήψη χωρίς browser (HTTP), με τον Firefox μόνο ως εφεδρεία αν αλλάξει η ροή των σελίδων.")
+    parser.add_argument("--force", action="store_true", help="Λήψη χωρίς τον έλεγχο των PDF που υπάρχουν ήδη (προεπιλογή: καμία λήψη πριν την επόμενη καταμέτρηση του τελευταίου λογαριασμού).")
+    parser.add_argument("--issue-days", type=int, default=bill_freshness.ISSUE_DAYS, help="Ημέρες από την καταμέτρηση μέχρι να εκδοθεί ο νέος λογαριασμός (προεπιλογή: %(default)s).")
     parser.add_argument("--headless", action="store_true", help="Εκτέλεση του browser σε headless mode (χωρίς γραφικό περιβάλλον).")
     parser.add_argument("-q", "--quiet", action="store_true", help="Καταστολή μηνυμάτων στην κονσόλα.")
+    parser.add_argument("--timings", action="store_true", help="Χρόνος ανά βήμα (εκκίνηση browser, φόρτωση σελίδας, banner, φόρμα, λήψη) σε JSON στο stderr, μία γραμμή ανά λογαριασμό (ή μεταβλητή AUTO_UTILITY_TIMINGS).")
+    parser.add_argument("--timings-mode", choices=timings.MODES, help="Τι μετράει το --timings: wall (προεπιλογή) ή memory, που προσθέτει τη μέγιστη μνήμη Python κάθε σταδίου και είναι πιο αργό· ενεργοποιεί και το --timings.")
+    parser.add_argument("--profile", metavar="FILE", help="Αποθήκευση προφίλ cProfile μιας εκτέλεσης με -a στο FILE (ή μεταβλητή AUTO_UTILITY_PROFILE).")
     args = parser.parse_args()
+    if args.timings or args.timings_mode:
+        timings.enable_timings(args.timings_mode or "wall")
+    if args.profile:
+        timings.enable_profile(args.profile)
+
+    if args.accounts_file:
+        accounts = read_accounts(args.accounts_file)
+        results = run_accounts(accounts, workers=args.workers, headless_mode=args.headless,
+                               quiet_mode=args.quiet, base_url=args.base_url, use_http=args.http,
+                               force=args.force, issue_days=args.issue_days)
+        for account in accounts:
+            print(f"{account}\t{results.get(account) or 'ΑΠΟΤΥΧΙΑ'}")
+        sys.exit(0 if all(results.get(account) for account in accounts) else 1)
 
-    test_runner = TestAutodei(headless_mode=args.headless, quiet_mode=args.quiet)
+    test_runner = TestAutodei(headless_mode=args.headless, quiet_mode=args.quiet, base_url=args.base_url)
     try:
-        test_runner.setup_method(None) # 'None' because we don't use 'method' argument in setup_method
-        test_runner.test_autodei(args.account) # Πέρασμα του αριθμού λογαριασμού
+        with timings.profiled(), timings.record(args.account) as record:
+            test_runner.download(args.account, use_http=args.http, force=args.force, issue_days=args.issue_days) # Πέρασμα του αριθμού λογαριασμού
+        timings.emit(record)
     finally:
         test_runner.teardown_method(None) # 'None' because we don't use 'method' argument in teardown_method
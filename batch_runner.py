@@ -0,0 +1,122 @@
+"""
+Batch helpers shared by the PDF readers.
+
+Expands files, directories and glob patterns into a list of inputs and runs
+a per-file worker over them on a process pool, yielding one result per file
+as soon as it finishes.
+"""
+import glob
+import json
+import os
+import sys
+from functools import partial
+import timings
+
+GLOB_CHARS = "*?["
+
+
+def expand_inputs(inputs, suffix=".pdf"):
+    """
+    Turns the command line inputs into a flat, de-duplicated list of files.
+
+    Directories are walked recursively for files ending in `suffix`, glob
+    patterns are expanded and plain paths are kept as they are (so that a
+    missing file is reported as a per-file error instead of vanishing).
+    """
+    paths = []
+    seen = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            found = []
+            for root, _dirs, files in os.walk(item):
+                found.extend(os.path.join(root, name) for name in files
+                             if name.lower().endswith(suffix))
+            found.sort()
+        elif any(ch in item for ch in GLOB_CHARS):
+            found = sorted(glob.glob(item, recursive=True))
+        else:
+            found = [item]
+        for path in found:
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def is_batch_request(inputs):
+    """True when the inputs ask for more than a single plain file."""
+    if len(inputs) > 1:
+        return True
+    return any(os.path.isdir(item) or any(ch in item for ch in GLOB_CHARS) for item in inputs)
+
+
+def run_batch(worker, paths, jobs=None, timed=None):
+    """
+    Runs `worker(path)` for every path and yields (path, result, error, timings).
+
+    Results are yielded in completion order. A failing file yields its error
+    message and never stops the run. At most a few tasks per worker are kept
+    in flight so that very large archives do not queue everything up front.
+    With jobs == 1 the work runs serially in this process.
+
+    `timings` is the file's per-stage record (see timings.py) when `timed` is
+    true, or by default when AUTO_UTILITY_TIMINGS is set; otherwise None.
+    """
+    if timed is None:
+        timed = timings.timings_mode() is not None
+    if timed:
+        worker = partial(timings.timed_call, worker, mode=timings.timings_mode() or "wall")
+
+    def outcome(path, get_result):
+        try:
+            result = get_result()
+        except Exception as e:
+            return path, None, f"{type(e).__name__}: {e}", None
+        if timed:
+            data, record = result
+            return path, data, None, record
+        return path, result, None, None
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(paths) == 1:
+        for path in paths:
+            yield outcome(path, partial(worker, path))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait # single files never start a pool
+    max_in_flight = jobs * 4
+    pending_paths = iter(paths)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        in_flight = {}
+        for path in pending_paths:
+            in_flight[pool.submit(worker, path)] = path
+            if len(in_flight) >= max_in_flight:
+                break
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                yield outcome(path, future.result)
+                next_path = next(pending_paths, None)
+                if next_path is not None:
+                    in_flight[pool.submit(worker, next_path)] = next_path
+
+
+def print_batch_results(results, out=sys.stdout):
+    """
+    Writes one JSON line per file (plus a {"file", "timings"} line when the
+    file was timed) and returns the number of failed files.
+    """
+    failures = 0
+    for path, data, error, stage_timings in results:
+        if error is None:
+            record = {"file": path, "data": data}
+        else:
+            failures += 1
+            record = {"file": path, "error": error}
+            print(f"Error processing {path}: {error}", file=sys.stderr)
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if stage_timings is not None:
+            out.write(json.dumps({"file": path, "timings": stage_timings}, ensure_ascii=False) + "\n")
+        out.flush()
+    return failures
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmarks for the readers, on synthetic documents.
+
+Generates DEI, Zenith and EYATH bill PDFs and EYATH/DEI notification emails
+(synthetic_pdf.py, synthetic_mail.py) from a fixed seed, then times every
+stage on its own:
+
+    startup    python3 <reader>.py --help in a fresh interpreter (imports)
+    route      PDFs only: extraction with the provider identified first
+               (pdf_router.py), reported with its overhead over "extract"
+    extract    PDF text extraction / MIME parsing and base64 decoding
+    parse      the field regexes on the extracted text
+    serialize  json.dumps of the parsed fields, as the readers print them
+
+Each stage is measured for single-document latency (median and p95 over
+--repeat runs on one document) and for batch throughput (every document of
+the corpus, documents per second). Results are written as JSON; with
+--baseline the run is compared against a stored result file and the exit
+status is 1 when any metric is more than --tolerance worse.
+
+    python3 benchmark.py -n 1000 -o results.json --baseline benchmark-baseline.json
+
+PDF text comes from the active backend (text_backends.py, --pdf-backend).
+With --parity the stages are not timed; instead every PDF of the corpus is
+parsed with every installed backend, and the exit status is 1 when any
+backend's JSON differs from pypdf's.
+
+With --imports nothing is timed either: every entry point is started with
+`python3 -X importtime <script> --help` and the time spent importing its
+modules (interpreter startup excluded) is checked against IMPORT_BUDGET_MS;
+the exit status is 1 when a script is over its budget. --importtime-dir
+writes the raw -X importtime report of every script, as committed in
+importtime/.
+
+    python3 benchmark.py --imports --importtime-dir importtime
+"""
+import argparse
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from email import message_from_bytes
+
+from bill_service import SCRIPT_DIR, load_reader
+from page_extract import extract_pages
+import pdf_router
+import synthetic_mail
+import text_backends
+from synthetic_pdf import dei_bill_pages, eyath_bill_pages, make_pdf, zenith_bill_pages
+
+PROVIDERS = ("dei", "zenith", "eyath", "eyath_email", "dei_email")
+STAGES = ("startup", "route", "extract", "parse", "serialize")
+PDF_PROVIDERS = ("dei", "zenith", "eyath")
+SCRIPTS = {"dei": "electricity-reader.py", "zenith": "electricity-reader.py", "eyath": "eyath-reader.py",
+           "eyath_email": "body-reader.py", "dei_email": "body-reader.py"}
+# Milliseconds a script may spend importing modules before its --help is
+# printed (1 CPU, 3.11). Heavy modules (pypdf, pypdfium2, selenium, sqlite3,
+# mailbox, the pool of concurrent.futures) are imported on the code path
+# that needs them, not at startup.
+IMPORT_BUDGET_MS = {
+    "eyath-reader.py": 40,
+    "electricity-reader.py": 40,
+    "dei-reader.py": 20,
+    "body-reader.py": 40,
+    "bill-reader.py": 40,
+    "auto-dei.py": 40,
+    "bill-client.py": 25,
+    "bill-daemon.py": 25,
+    "bill-watch.py": 60,
+    "bill_analytics.py": 150, # numpy is the whole point of the script
+}
+RESULTS_VERSION = 1
+COMPARED_METRICS = ("single_ms", "batch_docs_per_s") # the rest are kept for reading, not for pass/fail
+
+
+def _date(rng, year=2025):
+    return f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{year}"
+
+
+def _amount(rng):
+    return f"{rng.randint(5, 400)},{rng.randint(0, 99):02d}"
+
+
+def _account(rng):
+    return str(rng.randint(300000000000, 399999999999))
+
+
+def make_document(provider, rng, extra_pages=1):
+    """One synthetic document (PDF or raw email bytes) with random field values."""
+    if provider == "dei":
+        return make_pdf(dei_bill_pages(_account(rng), _amount(rng), _date(rng), _date(rng), extra_pages))
+    if provider == "zenith":
+        return make_pdf(zenith_bill_pages(_account(rng), _amount(rng), *(_date(rng) for _ in range(5)), extra_pages=extra_pages))
+    consumer = "-".join(f"{rng.randint(0, 10 ** width - 1):0{width}d}" for width in (2, 2, 3, 2, 2))
+    rf_code = "RF" + "".join(rng.choice("0123456789") for _ in range(23))
+    if provider == "eyath":
+        return make_pdf(eyath_bill_pages(consumer, _amount(rng), *(_date(rng) for _ in range(5)), rf_code, extra_pages))
+    message_id = f"<{rng.getrandbits(64):016x}@benchmark.invalid>"
+    if provider == "eyath_email":
+        msg = synthetic_mail.eyath_email(consumer, f"ΑΚΝ{rng.randint(10000000, 99999999)}", rf_code, _amount(rng), _date(rng), message_id=message_id)
+    elif provider == "dei_email":
+        msg = synthetic_mail.dei_email(_account(rng), _amount(rng), _date(rng), message_id=message_id)
+    else:
+        raise ValueError(f"Unknown provider: {provider!r}")
+    return bytes(msg)
+
+
+def make_corpus(provider, count, seed=0, extra_pages=1):
+    rng = random.Random(f"{seed}:{provider}")
+    return [make_document(provider, rng, extra_pages) for _ in range(count)]
+
+
+def stage_functions(provider):
+    """(extract, parse) callables of one provider, the same calls the readers make."""
+    if provider in ("dei", "zenith"):
+        electricity = load_reader("electricity-reader")
+        parse = electricity.parse_dei_data if provider == "dei" else electricity.parse_zenith_data
+        return (lambda doc: electricity.read_pdf_text(io.BytesIO(doc))), parse
+    if provider == "eyath":
+        eyath = load_reader("eyath-reader")
+        return (lambda doc: eyath.read_pdf_text(io.BytesIO(doc))), eyath.parse_raw_text
+    body = load_reader("body-reader")
+    return (lambda doc: body.extract_plain_text(message_from_bytes(doc))), body.parse_email_content
+
+
+def route(doc):
+    """Routed extraction, as bill-reader.py does it; returns the provider."""
+    reader, document = pdf_router.open_pdf(doc)
+    found = pdf_router.identify(reader, document)
+    extract_pages(document, first_page_text=found.first_page_text)
+    document.close()
+    return found.provider
+
+
+def serialize(data):
+    return json.dumps(data, indent=4, ensure_ascii=False)
+
+
+def _latency(function, argument, repeat):
+    function(argument) # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {"single_ms": statistics.median(timings) * 1000,
+            "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000}
+
+
+def _throughput(function, arguments):
+    gc.collect()
+    start = time.perf_counter()
+    outputs = [function(argument) for argument in arguments]
+    elapsed = time.perf_counter() - start
+    return outputs, {"batch_s": elapsed, "batch_docs_per_s": len(arguments) / elapsed if elapsed else None}
+
+
+def measure_startup(script, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, script), "--help"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return {"single_ms": statistics.median(timings) * 1000, "min_ms": min(timings) * 1000}
+
+
+def _importtime(args):
+    """(top-level module, cumulative µs) of every import -X importtime reports for `python3 args`, plus the raw report."""
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, check=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit() and not fields[2].startswith("  "): # nested imports are indented
+            imports.append((fields[2].strip(), int(fields[1])))
+    return imports, result.stderr
+
+
+def measure_imports(script, repeat):
+    """
+    {"imports_ms", "budget_ms", "slowest"} of a script's --help, the best of
+    `repeat` runs, and that run's -X importtime report. Modules the bare
+    interpreter imports (site, encodings, ...) are not counted.
+    """
+    startup = {name for name, _ in _importtime(["-c", "pass"])[0]}
+    best = None
+    for _ in range(repeat):
+        imports, report = _importtime([os.path.join(SCRIPT_DIR, script), "--help"])
+        own = [(name, micros) for name, micros in imports if name not in startup]
+        total = sum(micros for _name, micros in own)
+        if best is None or total < best[0]:
+            best = (total, own, report)
+    total, own, report = best
+    slowest = sorted(own, key=lambda item: item[1], reverse=True)[:5]
+    return {"imports_ms": round(total / 1000, 1), "budget_ms": IMPORT_BUDGET_MS.get(script),
+            "slowest": {name: round(micros / 1000, 1) for name, micros in slowest}}, report
+
+
+def run_provider(provider, docs, stages, repeat, startup_repeat, log):
+    results = {}
+    if "startup" in stages:
+        results["startup"] = measure_startup(SCRIPTS[provider], startup_repeat)
+        log(f"{provider}: startup done")
+    if "route" in stages and provider in PDF_PROVIDERS:
+        results["route"] = _latency(route, docs[0], repeat)
+        routed, batch = _throughput(route, docs)
+        results["route"].update(batch)
+        if routed.count(provider) != len(docs):
+            raise RuntimeError(f"{provider}: {len(docs) - routed.count(provider)} documents routed to another provider")
+        log(f"{provider}: route done")
+    extract, parse = stage_functions(provider)
+    # Each stage runs on the previous stage's output, so parse and serialize
+    # see exactly what the readers would give them.
+    inputs = docs
+    for stage, function in (("extract", extract), ("parse", parse), ("serialize", serialize)):
+        if stage in stages:
+            results[stage] = _latency(function, inputs[0], repeat)
+            inputs, batch = _throughput(function, inputs)
+            results[stage].update(batch)
+            log(f"{provider}: {stage} done")
+        elif stage != "serialize":
+            inputs = [function(item) for item in inputs]
+    if "route" in results and "extract" in results:
+        results["route"]["overhead"] = results["route"]["single_ms"] / results["extract"]["single_ms"] - 1
+    return results
+
+
+def check_parity(provider, docs, log):
+    """
+    {backend: {"mismatches", "batch_docs_per_s"}} for parsing every document
+    with every installed backend, compared with pypdf's JSON.
+    """
+    _extract, parse = stage_functions(provider)
+    results = {}
+    expected = None
+    for backend in text_backends.available_backends():
+        outputs, batch = _throughput(lambda doc: serialize(parse(text_backends.read_text(doc, backend))), docs)
+        if expected is None:
+            expected = outputs
+        mismatches = [index for index, (output, reference) in enumerate(zip(outputs, expected)) if output != reference]
+        results[backend] = {"mismatches": len(mismatches), "batch_docs_per_s": batch["batch_docs_per_s"]}
+        if mismatches:
+            results[backend]["first_mismatch"] = {"doc": mismatches[0], "pypdf": expected[mismatches[0]], backend: outputs[mismatches[0]]}
+        log(f"{provider}: {backend} parity done")
+    return results
+
+
+def compare(results, baseline):
+    """
+    Lists (provider, stage, metric, baseline, current, change) for the
+    COMPARED_METRICS present in both runs. A positive change is a slowdown:
+    times are worse when higher, documents per second when lower.
+    """
+    rows = []
+    for provider, stages in results["results"].items():
+        for stage, metrics in stages.items():
+            old_metrics = baseline.get("results", {}).get(provider, {}).get(stage, {})
+            for metric in COMPARED_METRICS:
+                value, old = metrics.get(metric), old_metrics.get(metric)
+                if not old or value is None:
+                    continue
+                change = old / value - 1 if metric.endswith("_per_s") else value / old - 1
+                rows.append((provider, stage, metric, old, value, change))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the readers on synthetic bills and emails.")
+    parser.add_argument("-n", "--docs", type=int, default=1000, help="Documents per provider for the batch measurements (default: %(default)s).")
+    parser.add_argument("--repeat", type=int, default=50, help="Runs per single-document latency measurement (default: %(default)s).")
+    parser.add_argument("--startup-repeat", type=int, default=5, help="Interpreter starts per reader script (default: %(default)s).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic documents (default: %(default)s).")
+    parser.add_argument("--pages", type=int, default=2, help="Pages per synthetic PDF (default: %(default)s).")
+    parser.add_argument("--providers", nargs="+", choices=PROVIDERS, default=list(PROVIDERS))
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("-o", "--output", help="Write the results as JSON to this file (default: stdout).")
+    parser.add_argument("--baseline", help="Compare against a results file from an earlier run.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline, as a fraction (default: %(default)s).")
+    parser.add_argument("--pdf-backend", choices=text_backends.CHOICES, help="PDF text backend for the timed stages (default: as the readers pick it).")
+    parser.add_argument("--parity", action="store_true", help="Check that every installed PDF text backend gives the same JSON instead of timing the stages.")
+    parser.add_argument("--imports", action="store_true", help="Check every entry point's import time against IMPORT_BUDGET_MS instead of timing the stages.")
+    parser.add_argument("--importtime-dir", metavar="DIR", help="With --imports, write each script's -X importtime report to DIR/<script>.txt.")
+    parser.add_argument("-q", "--quiet", action="store_true", help="No progress messages on stderr.")
+    args = parser.parse_args()
+    if args.docs < 1 or args.pages < 1:
+        parser.error("--docs and --pages must be at least 1")
+    if args.pdf_backend:
+        try:
+            text_backends.select_backend(args.pdf_backend)
+        except ValueError as e:
+            parser.error(str(e))
+
+    def log(message):
+        if not args.quiet:
+            print(message, file=sys.stderr)
+
+    results = {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "docs": args.docs,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "pages": args.pages,
+        },
+        "results": {},
+    }
+    try:
+        from importlib.metadata import version
+        results["meta"]["pypdf"] = version("pypdf")
+    except Exception:
+        pass
+    results["meta"]["pdfBackend"] = text_backends.active_backend()
+
+    if args.imports:
+        imports = results["imports"] = {}
+        for script in IMPORT_BUDGET_MS:
+            imports[script], report = measure_imports(script, args.startup_repeat)
+            if args.importtime_dir:
+                os.makedirs(args.importtime_dir, exist_ok=True)
+                with open(os.path.join(args.importtime_dir, os.path.splitext(script)[0] + ".txt"), "w", encoding="utf-8") as f:
+                    f.write(report)
+            log(f"{script}: {imports[script]['imports_ms']} ms of imports")
+        print(json.dumps(results, indent=4, ensure_ascii=False))
+        over = [script for script, measured in imports.items() if measured["imports_ms"] > measured["budget_ms"]]
+        if over:
+            print(f"Over the import time budget: {', '.join(over)}.", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    if args.parity:
+        parity = results["parity"] = {}
+        for provider in (provider for provider in args.providers if provider in PDF_PROVIDERS):
+            log(f"{provider}: generating {args.docs} documents")
+            parity[provider] = check_parity(provider, make_corpus(provider, args.docs, args.seed, args.pages - 1), log)
+        print(json.dumps(results, indent=4))
+        mismatches = sum(checked["mismatches"] for backends in parity.values() for checked in backends.values())
+        if mismatches:
+            print(f"{mismatches} document(s) parsed differently from pypdf.", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    for provider in args.providers:
+        log(f"{provider}: generating {args.docs} documents")
+        docs = make_corpus(provider, args.docs, args.seed, args.pages - 1)
+        results["results"][provider] = run_provider(provider, docs, args.stages, args.repeat, args.startup_repeat, log)
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ("docs", "pages", "seed"):
+            if baseline.get("meta", {}).get(key) != results["meta"][key]:
+                print(f"Warning: baseline was run with {key}={baseline.get('meta', {}).get(key)}, this run with {results['meta'][key]}.", file=sys.stderr)
+        regressions = 0
+        for provider, stage, metric, old, value, change in compare(results, baseline):
+            flag = "REGRESSION" if change > args.tolerance else ""
+            regressions += bool(flag)
+            print(f"{provider:12} {stage:10} {metric:17} {old:12.3f} {value:12.3f} {change:+8.1%} {flag}", file=sys.stderr)
+        if regressions:
+            print(f"{regressions} metric(s) more than {args.tolerance:.0%} worse than the baseline.", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Thin client for bill-daemon.py, a drop-in for the one-shot readers in mail
+hooks. Prints the same JSON as eyath-reader.py, electricity-reader.py and
+body-reader.py. When no daemon is listening the request is handled in this
+process instead (slower, but the hook keeps working).
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+
+import bill_service
+
+PDF_SIGNATURE = b"%PDF-"
+
+
+def send_request(socket_path, header, content=None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile("rwb") as stream:
+            bill_service.write_request(stream, header, content)
+            reply = stream.readline()
+    if not reply:
+        raise ConnectionError("Daemon closed the connection without a reply")
+    return json.loads(reply)
+
+
+def request_kind(args, content=None):
+    """
+    "email" or "pdf". --auto without --email or --pdf looks at the input:
+    a file or stdin starting with the PDF signature is a PDF, anything else
+    an email.
+    """
+    if args.email:
+        return "email"
+    if args.pdf or not args.auto:
+        return "pdf"
+    if content is None:
+        try:
+            with open(args.file, "rb") as f:
+                content = f.read(len(PDF_SIGNATURE))
+        except OSError:
+            return "pdf" # the daemon reports the error
+    return "pdf" if content.startswith(PDF_SIGNATURE) else "email"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse a bill PDF or notification email through bill-daemon.py.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--eyath", action="store_true", help="EYATH PDF (or EYATH email with --email).")
+    group.add_argument("--dei", action="store_true", help="DEI PDF (or DEI email with --email).")
+    group.add_argument("--zenith", action="store_true", help="Zenith PDF.")
+    group.add_argument("--auto", action="store_true", help="Auto-detected provider: PDFs are routed by pdf_router.py, emails by their content.")
+    kind = parser.add_mutually_exclusive_group()
+    kind.add_argument("--email", action="store_true", help="Input is an .eml message instead of a PDF.")
+    kind.add_argument("--pdf", action="store_true", help="Input is a PDF (the default, except with --auto, which tells them apart by content).")
+    parser.add_argument("-s", "--socket", default=bill_service.default_socket_path(), help="Path of the daemon socket (default: %(default)s).")
+    parser.add_argument("--timings", action="store_true", help="Print the per-stage timings of the request as JSON on stderr.")
+    parser.add_argument("--timings-mode", choices=("wall", "memory"), help="What --timings measures: wall (the default) or memory, which adds the peak Python memory of every stage; implies --timings.")
+    parser.add_argument("file", nargs="?", default="-", help="Input file, or '-' to send stdin to the daemon.")
+    args = parser.parse_args()
+
+    provider = "eyath" if args.eyath else "dei" if args.dei else "zenith" if args.zenith else None
+    content = None
+    if args.file == "-":
+        content = sys.stdin.buffer.read()
+    header = {"kind": request_kind(args, content), "provider": provider}
+    if args.timings or args.timings_mode:
+        header["timings"] = args.timings_mode or "wall"
+    if content is None:
+        # The daemon reads the file itself; it may run with a different cwd.
+        header["path"] = os.path.abspath(args.file)
+
+    try:
+        result = send_request(args.socket, header, content)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"No daemon on {args.socket}, parsing in-process.", file=sys.stderr)
+        result = bill_service.handle_request(header, content)
+
+    stage_timings = result.pop("timings", None)
+    print(json.dumps(result, ensure_ascii=False, indent=4))
+    if stage_timings is not None:
+        print(json.dumps({"timings": stage_timings}, ensure_ascii=False), file=sys.stderr)
+    sys.exit(1 if "error" in result else 0)
+
+
+if __name__ == "__main__":
+    main()
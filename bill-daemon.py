@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Long-running parse server: imports the readers (pypdf, email) once and
+answers parse requests over a local Unix socket. See bill_service.py for
+the request format and bill-client.py for the matching client.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+
+import bill_service
+from extraction_cache import enable_cache
+
+
+class BillRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # A connection may carry several requests, one after the other.
+        while True:
+            try:
+                request = bill_service.read_request(self.rfile)
+            except Exception as e:
+                self._reply({"error": f"Bad request: {e}"})
+                return
+            if request is None:
+                return
+            header, content = request
+            self._reply(bill_service.handle_request(header, content))
+
+    def _reply(self, data):
+        self.wfile.write(json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class BillServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def socket_in_use(path):
+    """True when something accepts connections on the Unix socket `path`."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve bill parse requests over a Unix socket.")
+    parser.add_argument("-s", "--socket", default=bill_service.default_socket_path(), help="Path of the Unix socket (default: %(default)s).")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not print startup messages.")
+    parser.add_argument("--cache", metavar="DIR", help="Extraction cache directory (or set AUTO_UTILITY_CACHE).")
+    args = parser.parse_args()
+
+    if socket_in_use(args.socket):
+        parser.error(f"a daemon is already listening on {args.socket}")
+    if args.cache:
+        enable_cache(args.cache)
+    bill_service.warm_up()
+
+    if os.path.exists(args.socket):
+        os.remove(args.socket) # Stale socket from a previous run: nothing answered on it
+    old_umask = os.umask(0o177) # Socket readable/writable by the owner only
+    try:
+        server = BillServer(args.socket, BillRequestHandler)
+    finally:
+        os.umask(old_umask)
+
+    # Stop cleanly (and remove the socket) on `kill` as well as on Ctrl-C.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if not args.quiet:
+        print(f"Listening on {args.socket}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
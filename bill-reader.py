@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Reads DEI, Zenith and EYATH bill PDFs without being told the provider: each
+file is routed by pdf_router.py (metadata, fonts, then first page text) and
+parsed by the matching reader, with a single text extraction.
+"""
+import argparse
+import json
+import sys
+from functools import partial
+
+from batch_runner import expand_inputs, is_batch_request, run_batch, print_batch_results
+from extraction_cache import enable_cache
+from page_extract import DEFAULT_MAX_PAGES, DEFAULT_PARALLEL_MIN_PAGES
+from bill_ledger import open_ledger
+import pdf_router
+import text_backends
+import timings
+
+
+def inspect_file(pdf_path):
+    """The signals the router sees in one file, for filling in pdf_router.SIGNATURES."""
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    route = pdf_router.identify(reader)
+    return {"file": pdf_path, "metadata": pdf_router.document_metadata(reader),
+            "fonts": pdf_router.first_page_fonts(reader), "provider": route.provider, "routedBy": route.signal}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse bill PDFs of any supported provider (DEI, Zenith, EYATH).")
+    parser.add_argument("input_files", nargs="+", help="PDF files, directories or glob patterns. More than one input switches to batch mode (one JSON line per file).")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes in batch mode (default: CPU count).")
+    parser.add_argument("--cache", metavar="DIR", help="Extraction cache directory (or set AUTO_UTILITY_CACHE).")
+    parser.add_argument("--early-exit", action="store_true", help="Extract page by page and stop once every field is found.")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES, help="Pages checked one by one with --early-exit before falling back to the full document (default: %(default)s).")
+    parser.add_argument("--timings", action="store_true", help="Report wall time per stage, routing included, as JSON on stderr, or as extra lines in batch mode (or set AUTO_UTILITY_TIMINGS).")
+    parser.add_argument("--timings-mode", choices=timings.MODES, help="What --timings measures: wall (the default) or memory, which adds the peak Python memory of every stage and is slower; implies --timings.")
+    parser.add_argument("--profile", metavar="FILE", help="Write a cProfile dump of a single run to FILE (or set AUTO_UTILITY_PROFILE).")
+    parser.add_argument("--ledger", metavar="FILE", help="Bill ledger: skip PDFs already parsed and record new results (or set AUTO_UTILITY_LEDGER).")
+    parser.add_argument("--layout", action="store_true", help="Experimental: read every field from its region of the first page (region_extract.py) instead of the whole text. The regions fit only the synthetic bills, so other bills are read twice (regions, then text); single files only.")
+    parser.add_argument("--inspect", action="store_true", help="Print the metadata, first page fonts and route of every file instead of parsing it.")
+    parser.add_argument("--pdf-backend", choices=text_backends.CHOICES, help="PDF text backend (text_backends.py; default: the faster of pypdf and pypdfium2, pdftotext only when named; or set AUTO_UTILITY_PDF_BACKEND).")
+    parser.add_argument("--page-jobs", type=int, default=None, help="Extract the pages of a single long PDF in this many processes (batch mode already runs one file per process).")
+    parser.add_argument("--parallel-min-pages", type=int, default=DEFAULT_PARALLEL_MIN_PAGES, help="Pages a PDF needs for --page-jobs to be used (default: %(default)s).")
+    args = parser.parse_args()
+    if args.layout and is_batch_request(args.input_files):
+        parser.error("--layout is experimental and reads single files only")
+
+    if args.pdf_backend:
+        try:
+            text_backends.select_backend(args.pdf_backend)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.cache:
+        enable_cache(args.cache)
+    if args.timings or args.timings_mode:
+        timings.enable_timings(args.timings_mode or "wall")
+    if args.profile:
+        timings.enable_profile(args.profile)
+    process_file = partial(pdf_router.process_auto_file, early_exit=args.early_exit, max_pages=args.max_pages, layout=args.layout)
+
+    if args.inspect:
+        for pdf_path in expand_inputs(args.input_files):
+            print(json.dumps(inspect_file(pdf_path), ensure_ascii=False))
+        sys.exit(0)
+
+    ledger = open_ledger(args.ledger)
+    parser_key = pdf_router.ledger_parser_key(args.layout) if ledger else None
+
+    if is_batch_request(args.input_files):
+        pdf_paths = expand_inputs(args.input_files)
+        if ledger:
+            pdf_paths, hashes, skipped = ledger.skip_known(pdf_paths, parser_key)
+            print(f"Skipping {skipped} PDF files already in the ledger", file=sys.stderr)
+        print(f"Processing {len(pdf_paths)} PDF files in batch mode", file=sys.stderr)
+        results = run_batch(process_file, pdf_paths, args.jobs)
+        if ledger:
+            results = ledger.record_results(results, hashes, None, parser_key)
+        failures = print_batch_results(results)
+        sys.exit(1 if failures else 0)
+
+    pdf_file_path = args.input_files[0]
+    if args.page_jobs:
+        process_file = partial(process_file, page_jobs=args.page_jobs, parallel_min_pages=args.parallel_min_pages)
+    try:
+        with timings.profiled(), timings.record(pdf_file_path) as record:
+            if ledger:
+                with timings.stage("ledger"):
+                    data = ledger.parse_once(pdf_file_path, None, parser_key, process_file)
+            else:
+                data = process_file(pdf_file_path)
+            with timings.stage("serialize"):
+                output = json.dumps(data, indent=4, ensure_ascii=False)
+    except Exception as e:
+        print(f"An error occurred while processing file {pdf_file_path}: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(output)
+    timings.emit(record)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Watch-folder daemon: parses bills as soon as they land in the watched
+directories, instead of a cron job re-reading whole folders.
+
+Each directory is watched with its subdirectories (fs_watch.TreeWatcher,
+inotify on Linux). A file is taken once it was closed after writing or moved
+in, has been quiet for --settle seconds, is not empty and has no ".part"
+companion (Firefox downloads), so half-written files are never parsed.
+
+Ready files go through a bounded queue to a pool of worker processes that
+have the readers imported already (bill_service.py does the parsing, as for
+bill-daemon.py). When the workers fall behind the queue fills up and the
+watcher stops taking events; the kernel keeps them, and if its event queue
+overflows the directories are re-scanned, so nothing is lost.
+
+Every result is appended as one JSON line to the output (stdout by default):
+{"file", "data"} or {"file", "error"}, with "latency_ms" from the file's
+first event to its parsed result.
+"""
+import argparse
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import bill_service
+from extraction_cache import enable_cache
+from fs_watch import IN_CLOSE_WRITE, IN_MOVED_TO, IN_Q_OVERFLOW, TreeWatcher, walk_files
+
+# What a directory holds: "auto" routes PDFs with pdf_router.py and parses
+# .eml files with body-reader; the others fix the PDF provider.
+KINDS = ("auto", "email", "eyath", "dei", "zenith")
+DEFAULT_SETTLE = 0.2
+DEFAULT_QUEUE_SIZE = 64
+IDLE_WAIT = 1.0
+
+
+def parse_watch_arg(value):
+    """"DIR" or "DIR:KIND" -> (absolute directory, kind)."""
+    directory, _, kind = value.rpartition(":")
+    if not directory or kind not in KINDS:
+        directory, kind = value, "auto"
+    if not os.path.isdir(directory):
+        raise argparse.ArgumentTypeError(f"not a directory: {directory}")
+    return os.path.abspath(directory), kind
+
+
+def request_for(path, kind):
+    """bill_service request header for one file, or None if the directory does not take this kind of file."""
+    name = os.path.basename(path)
+    if name.startswith("."):
+        return None
+    if name.endswith(".eml") and kind in ("auto", "email"):
+        return {"kind": "email", "provider": None, "path": path}
+    if name.lower().endswith(".pdf") and kind != "email":
+        return {"kind": "pdf", "provider": None if kind == "auto" else kind, "path": path}
+    return None
+
+
+def _file_state(path):
+    """(size, mtime_ns), or None when the file is gone."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class FolderWatcher:
+    """
+    Turns the events of the watched trees into ready files. pending holds
+    the files that got events: path -> [arrival time, settle deadline or
+    None, size at the last event]. done holds the state each file had when
+    it was queued, so a re-scan does not queue it again.
+    """
+
+    def __init__(self, watches, settle=DEFAULT_SETTLE, initial=False):
+        self.watches = sorted(watches, key=lambda item: len(item[0]), reverse=True) # deepest directory first
+        self.settle = settle
+        self.pending = {}
+        self.done = {}
+        self.watcher = TreeWatcher([directory for directory, _kind in watches])
+        existing = self._scan()
+        if initial:
+            self._mark_ready(existing)
+        else:
+            self.done.update(existing)
+
+    def _kind(self, path):
+        for directory, kind in self.watches:
+            if path.startswith(directory + os.sep):
+                return kind
+        return None
+
+    def _scan(self):
+        files = {}
+        for directory, _kind in self.watches:
+            files.update(walk_files(directory))
+        return {path: state for path, state in files.items() if request_for(path, self._kind(path))}
+
+    def _mark_ready(self, paths):
+        now = time.monotonic()
+        for path in paths:
+            entry = self.pending.setdefault(path, [time.time(), None, None])
+            entry[1] = now + self.settle
+            entry[2] = _file_state(path)
+
+    def _wait_timeout(self):
+        deadlines = [entry[1] for entry in self.pending.values() if entry[1] is not None]
+        if not deadlines:
+            return IDLE_WAIT
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def poll(self):
+        """Waits for events (at most until the next settle deadline) and returns the ready files as [(path, kind, arrival)]."""
+        for mask, path in self.watcher.wait(self._wait_timeout()):
+            if mask & IN_Q_OVERFLOW:
+                self._mark_ready(path for path, state in self._scan().items() if self.done.get(path) != state)
+                continue
+            if not request_for(path, self._kind(path)):
+                continue
+            entry = self.pending.setdefault(path, [time.time(), None, None])
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                # Every new close restarts the settle time (debounce).
+                entry[1] = time.monotonic() + self.settle
+                entry[2] = _file_state(path)
+
+        ready = []
+        now = time.monotonic()
+        for path, (arrival, deadline, state) in list(self.pending.items()):
+            if deadline is None or deadline > now:
+                continue
+            current = _file_state(path)
+            if current is None:
+                del self.pending[path] # deleted or renamed away before it settled
+            elif current != state or os.path.exists(path + ".part"):
+                self.pending[path][1:] = [now + self.settle, current] # still being written
+            else:
+                del self.pending[path]
+                if current[0] > 0 and self.done.get(path) != current:
+                    self.done[path] = current
+                    ready.append((path, self._kind(path), arrival))
+        return ready
+
+    def close(self):
+        self.watcher.close()
+
+
+def dispatch(jobs, pool, max_in_flight, out):
+    """
+    Takes ready files from the `jobs` queue until it gets None, parses them
+    on the pool with at most `max_in_flight` running, and appends the results
+    to `out`.
+    """
+    in_flight = {}
+    stopping = False
+    while not stopping or in_flight:
+        while not stopping and len(in_flight) < max_in_flight:
+            try:
+                job = jobs.get(timeout=None if not in_flight else 0.01)
+            except queue.Empty:
+                break
+            if job is None:
+                stopping = True
+                break
+            path, kind, arrival = job
+            in_flight[pool.submit(bill_service.handle_request, request_for(path, kind))] = (path, arrival)
+        if not in_flight:
+            continue
+        done, _ = wait(in_flight, timeout=0.05, return_when=FIRST_COMPLETED)
+        for future in done:
+            path, arrival = in_flight.pop(future)
+            try:
+                data = future.result()
+            except Exception as e: # a worker process died
+                data = {"error": f"{type(e).__name__}: {e}"}
+            record = {"file": path}
+            if "error" in data:
+                record["error"] = data["error"]
+            else:
+                record["data"] = data
+            record["latency_ms"] = round((time.time() - arrival) * 1000, 1)
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse bills as they land in watched directories (JSON Lines output).")
+    parser.add_argument("watch", nargs="+", type=parse_watch_arg, metavar="DIR[:KIND]",
+                        help=f"Directory to watch with its subdirectories. KIND is one of {', '.join(KINDS)} (default: auto).")
+    parser.add_argument("-o", "--output", help="Append JSON Lines to this file instead of stdout.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="Ready files waiting for a worker before the watcher stops taking events (default: %(default)s).")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE, help="Seconds a file must stay unchanged after its last write (default: %(default)s).")
+    parser.add_argument("--initial", action="store_true", help="Also parse the files already in the directories at startup.")
+    parser.add_argument("--cache", metavar="DIR", help="Extraction cache directory (or set AUTO_UTILITY_CACHE).")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not print startup messages.")
+    args = parser.parse_args()
+
+    if args.cache:
+        enable_cache(args.cache)
+    jobs_count = args.jobs or os.cpu_count() or 1
+    out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    jobs = queue.Queue(maxsize=args.queue_size)
+    pool = ProcessPoolExecutor(max_workers=jobs_count, initializer=bill_service.warm_up)
+    # Start every worker (and import the readers) now, not on the first bill.
+    for future in [pool.submit(os.getpid) for _ in range(jobs_count)]:
+        future.result()
+    dispatcher = threading.Thread(target=dispatch, args=(jobs, pool, jobs_count * 2, out), daemon=True)
+    dispatcher.start()
+
+    folders = FolderWatcher(args.watch, args.settle, args.initial)
+    # Stop cleanly (finishing the files already queued) on `kill` as well as on Ctrl-C.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if not args.quiet:
+        how = "inotify" if folders.watcher.uses_inotify else "polling"
+        print(f"Watching {', '.join(f'{d} ({k})' for d, k in args.watch)} with {how}, {jobs_count} workers", file=sys.stderr)
+    try:
+        while True:
+            for job in folders.poll():
+                jobs.put(job) # blocks while the queue is full (backpressure)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        folders.close()
+        jobs.put(None)
+        dispatcher.join()
+        pool.shutdown()
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
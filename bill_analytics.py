@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Bill history analytics on columnar NumPy arrays.
+
+The readers print amounts and dates the way each bill shows them ("1.234,56"
+strings from electricity-reader, floats from eyath-reader, "45.10" from
+body-reader, DD/MM/YYYY dates). BillColumns normalizes every parsed bill once,
+with the same rules as the ledger (bill_ledger.amount_cents/iso_date), into
+one array per field:
+
+    provider      int8 code into `providers`
+    account       int32 code into `accounts` (contract or consumer number)
+    amount        int64 cents
+    due           int32 days since 1970-01-01
+    period_start  int32 days, start of the consumption period (EYATH)
+    period_end    int32 days, end of the consumption period (EYATH)
+    next_reading  int32 days, next meter reading (DEI)
+    paid          bool (from the ledger; False for JSON Lines input)
+
+Missing dates are NO_DATE and missing amounts NO_AMOUNT. Every report below
+is computed with array operations over the whole history, sorting by
+(account, date) once and using group boundaries, cumulative sums and
+reduceat instead of per-bill Python loops:
+
+    monthly_spend      spend per contract and month of the due date
+    period_lengths     consumption period length in days: end - start, or
+                       the gap between a contract's successive next readings
+    anomalies          bills far from the mean of the contract's previous
+                       bills (rolling window)
+    upcoming_due       unpaid totals due in the next days, and overdue
+
+The columns are saved as an uncompressed .npz (np.save per array, no
+pickling), which loads in milliseconds:
+
+    python3 bill_analytics.py --ledger bills.sqlite3 --save history.npz
+    python3 bill_analytics.py history.npz --report anomalies upcoming
+    python3 bill_analytics.py batch.jsonl mail.jsonl --report monthly
+"""
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+from bill_ledger import amount_cents, default_ledger_path, iso_date
+
+FORMAT_VERSION = 1
+NO_DATE = np.iinfo(np.int32).min
+NO_AMOUNT = np.iinfo(np.int64).min
+DATE_COLUMNS = ("due", "period_start", "period_end", "next_reading")
+REPORTS = ("monthly", "periods", "anomalies", "upcoming")
+DEFAULT_WINDOW = 6
+DEFAULT_MIN_HISTORY = 3
+DEFAULT_THRESHOLD = 3.0
+DEFAULT_DAYS = 30
+
+
+def provider_of(data, default=None):
+    """Provider of one parsed bill: bill-reader's "provider", body-reader's "company", EYATH fields, else `default`."""
+    provider = data.get("provider") or data.get("company")
+    if provider:
+        return provider
+    if "consumerNumber" in data or "RFpayment" in data:
+        return "eyath"
+    return default or "unknown"
+
+
+def _epoch_days(iso_dates):
+    """ISO date strings (None for missing) -> int32 days since 1970-01-01, NO_DATE for missing."""
+    days = np.array(iso_dates, dtype="datetime64[D]")
+    missing = np.isnat(days)
+    days = days.astype(np.int64)
+    days[missing] = NO_DATE
+    return days.astype(np.int32)
+
+
+def _day_string(day):
+    return None if day == NO_DATE else str(np.datetime64(int(day), "D"))
+
+
+def _day_strings(days):
+    """Epoch days -> ["YYYY-MM-DD" or None]."""
+    names = np.datetime_as_string(days.astype(np.int64).astype("datetime64[D]")).tolist()
+    return [None if missing else name for name, missing in zip(names, (days == NO_DATE).tolist())]
+
+
+class BillColumns:
+    """One array per bill field (see the module docstring) plus the category names."""
+
+    def __init__(self, providers, accounts, columns):
+        self.providers = list(providers)
+        self.accounts = list(accounts)
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns["amount"])
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["columns"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    @classmethod
+    def from_records(cls, records):
+        """Columns of (provider, parsed data, paid) records, in any reader's output format."""
+        providers, accounts, amounts, paid = [], [], [], []
+        dates = {column: [] for column in DATE_COLUMNS}
+        iso = lru_cache(maxsize=None)(iso_date) # a history has few distinct dates
+        for provider, data, is_paid in records:
+            amount = amount_cents(data.get("amountToPay", data.get("amount")))
+            providers.append(provider)
+            accounts.append(data.get("contractNumber") or data.get("consumerNumber") or "")
+            amounts.append(NO_AMOUNT if amount is None else amount)
+            paid.append(bool(is_paid))
+            dates["due"].append(iso(data.get("paymentDue") or data.get("duePayment")))
+            dates["period_start"].append(iso(data.get("startMeasurement")))
+            dates["period_end"].append(iso(data.get("endMeasurement")))
+            dates["next_reading"].append(iso(data.get("nextMeasurement")))
+
+        provider_names, provider_codes = np.unique(np.array(providers, dtype=str), return_inverse=True)
+        account_names, account_codes = np.unique(np.array(accounts, dtype=str), return_inverse=True)
+        columns = {
+            "provider": provider_codes.astype(np.int8),
+            "account": account_codes.astype(np.int32),
+            "amount": np.array(amounts, dtype=np.int64),
+            "paid": np.array(paid, dtype=bool),
+        }
+        for column in DATE_COLUMNS:
+            columns[column] = _epoch_days(dates[column])
+        return cls(provider_names.tolist(), account_names.tolist(), columns)
+
+    @classmethod
+    def from_ledger(cls, path):
+        """Every bill of a bill ledger (bill_ledger.py), with its paid flag."""
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            rows = db.execute("SELECT provider, data, paid FROM bills ORDER BY id").fetchall()
+        finally:
+            db.close()
+        return cls.from_records((provider, json.loads(data), paid) for provider, data, paid in rows)
+
+    @classmethod
+    def from_jsonl(cls, paths, default_provider=None):
+        """
+        Bills of the readers' JSON Lines output ({"file"/"key", "data"} lines;
+        error and timings lines are skipped), with duplicates (the same bill
+        from its email and its PDF) kept once.
+        """
+        def records():
+            for path in paths:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        data = json.loads(line).get("data")
+                        if isinstance(data, dict):
+                            yield provider_of(data, default_provider), data, False
+        return cls.from_records(records()).unique()
+
+    def take(self, index):
+        """The bills at `index` (indices or boolean mask), with the same categories."""
+        return BillColumns(self.providers, self.accounts, {name: values[index] for name, values in self.columns.items()})
+
+    def unique(self):
+        """Bills with the same provider, account, due date and amount kept once, in their first order."""
+        if not len(self):
+            return self
+        keys = np.stack([self.provider.astype(np.int64), self.account.astype(np.int64), self.due.astype(np.int64), self.amount])
+        _, first = np.unique(keys, axis=1, return_index=True)
+        return self.take(np.sort(first))
+
+    def concat(self, other):
+        """Both sets of bills, with the categories merged."""
+        providers = sorted(set(self.providers) | set(other.providers))
+        accounts = sorted(set(self.accounts) | set(other.accounts))
+        columns = {name: np.concatenate([self.columns[name], other.columns[name]]) for name in self.columns}
+        columns["provider"] = np.concatenate([_recode(self.provider, self.providers, providers),
+                                              _recode(other.provider, other.providers, providers)]).astype(np.int8)
+        columns["account"] = np.concatenate([_recode(self.account, self.accounts, accounts),
+                                             _recode(other.account, other.accounts, accounts)]).astype(np.int32)
+        return BillColumns(providers, accounts, columns)
+
+
+def _recode(codes, names, merged_names):
+    """Category codes into `names` -> codes into the sorted `merged_names`."""
+    if not names:
+        return codes
+    return np.searchsorted(np.array(merged_names, dtype=str), np.array(names, dtype=str))[codes]
+
+
+def save(bills, path):
+    """Writes the columns as an uncompressed .npz (no pickled objects)."""
+    np.savez(path, version=np.array(FORMAT_VERSION), providers=np.array(bills.providers, dtype=str),
+             accounts=np.array(bills.accounts, dtype=str), **bills.columns)
+
+
+def load(path):
+    with np.load(path, allow_pickle=False) as store:
+        if int(store["version"]) != FORMAT_VERSION:
+            raise ValueError(f"{path}: store format {int(store['version'])}, expected {FORMAT_VERSION}")
+        columns = {name: store[name] for name in store.files if name not in ("version", "providers", "accounts")}
+        return BillColumns(store["providers"].tolist(), store["accounts"].tolist(), columns)
+
+
+def _groups(keys):
+    """Start index of every run of equal values in sorted `keys`."""
+    if not len(keys):
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+
+
+def _by_account(bills, date, mask):
+    """Indices of the bills in `mask`, sorted by account then `date`."""
+    index = np.flatnonzero(mask)
+    return index[np.lexsort((date[index], bills.account[index]))]
+
+
+def monthly_spend(bills):
+    """[{"provider", "account", "month", "bills", "amount"}] per contract and month of the due date."""
+    index = np.flatnonzero((bills.amount != NO_AMOUNT) & (bills.due != NO_DATE))
+    months = bills.due[index].astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    order = np.lexsort((months, bills.account[index]))
+    index, months = index[order], months[order]
+    keys = bills.account[index].astype(np.int64) * (1 << 32) + months
+    starts = _groups(keys)
+    totals = np.add.reduceat(bills.amount[index], starts) if len(starts) else np.zeros(0, dtype=np.int64)
+    counts = np.diff(np.append(starts, len(index)))
+    first = index[starts]
+    month_names = np.datetime_as_string(months[starts].astype("datetime64[M]")).tolist()
+    return [{"provider": bills.providers[provider], "account": bills.accounts[account],
+             "month": month, "bills": count, "amount": total / 100}
+            for provider, account, month, count, total
+            in zip(bills.provider[first].tolist(), bills.account[first].tolist(), month_names, counts.tolist(), totals.tolist())]
+
+
+def period_lengths(bills):
+    """
+    (bill indices, days) of the consumption period of every bill where it is
+    known: period_end - period_start, else the gap since the same contract's
+    previous next_reading.
+    """
+    explicit = (bills.period_start != NO_DATE) & (bills.period_end != NO_DATE)
+    explicit_index = np.flatnonzero(explicit)
+    explicit_days = (bills.period_end[explicit_index] - bills.period_start[explicit_index]).astype(np.int64)
+
+    index = _by_account(bills, bills.next_reading, ~explicit & (bills.next_reading != NO_DATE))
+    readings = bills.next_reading[index].astype(np.int64)
+    same_contract = bills.account[index][1:] == bills.account[index][:-1]
+    gap_index = index[1:][same_contract]
+    gap_days = (readings[1:] - readings[:-1])[same_contract]
+
+    all_index = np.concatenate([explicit_index, gap_index])
+    order = np.argsort(all_index, kind="stable")
+    return all_index[order], np.concatenate([explicit_days, gap_days])[order]
+
+
+def anomalies(bills, window=DEFAULT_WINDOW, min_history=DEFAULT_MIN_HISTORY, threshold=DEFAULT_THRESHOLD):
+    """
+    Bills whose amount is more than `threshold` standard deviations from the
+    mean of the same contract's previous `window` bills (at least
+    `min_history` of them). The deviation is floored at 5% of the mean, so a
+    contract with identical past bills does not flag every small change.
+    """
+    index = _by_account(bills, bills.due, (bills.amount != NO_AMOUNT) & (bills.due != NO_DATE))
+    amounts = bills.amount[index].astype(np.float64)
+    accounts = bills.account[index]
+    starts = _groups(accounts)
+    group_start = np.repeat(starts, np.diff(np.append(starts, len(index))))
+    position = np.arange(len(index)) - group_start
+
+    # Sums over the previous `window` bills of the same contract, from cumulative sums.
+    sums = np.concatenate(([0.0], np.cumsum(amounts)))
+    squares = np.concatenate(([0.0], np.cumsum(amounts * amounts)))
+    count = np.minimum(position, window)
+    low = np.arange(len(index)) - count
+    high = np.arange(len(index))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (sums[high] - sums[low]) / count
+        variance = (squares[high] - squares[low]) / count - mean * mean
+        deviation = np.maximum(np.sqrt(np.maximum(variance, 0.0)), np.maximum(np.abs(mean) * 0.05, 1.0))
+        score = (amounts - mean) / deviation
+    flagged = (count >= min_history) & (np.abs(score) > threshold)
+    return [{"provider": bills.providers[bills.provider[bill]], "account": bills.accounts[bills.account[bill]],
+             "due": _day_string(bills.due[bill]), "amount": int(bills.amount[bill]) / 100,
+             "baseline": round(float(base) / 100, 2), "score": round(float(value), 2)}
+            for bill, base, value in zip(index[flagged], mean[flagged], score[flagged])]
+
+
+def upcoming_due(bills, today=None, days=DEFAULT_DAYS):
+    """Unpaid totals due from `today` to `days` later, per provider, and the overdue ones."""
+    today = int(np.datetime64(today or datetime.date.today().isoformat(), "D").astype(np.int64))
+    unpaid = ~bills.paid & (bills.due != NO_DATE) & (bills.amount != NO_AMOUNT)
+    result = {}
+    for name, mask in (("upcoming", unpaid & (bills.due >= today) & (bills.due <= today + days)),
+                       ("overdue", unpaid & (bills.due < today))):
+        totals = np.bincount(bills.provider[mask], weights=bills.amount[mask], minlength=len(bills.providers))
+        counts = np.bincount(bills.provider[mask], minlength=len(bills.providers))
+        result[name] = {
+            "bills": int(mask.sum()),
+            "amount": int(bills.amount[mask].sum()) / 100,
+            "byProvider": {provider: {"bills": int(count), "amount": round(total / 100, 2)}
+                           for provider, count, total in zip(bills.providers, counts, totals) if count},
+        }
+    result["days"] = days
+    return result
+
+
+def report(bills, names, today=None, days=DEFAULT_DAYS, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD):
+    result = {"bills": len(bills), "providers": bills.providers, "contracts": len(bills.accounts)}
+    if "monthly" in names:
+        result["monthly"] = monthly_spend(bills)
+    if "periods" in names:
+        index, lengths = period_lengths(bills)
+        result["periods"] = [{"account": bills.accounts[account], "due": due, "days": length}
+                             for account, due, length in zip(bills.account[index].tolist(), _day_strings(bills.due[index]), lengths.tolist())]
+    if "anomalies" in names:
+        result["anomalies"] = anomalies(bills, window, threshold=threshold)
+    if "upcoming" in names:
+        result["upcoming"] = upcoming_due(bills, today, days)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar analytics over parsed bills: monthly spend, periods, anomalies, upcoming totals.")
+    parser.add_argument("inputs", nargs="*", help="Column stores (.npz) or the readers' JSON Lines output.")
+    parser.add_argument("--ledger", nargs="?", const=default_ledger_path(), help="Also read every bill of a bill ledger (default: $AUTO_UTILITY_LEDGER).")
+    parser.add_argument("--provider", help="Provider of JSON Lines bills that do not name one (electricity-reader output).")
+    parser.add_argument("--save", metavar="FILE", help="Write the columns to FILE (.npz) for fast loading.")
+    parser.add_argument("--report", nargs="*", choices=REPORTS, help=f"Reports to print as JSON (default: all unless --save). One of {', '.join(REPORTS)}.")
+    parser.add_argument("--today", help="Reference date for upcoming/overdue, YYYY-MM-DD (default: today).")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Upcoming window in days (default: %(default)s).")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="Previous bills in the anomaly baseline (default: %(default)s).")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Anomaly threshold in standard deviations (default: %(default)s).")
+    args = parser.parse_args()
+    if not args.inputs and not args.ledger:
+        parser.error("no input: give stores, JSON Lines files or --ledger")
+
+    bills = None
+    jsonl = [path for path in args.inputs if not path.endswith(".npz")]
+    parts = [load(path) for path in args.inputs if path.endswith(".npz")]
+    if jsonl:
+        parts.append(BillColumns.from_jsonl(jsonl, args.provider))
+    if args.ledger:
+        if not os.path.exists(args.ledger):
+            parser.error(f"ledger not found: {args.ledger}")
+        parts.append(BillColumns.from_ledger(args.ledger))
+    for part in parts:
+        bills = part if bills is None else bills.concat(part)
+    if len(parts) > 1:
+        bills = bills.unique()
+
+    if args.save:
+        save(bills, args.save)
+        print(f"Saved {len(bills)} bills to {args.save}", file=sys.stderr)
+    names = args.report or (() if args.save and args.report is None else REPORTS)
+    if names:
+        print(json.dumps(report(bills, names, args.today, args.days, args.window, args.threshold), indent=4, ensure_ascii=False))
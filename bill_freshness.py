@@ -0,0 +1,167 @@
+"""
+Pre-flight check of auto-dei.py: is there a DEI bill on myDEI that is not
+on disk yet?
+
+Downloaded bills are filed as <contract>_<YYYY-MM>.pdf, the month being the
+one of the payment due date ("ΕΞΟΦΛΗΣΗ ΕΩΣ"), so the newest known bill of a
+contract is found by probing the names of the last LOOKBACK_MONTHS months
+instead of listing and parsing the directory. Its "Επόμενη καταμέτρηση" date,
+read with electricity-reader.py's parse_dei_data, tells whether a newer bill
+can exist: not before the next measurement plus ISSUE_DAYS for the bill to
+be issued. Until then auto-dei.py does not start a browser at all.
+
+Files are never deleted: a download is only dropped onto a filed bill with
+the same bytes, and a filed bill with other bytes keeps its own name.
+
+Files named by the older scheme (%Y-%m-%d_%H-%M-%S.pdf) are not looked at.
+Filing them by period is a separate, explicit step:
+
+    python3 bill_freshness.py dei/300004254333
+"""
+import argparse
+import datetime
+import os
+import re
+import sys
+import threading
+from collections import namedtuple
+
+import bill_service
+from bill_ledger import file_hash
+
+ISSUE_DAYS = 7 # days from the measurement until the bill is on myDEI
+LOOKBACK_MONTHS = 6 # longest gap between two bills that is still recognised
+DATED_NAME = re.compile(r"\d{4}-\d\d-\d\d_\d\d-\d\d-\d\d\.pdf")
+
+KnownBill = namedtuple("KnownBill", "path data")
+
+_reader_lock = threading.Lock() # run_accounts() checks from several threads
+
+
+def _electricity_reader():
+    with _reader_lock:
+        return bill_service.load_reader("electricity-reader")
+
+
+def parse_date(text):
+    """DD/MM/YYYY or DD.MM.YYYY as a date, None if it is not one."""
+    try:
+        day, month, year = (int(part) for part in re.split(r"[./]", text or ""))
+        return datetime.date(year, month, day)
+    except ValueError:
+        return None
+
+
+def read_bill(pdf_path):
+    """The fields of a DEI bill PDF (parse_dei_data), reading only as many pages as needed."""
+    return _electricity_reader().process_dei_file(pdf_path, early_exit=True)
+
+
+def bill_period(data):
+    """"YYYY-MM" of the payment due date, None without one."""
+    due = parse_date(data.get("paymentDue"))
+    return f"{due:%Y-%m}" if due else None
+
+
+def period_path(target_dir, contract, period):
+    return os.path.join(target_dir, f"{contract}_{period}.pdf")
+
+
+def _months_back(today, count):
+    year, month = today.year, today.month + 1 # a bill issued now can be due next month
+    for _ in range(count + 2):
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+
+
+def latest_bill(target_dir, contract, today=None):
+    """The newest bill of `contract` filed in `target_dir` as a KnownBill, None if there is none."""
+    today = today or datetime.date.today()
+    for period in _months_back(today, LOOKBACK_MONTHS):
+        path = period_path(target_dir, contract, period)
+        if os.path.exists(path):
+            return KnownBill(path, read_bill(path))
+    return None
+
+
+def new_bill_possible(data, today=None, issue_days=ISSUE_DAYS):
+    """False while the next measurement of the bill `data` (plus issue_days) has not come."""
+    next_measurement = parse_date(data.get("nextMeasurement"))
+    if next_measurement is None:
+        return True
+    return (today or datetime.date.today()) >= next_measurement + datetime.timedelta(days=issue_days)
+
+
+def _unused_path(path):
+    """`path`, or the first of path_1, path_2, ... that does not exist."""
+    root, ext = os.path.splitext(path)
+    number = 0
+    while os.path.exists(path):
+        number += 1
+        path = f"{root}_{number}{ext}"
+    return path
+
+
+def file_by_period(pdf_path, target_dir):
+    """
+    Renames a downloaded bill to <contract>_<YYYY-MM>.pdf in target_dir.
+    Returns (path, is_new), is_new False when the bill filed under that name
+    has the same fields. A download with the same bytes as the filed bill
+    simply takes its place. Otherwise the filed bill is renamed after its
+    date of modification (_%Y-%m-%d_%H-%M-%S) and both are kept. A PDF
+    without the fields stays where it is.
+    """
+    data = read_bill(pdf_path)
+    contract, period = data.get("contractNumber"), bill_period(data)
+    if not contract or not period:
+        return pdf_path, True
+    target = period_path(target_dir, contract, period)
+    if os.path.abspath(target) == os.path.abspath(pdf_path):
+        return target, True
+    is_new = True
+    if os.path.exists(target):
+        if file_hash(target) == file_hash(pdf_path):
+            os.replace(pdf_path, target) # nothing is lost: the bytes are the same
+            return target, False
+        is_new = read_bill(target) != data
+        stamp = datetime.datetime.fromtimestamp(os.path.getmtime(target))
+        os.replace(target, _unused_path(os.path.join(target_dir, f"{contract}_{period}_{stamp:%Y-%m-%d_%H-%M-%S}.pdf")))
+    os.replace(pdf_path, target)
+    return target, is_new
+
+
+def dated_files(target_dir):
+    """Paths of the files still named %Y-%m-%d_%H-%M-%S.pdf, oldest first."""
+    try:
+        names = sorted(name for name in os.listdir(target_dir) if DATED_NAME.fullmatch(name))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(target_dir, name) for name in names]
+
+
+def rename_dated_files(target_dir):
+    """Files the bills still named %Y-%m-%d_%H-%M-%S.pdf by period, oldest first. Returns [(old path, new path)]."""
+    renamed = []
+    for path in dated_files(target_dir):
+        try:
+            new_path, _ = file_by_period(path, target_dir)
+        except Exception as e:
+            print(f"{path}: not read ({e}), left as it is", file=sys.stderr)
+            continue
+        if new_path != path:
+            renamed.append((path, new_path))
+    return renamed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="File DEI bills named %Y-%m-%d_%H-%M-%S.pdf as <contract>_<YYYY-MM>.pdf.")
+    parser.add_argument("directories", nargs="+", metavar="DIR", help="Download directory of auto-dei.py (e.g. dei/300004254333).")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="Only list the files that would be renamed.")
+    args = parser.parse_args()
+    for directory in args.directories:
+        if args.dry_run:
+            for path in dated_files(directory):
+                print(path)
+            continue
+        for old_path, new_path in rename_dated_files(directory):
+            print(f"{old_path} -> {new_path}")
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Local SQLite ledger of parsed bills, so runs are incremental and duplicates
+are kept once.
+
+Two tables:
+
+    sources  one row per source document (PDF or raw email) and parser,
+             keyed by the SHA-256 of its bytes and the parser
+             (name:PARSER_VERSION) that read it, with what it returned
+    bills    one row per bill, identified by provider + RF code + due date,
+             with the account (contract or consumer number), the amount in
+             cents and the due date as YYYY-MM-DD for sorting
+
+A re-downloaded PDF (auto-dei.py names files by time) has the same content
+hash and is skipped before parsing. A re-sent email or the PDF of a bill
+already known from its email has different bytes but the same RF code and
+due date, so it is merged into the existing bill instead of added again.
+Documents read by an older parser version are parsed again.
+
+New results are buffered and written in one transaction per batch.
+
+The ledger is off unless a file is given, with the readers' --ledger option
+or the AUTO_UTILITY_LEDGER environment variable. Run this module to list the
+outstanding bills by due date.
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import sys
+import time
+
+LEDGER_ENV = "AUTO_UTILITY_LEDGER"
+DEFAULT_BATCH_SIZE = 200
+_QUERY_CHUNK = 500 # SQLite parameters per IN (...) query
+
+_SOURCES_COLUMNS = """
+    content_hash TEXT NOT NULL,
+    bill_id INTEGER NOT NULL REFERENCES bills (id),
+    source TEXT,
+    kind TEXT NOT NULL,
+    parser TEXT NOT NULL,
+    data TEXT NOT NULL,
+    seen REAL NOT NULL,
+    PRIMARY KEY (content_hash, parser)
+"""
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS bills (
+    id INTEGER PRIMARY KEY,
+    provider TEXT NOT NULL,
+    rf_code TEXT,
+    account TEXT,
+    amount_cents INTEGER,
+    due_date TEXT,
+    data TEXT NOT NULL,
+    paid INTEGER NOT NULL DEFAULT 0,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bills_identity ON bills (provider, rf_code, due_date);
+CREATE INDEX IF NOT EXISTS bills_account ON bills (account);
+CREATE INDEX IF NOT EXISTS bills_due_date ON bills (due_date);
+CREATE TABLE IF NOT EXISTS sources ({_SOURCES_COLUMNS});
+CREATE INDEX IF NOT EXISTS sources_bill ON sources (bill_id);
+"""
+
+_DATE_PATTERN = re.compile(r"(\d{1,2})[./](\d{1,2})[./](\d{4})")
+
+
+def file_hash(path):
+    import hashlib
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iso_date(value):
+    """"27/10/2025" (or 27.10.2025) -> "2025-10-27"; None if it is not a date."""
+    match = _DATE_PATTERN.fullmatch(str(value or "").strip())
+    if not match:
+        return None
+    day, month, year = (int(part) for part in match.groups())
+    try:
+        return datetime.date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def amount_cents(value):
+    """45.1, "45,10", "32.63" or "1.234,56" -> cents; None if it is not an amount."""
+    if isinstance(value, (int, float)):
+        return round(value * 100)
+    text = str(value or "").strip()
+    if "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    try:
+        return round(float(text) * 100)
+    except ValueError:
+        return None
+
+
+def bill_key(data):
+    """(rf_code, account, amount_cents, due_date) of parsed reader output, whichever reader made it."""
+    rf_code = data.get("RFcode") or data.get("RFpayment")
+    account = data.get("contractNumber") or data.get("consumerNumber")
+    amount = data.get("amountToPay", data.get("amount"))
+    due = data.get("paymentDue") or data.get("duePayment")
+    return rf_code, account, amount_cents(amount), iso_date(due)
+
+
+class BillLedger:
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        import sqlite3
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(_SCHEMA)
+        self._key_sources_by_parser()
+
+    def _key_sources_by_parser(self):
+        # Ledgers made before sources were keyed by (content_hash, parser) kept
+        # one row per document, which a second parser of it replaced.
+        key = [row[1] for row in self.db.execute("PRAGMA table_info(sources)") if row[5]]
+        if key != ["content_hash"]:
+            return
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.execute(f"CREATE TABLE sources_keyed ({_SOURCES_COLUMNS})")
+            self.db.execute("INSERT INTO sources_keyed SELECT content_hash, bill_id, source, kind, parser, data, seen FROM sources")
+            self.db.execute("DROP TABLE sources")
+            self.db.execute("ALTER TABLE sources_keyed RENAME TO sources")
+            self.db.execute("CREATE INDEX sources_bill ON sources (bill_id)")
+
+    def lookup(self, digest, parser):
+        """What this parser returned for this document, or None if it has not read it."""
+        row = self.db.execute("SELECT data FROM sources WHERE content_hash = ? AND parser = ?", (digest, parser)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def known(self, digests, parser):
+        """The subset of `digests` already read by this parser."""
+        digests = list(digests)
+        found = set()
+        for start in range(0, len(digests), _QUERY_CHUNK):
+            chunk = digests[start:start + _QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(row[0] for row in self.db.execute(
+                f"SELECT content_hash FROM sources WHERE parser = ? AND content_hash IN ({placeholders})", [parser, *chunk]))
+        return found
+
+    def add(self, digest, source, kind, provider, parser, data):
+        """
+        Queues one parsed document; written with the next flush() (automatic
+        every batch_size). provider=None takes it from data["provider"]
+        (bill-reader.py output).
+        """
+        self.pending.append((digest, source, kind, provider or data["provider"], parser, data))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        now = time.time()
+        with self.db:
+            for digest, source, kind, provider, parser, data in self.pending:
+                rf_code, account, cents, due_date = bill_key(data)
+                row = None
+                if rf_code:
+                    row = self.db.execute("SELECT id, data FROM bills WHERE provider = ? AND rf_code = ? AND due_date IS ?",
+                                          (provider, rf_code, due_date)).fetchone()
+                if row is None:
+                    bill_id = self.db.execute(
+                        "INSERT INTO bills (provider, rf_code, account, amount_cents, due_date, data, first_seen, last_seen) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (provider, rf_code, account, cents, due_date, json.dumps(data, ensure_ascii=False), now, now)).lastrowid
+                else:
+                    # Same bill from another document: keep every field, the newer value wins.
+                    bill_id = row[0]
+                    merged = dict(json.loads(row[1]), **data)
+                    rf_code, account, cents, due_date = bill_key(merged)
+                    self.db.execute("UPDATE bills SET account = ?, amount_cents = ?, data = ?, last_seen = ? WHERE id = ?",
+                                    (account, cents, json.dumps(merged, ensure_ascii=False), now, bill_id))
+                self.db.execute("INSERT OR REPLACE INTO sources (content_hash, bill_id, source, kind, parser, data, seen) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (digest, bill_id, source, kind, parser, json.dumps(data, ensure_ascii=False), now))
+        self.pending.clear()
+
+    def parse_once(self, path, provider, parser, parse, kind="pdf"):
+        """parse(path), unless the ledger already has this document's result."""
+        digest = file_hash(path)
+        data = self.lookup(digest, parser)
+        if data is None:
+            data = parse(path)
+            if "error" not in data:
+                self.add(digest, path, kind, provider, parser, data)
+                self.flush()
+        return data
+
+    def skip_known(self, paths, parser):
+        """
+        Hashes the files and drops those already in the ledger. Returns
+        (paths to parse, {path: hash}, number skipped). Unreadable files are
+        kept, so the reader reports them as usual.
+        """
+        hashes = {}
+        for path in paths:
+            try:
+                hashes[path] = file_hash(path)
+            except OSError:
+                pass
+        known = self.known(hashes.values(), parser)
+        remaining = [path for path in paths if hashes.get(path) not in known]
+        return remaining, hashes, len(paths) - len(remaining)
+
+    def record_results(self, results, hashes, provider, parser, kind="pdf"):
+        """
+        Passes batch results (path, data, error, ...) through unchanged and
+        queues every successful one; flushes at the end.
+        """
+        try:
+            for item in results:
+                path, data, error = item[:3]
+                if error is None and path in hashes and "error" not in data:
+                    self.add(hashes[path], path, kind, provider, parser, data)
+                yield item
+        finally:
+            self.flush()
+
+    def outstanding(self, include_paid=False):
+        """Bills by due date (bills without a due date last)."""
+        query = "SELECT id, provider, account, amount_cents, due_date, rf_code, paid FROM bills"
+        if not include_paid:
+            query += " WHERE paid = 0"
+        query += " ORDER BY due_date IS NULL, due_date, provider, account"
+        columns = ("id", "provider", "account", "amountCents", "dueDate", "RFcode", "paid")
+        return [dict(zip(columns, row)) for row in self.db.execute(query)]
+
+    def mark_paid(self, bill_ids, paid=True):
+        with self.db:
+            self.db.executemany("UPDATE bills SET paid = ? WHERE id = ?", [(int(paid), bill_id) for bill_id in bill_ids])
+
+    def stats(self):
+        bills, unpaid = self.db.execute("SELECT COUNT(*), COALESCE(SUM(paid = 0), 0) FROM bills").fetchone()
+        sources = self.db.execute("SELECT COUNT(DISTINCT content_hash) FROM sources").fetchone()[0]
+        return {"bills": bills, "unpaid": unpaid, "sources": sources}
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def enable_ledger(path):
+    """Turns the ledger on for this process and for worker processes it starts."""
+    os.environ[LEDGER_ENV] = path
+
+
+def default_ledger_path():
+    return os.environ.get(LEDGER_ENV) or None
+
+
+def open_ledger(path=None):
+    """The ledger at `path` or $AUTO_UTILITY_LEDGER, or None when the ledger is off."""
+    path = path or default_ledger_path()
+    return BillLedger(path) if path else None
+
+
+def _format_row(row, today):
+    amount = "" if row["amountCents"] is None else f"{row['amountCents'] / 100:.2f}"
+    due = row["dueDate"] or "?"
+    status = "paid" if row["paid"] else "OVERDUE" if row["dueDate"] and row["dueDate"] < today else ""
+    return f"{row['id']:>5}  {due:10}  {row['provider']:7} {row['account'] or '':16} {amount:>9}  {row['RFcode'] or '':27} {status}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List outstanding bills from the bill ledger, by due date.")
+    parser.add_argument("ledger", nargs="?", default=default_ledger_path(), help="Ledger file (default: $AUTO_UTILITY_LEDGER).")
+    parser.add_argument("--all", action="store_true", help="Include bills marked as paid.")
+    parser.add_argument("--days", type=int, help="Only bills due within this many days (overdue bills are always listed).")
+    parser.add_argument("--mark-paid", type=int, nargs="+", metavar="ID", help="Mark bills as paid.")
+    parser.add_argument("--mark-unpaid", type=int, nargs="+", metavar="ID", help="Mark bills as not paid.")
+    parser.add_argument("--json", action="store_true", help="JSON Lines output.")
+    parser.add_argument("--stats", action="store_true", help="Print the number of bills and source documents.")
+    args = parser.parse_args()
+    if not args.ledger:
+        parser.error("no ledger file given and AUTO_UTILITY_LEDGER is not set")
+    if not os.path.exists(args.ledger):
+        parser.error(f"ledger not found: {args.ledger}")
+
+    with BillLedger(args.ledger) as ledger:
+        if args.mark_paid:
+            ledger.mark_paid(args.mark_paid)
+        if args.mark_unpaid:
+            ledger.mark_paid(args.mark_unpaid, paid=False)
+        if args.stats:
+            print(json.dumps(ledger.stats(), indent=4))
+            sys.exit(0)
+        today = datetime.date.today().isoformat()
+        rows = ledger.outstanding(include_paid=args.all)
+        if args.days is not None:
+            until = (datetime.date.today() + datetime.timedelta(days=args.days)).isoformat()
+            rows = [row for row in rows if row["dueDate"] and row["dueDate"] <= until]
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False) if args.json else _format_row(row, today))
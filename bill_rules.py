@@ -0,0 +1,184 @@
+"""
+Declarative extraction rules for every provider, compiled into one matcher.
+
+Each rule is (field, anchor, pattern, normalizer, kind, offset):
+
+    anchor      regex for the label the field starts with. All anchors of all
+                providers are joined into one alternation and the text is
+                scanned once; a rule's full pattern is only tried where its
+                anchor was found.
+    pattern     the full regex, matched at the anchor position. Group 1 (or
+                the whole match if there is no group) is the value.
+    normalizer  callable applied to the value, or None.
+    kind        "first": the first match wins (re.search semantics).
+                "all": every non-overlapping match, in order (re.findall).
+    offset      how many characters into the match the anchor starts (0 for
+                labels). Lets fields without a label, such as dates, anchor
+                on a separator instead of on every digit of the text.
+
+Rules that start the same way must share the same anchor string, and two
+different anchors must never be able to match at the same position, because
+the scan reports one anchor per position. An anchor must start with a literal
+character (escaped if special) or an unquantified \d: the scanner begins with
+a class of those first characters, which lets re skip every other position
+without entering the alternation. Adding a provider adds rules to the table,
+not another pass over the text.
+"""
+import re
+from collections import namedtuple
+
+Rule = namedtuple("Rule", "field anchor pattern normalizer kind offset", defaults=(0,))
+
+DATE = r"\d{2}/\d{2}/\d{4}"
+DATE_ANCHOR = r"/\d\d/\d" # the first "/" of DD/MM/YYYY, two characters in
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _strip_spaces(value):
+    return _WHITESPACE.sub("", value)
+
+
+def _comma_to_dot(value):
+    return value.replace(",", ".")
+
+
+RULES = {
+    # Which provider sent an email (body-reader auto-detect)
+    "detect": [
+        Rule("eyath", r"eyath\.gr", r"eyath\.gr", None, "first"),
+        Rule("dei", r"dei\.gr", r"dei\.gr", None, "first"),
+    ],
+    "eyath_email": [
+        Rule("consumerNumber", r"Αριθμός καταναλωτή:", r"Αριθμός καταναλωτή:\s*([0-9-]{15})", None, "first"),
+        Rule("accountNumber", r"ΑΚΝ", r"ΑΚΝ([A-Z0-9]+)", lambda value: "ΑΚΝ" + value, "first"),
+        Rule("RFcode", r"Κωδ\. Εντολής Πληρωμής:", r"Κωδ\. Εντολής Πληρωμής:\s*([A-Z0-9]+)", None, "first"),
+        Rule("amount", r"Ποσό πληρωμής:", r"Ποσό πληρωμής:\s*([0-9,\.]+)", _comma_to_dot, "first"),
+        Rule("paymentDue", r"Ημερομηνία λήξης:", r"Ημερομηνία λήξης:\s*(\d{2}/\d{2}/\d{4})", None, "first"),
+    ],
+    "dei_email": [
+        Rule("RFcode", r"Κωδικός Ηλεκτρονικής Πληρωμής", r"Κωδικός Ηλεκτρονικής Πληρωμής\s*([A-Z0-9\s]+)", _strip_spaces, "first"),
+        Rule("amount", r"Τελικό Ποσό Πληρωμής", r"Τελικό Ποσό Πληρωμής\s*([0-9,\.]+)\s*€", _comma_to_dot, "first"),
+        Rule("paymentDue", r"Ημερομηνία Λήξης", r"Ημερομηνία Λήξης\s*(\d{2}/\d{2}/\d{4})", None, "first"),
+    ],
+    "eyath_pdf": [
+        # Runs on the tab-joined one-liner of eyath-reader
+        Rule("RFpayment", r"\*", r"\*\s*(RF[^*]+?)\s*\*", lambda value: value.replace(' ', '').strip(), "first"),
+        Rule("dates", DATE_ANCHOR, DATE, None, "all", 2),
+        Rule("duePaymentPagio", DATE_ANCHOR, r"(\d{2}/\d{2}/\d{4})\s*ΠΑΓΙΟ ΤΕΛΟΣ", None, "first", 2),
+        Rule("duePaymentPoli", DATE_ANCHOR, r"(\d{2}/\d{2}/\d{4})\s*ΠΟΛΗ", None, "first", 2),
+        Rule("amount", r"ΑΡ\s*\.ΠΑΡΑΣΤΑΤΙΚΟΥ", r"ΑΡ\s*\.ΠΑΡΑΣΤΑΤΙΚΟΥ\s*:\s*(\d+(?:[.,]\d{1,2})?)", _comma_to_dot, "first"),
+        Rule("consumerNumber", r"-\d\d-\d\d\d-", r"\d{2}-\d{2}-\d{3}-\d{2}-\d{2}", None, "first", 2),
+    ],
+    "dei_pdf": [
+        Rule("amountToPay", r"ΠΟΣΟ ΠΛΗΡΩΜΗΣ", r"ΠΟΣΟ ΠΛΗΡΩΜΗΣ\s*\*\s*([\d.,]+)\s*€", None, "first"),
+        Rule("RFcode", r"RF\d", r"(RF\d{20,})", None, "first"),
+        Rule("paymentDue", r"ΕΞΟΦΛΗΣΗ ΕΩΣ", r"ΕΞΟΦΛΗΣΗ ΕΩΣ\s*\n\s*([\d./]+)", None, "first"),
+        Rule("nextMeasurement", r"Επόμενη καταμέτρηση", r"Επόμενη καταμέτρηση\s*\n\s*([\d./]+)", None, "first"),
+    ],
+    "zenith_pdf": [
+        Rule("RFcode", r"RF\d", r"(RF\d{20,})", None, "first"),
+        Rule("dates", DATE_ANCHOR, DATE, None, "all", 2),
+    ],
+}
+
+
+def _split_anchor(anchor):
+    """
+    Splits an anchor into (class item for its first character, the same
+    character as a lookbehind, the rest of the anchor).
+    """
+    if anchor.startswith("\\d"):
+        first, rest = "\\d", anchor[2:]
+    elif anchor.startswith("\\") and len(anchor) > 1 and not anchor[1].isalnum():
+        first, rest = anchor[:2], anchor[2:]
+    elif anchor and anchor[0] not in ".^$*+?{}[]()|\\":
+        first, rest = re.escape(anchor[0]), anchor[1:]
+    else:
+        raise ValueError(f"Anchor must start with a literal character or \\d: {anchor!r}")
+    if rest[:1] in ("*", "+", "?", "{"):
+        raise ValueError(f"Anchor must not quantify its first character: {anchor!r}")
+    return first, f"(?<={first})", rest
+
+
+class RuleEngine:
+    def __init__(self, rules):
+        self.rules = rules
+        anchors = []  # anchor regex strings, in first-seen order
+        # per anchor: {(pattern, offset): [(provider, rule)]}, so a pattern
+        # shared by several providers (e.g. dates) is matched once per hit
+        by_anchor = []
+        for provider, provider_rules in rules.items():
+            for rule in provider_rules:
+                if rule.anchor not in anchors:
+                    anchors.append(rule.anchor)
+                    by_anchor.append({})
+                by_anchor[anchors.index(rule.anchor)].setdefault((rule.pattern, rule.offset), []).append((provider, rule))
+        self.by_anchor = [[(re.compile(pattern), offset, targets) for (pattern, offset), targets in groups.items()]
+                          for groups in by_anchor]
+        first_chars = []
+        branches = []
+        for i, anchor in enumerate(anchors):
+            first, lookbehind, rest = _split_anchor(anchor)
+            if first not in first_chars:
+                first_chars.append(first)
+            branches.append(f"{lookbehind}(?=(?P<a{i}>{rest}))")
+        # Consumes only the first character, then checks (without consuming)
+        # which anchor starts there, so overlapping anchors are all seen;
+        # match.start() is the anchor position.
+        self.scanner = re.compile(f"[{''.join(first_chars)}](?:{'|'.join(branches)})")
+
+    def scan(self, text):
+        """
+        One pass over `text`. Returns {provider: {field: value}} with raw
+        (not normalized) values; "all" fields hold lists.
+        """
+        found = {provider: {} for provider in self.rules}
+        all_ends = {}  # (provider, field) -> end of the last accepted "all" match
+        for anchor_match in self.scanner.finditer(text):
+            for pattern, offset, targets in self.by_anchor[int(anchor_match.lastgroup[1:])]:
+                pos = anchor_match.start() - offset
+                if pos < 0:
+                    continue
+                match = None
+                for provider, rule in targets:
+                    fields = found[provider]
+                    if rule.kind == "first" and rule.field in fields:
+                        continue
+                    if rule.kind == "all" and pos < all_ends.get((provider, rule.field), 0):
+                        continue
+                    if match is None:
+                        match = pattern.match(text, pos)
+                        if match is None:
+                            break
+                        value = match.group(1) if pattern.groups else match.group(0)
+                    if rule.kind == "all":
+                        fields.setdefault(rule.field, []).append(value)
+                        all_ends[(provider, rule.field)] = match.end()
+                    else:
+                        fields[rule.field] = value
+        return found
+
+    def normalize(self, provider, raw_fields):
+        """Applies the normalizers; fields keep the rule table's order and missing "all" fields are []."""
+        data = {}
+        for rule in self.rules[provider]:
+            if rule.field not in raw_fields:
+                if rule.kind == "all":
+                    data[rule.field] = []
+                continue
+            value = raw_fields[rule.field]
+            if rule.normalizer is not None:
+                value = [rule.normalizer(v) for v in value] if rule.kind == "all" else rule.normalizer(value)
+            data[rule.field] = value
+        return data
+
+    def extract(self, provider, text, scanned=None):
+        """Normalized fields of one provider. Pass `scanned` to reuse an earlier scan()."""
+        if scanned is None:
+            scanned = self.scan(text)
+        return self.normalize(provider, scanned[provider])
+
+
+ENGINE = RuleEngine(RULES)
+scan = ENGINE.scan
+extract = ENGINE.extract
@@ -0,0 +1,153 @@
+"""
+Shared request handling for bill-daemon.py and bill-client.py.
+
+The readers are scripts with dashes in their names, so they are loaded here
+by path. A request is one JSON header line, optionally followed by `size`
+raw bytes (a PDF or a whole .eml); the reply is one JSON line.
+
+Request header fields:
+    kind      "pdf" or "email"
+    provider  "eyath", "dei", "zenith" or null (PDFs, null routes by
+              pdf_router.py); "eyath", "dei" or null (emails)
+    path      file to read, when the content is not sent inline
+    size      number of raw content bytes that follow the header line
+    timings   optional: "wall" or "memory" adds a "timings" record (see
+              timings.py) to the reply; tracemalloc is process-wide, so
+              memory-mode requests run one at a time
+"""
+import importlib.util
+import io
+import json
+import os
+import sys
+import threading
+
+import timings
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PDF_PROVIDERS = ("eyath", "dei", "zenith")
+MAX_REQUEST_SIZE = 64 * 1024 * 1024
+
+# tracemalloc is started, reset and stopped for the whole process; bill-daemon
+# answers on threads, so memory-mode records must not overlap
+_memory_lock = threading.Lock()
+
+
+def default_socket_path():
+    """$AUTO_UTILITY_SOCKET, else a per-user socket in the runtime directory."""
+    if os.environ.get("AUTO_UTILITY_SOCKET"):
+        return os.environ["AUTO_UTILITY_SOCKET"]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime_dir, f"auto-utility-{os.getuid()}.sock")
+
+
+def load_reader(name):
+    """Imports one of the reader scripts (e.g. "eyath-reader") once per process."""
+    module_name = name.replace("-", "_")
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(SCRIPT_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def warm_up():
+    """
+    Imports every reader (and with them pypdf and email) and picks the PDF
+    text backend (text_backends.py) ahead of the first request.
+    """
+    for name in ("eyath-reader", "electricity-reader", "body-reader"):
+        load_reader(name)
+    import text_backends
+    text_backends.active_backend()
+
+
+def parse_pdf(source, provider):
+    """
+    `source` is a path or a binary stream. Goes through the extraction cache
+    when it is on. Without a provider the PDF is routed by pdf_router.py.
+    """
+    if provider is None:
+        import pdf_router # imports this module; loaded on first use
+        return pdf_router.process_auto_file(source)
+    if provider == "eyath":
+        return load_reader("eyath-reader").process_pdf_file(source)
+    electricity = load_reader("electricity-reader")
+    if provider == "dei":
+        return electricity.process_dei_file(source)
+    if provider == "zenith":
+        return electricity.process_zenith_file(source)
+    raise ValueError(f"Unknown PDF provider: {provider!r} (expected one of {', '.join(PDF_PROVIDERS)})")
+
+
+def parse_email(raw_bytes, provider=None):
+    body = load_reader("body-reader")
+    with timings.stage("mime"):
+        msg = body.message_from_bytes(raw_bytes) # each part is decoded in its own charset
+    return body.parse_message(msg, provider)
+
+
+def handle_request(header, content=None):
+    """
+    Runs one request and returns the reply dict. Errors are returned as
+    {"error": ...} so that one bad document never takes the server down.
+    """
+    mode = header.get("timings")
+    if not mode:
+        return _handle_request(header, content)
+    if mode == "memory":
+        with _memory_lock, timings.record(header.get("path") or "-", "memory") as record:
+            reply = _handle_request(header, content)
+    else:
+        with timings.record(header.get("path") or "-", "wall") as record:
+            reply = _handle_request(header, content)
+    return dict(reply, timings=record.as_dict())
+
+
+def _handle_request(header, content):
+    try:
+        kind = header.get("kind", "pdf")
+        provider = header.get("provider")
+        if content is None:
+            path = header.get("path")
+            if not path:
+                raise ValueError("Request has neither 'path' nor inline content")
+        if kind == "pdf":
+            source = io.BytesIO(content) if content is not None else path
+            return parse_pdf(source, provider)
+        if kind == "email":
+            if content is None:
+                with open(path, "rb") as f:
+                    content = f.read()
+            return parse_email(content, provider)
+        raise ValueError(f"Unknown request kind: {kind!r}")
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def read_request(rfile):
+    """Reads one request from a binary stream; returns (header, content) or None at EOF."""
+    line = rfile.readline()
+    if not line:
+        return None
+    header = json.loads(line)
+    size = header.get("size")
+    content = None
+    if size is not None:
+        if size > MAX_REQUEST_SIZE:
+            raise ValueError(f"Request too large: {size} bytes")
+        content = rfile.read(size)
+        if len(content) != size:
+            raise ValueError("Connection closed before the whole content was received")
+    return header, content
+
+
+def write_request(wfile, header, content=None):
+    if content is not None:
+        header = dict(header, size=len(content))
+    wfile.write(json.dumps(header).encode("utf-8") + b"\n")
+    if content is not None:
+        wfile.write(content)
+    wfile.flush()
@@ -1,119 +1,374 @@
 
-import base64
-import re
+import io
 import json
 import sys
-from email import message_from_string
+import os
+from email import message_from_bytes
 import argparse
+import bill_rules
+import mime_stream
+import timings
+from bill_ledger import file_hash, open_ledger
+from extraction_cache import content_hash
 
-def parse_eyath_email(processed_content):
+PARSER_VERSION = 1 # Bump on every rule change so the bill ledger re-parses known emails
+
+def parse_eyath_email(processed_content, scanned=None):
     data = {}
     data["type"] = "water"
     data["company"] = "eyath"
-    
-    # Consumer Number: "Αριθμός καταναλωτή:"
-    consumer_number_match = re.search(r"Αριθμός καταναλωτή:\s*([0-9-]{15})", processed_content)
-    if consumer_number_match:
-        data["consumerNumber"] = consumer_number_match.group(1)
-
-    # Account Number: "ΑΚΝ" followed by alphanumeric characters
-    account_number_match = re.search(r"ΑΚΝ([A-Z0-9]+)", processed_content)
-    if account_number_match:
-        data["accountNumber"] = "ΑΚΝ" + account_number_match.group(1)
-
-    # RF Code: "Κωδ. Εντολής Πληρωμής:" (There are two, taking the first one)
-    rf_code_match = re.search(r"Κωδ\. Εντολής Πληρωμής:\s*([A-Z0-9]+)", processed_content)
-    if rf_code_match:
-        data["RFcode"] = rf_code_match.group(1)
-
-    # Amount: "Ποσό πληρωμής:"
-    amount_match = re.search(r"Ποσό πληρωμής:\s*([0-9,\.]+)", processed_content)
-    if amount_match:
-        data["amount"] = amount_match.group(1).replace(',', '.') # Replace comma with dot for consistency
-
-    # Payment Due: "Ημερομηνία λήξης:"
-    payment_due_match = re.search(r"Ημερομηνία λήξης:\s*(\d{2}/\d{2}/\d{4})", processed_content)
-    if payment_due_match:
-        data["paymentDue"] = payment_due_match.group(1)
-
-    return json.dumps(data, ensure_ascii=False, indent=4)
-
-def parse_dei_email(processed_content):
+    # consumerNumber ("Αριθμός καταναλωτή:"), accountNumber ("ΑΚΝ..."),
+    # RFcode (first "Κωδ. Εντολής Πληρωμής:"), amount ("Ποσό πληρωμής:", dot decimal)
+    # and paymentDue ("Ημερομηνία λήξης:"); see "eyath_email" in bill_rules.py.
+    data.update(bill_rules.extract("eyath_email", processed_content, scanned))
+    return data
+
+def parse_dei_email(processed_content, scanned=None):
     data = {}
     data["type"] = "electricity"
     data["company"] = "dei"
-
-    # RF Code: "Κωδικός Ηλεκτρονικής Πληρωμής"
-    rf_code_match = re.search(r"Κωδικός Ηλεκτρονικής Πληρωμής\s*([A-Z0-9\s]+)", processed_content)
-    if rf_code_match:
-        data["RFcode"] = re.sub(r'\s+', '', rf_code_match.group(1))
+    # RFcode ("Κωδικός Ηλεκτρονικής Πληρωμής", spaces removed), amount
+    # ("Τελικό Ποσό Πληρωμής", dot decimal) and paymentDue ("Ημερομηνία Λήξης");
+    # see "dei_email" in bill_rules.py.
+    fields = bill_rules.extract("dei_email", processed_content, scanned)
+    if "RFcode" in fields:
+        data["RFcode"] = fields["RFcode"]
         # Contract Number: last 12 digits of RFcode
-        data["contractNumber"] = re.sub(r'\s+', '', rf_code_match.group(1))[-12:]
+        data["contractNumber"] = fields["RFcode"][-12:]
+    for field in ("amount", "paymentDue"):
+        if field in fields:
+            data[field] = fields[field]
+    return data
+
+NO_TEXT_ERROR = "Could not find a plain text part."
+
+def extract_plain_text(msg):
+    """
+    Returns the decoded text/plain part of the message (the first base64 one,
+    else the first in any encoding, in its own charset), or None.
+    """
+    return mime_stream.pick_plain_text(msg)
+
+def parse_email_content(processed_content, provider=None):
+    """
+    Parses the decoded text with the given provider ("eyath" or "dei"),
+    or auto-detects the provider from the content. Detection and fields come
+    from the same single scan of the text.
+    """
+    scanned = bill_rules.scan(processed_content)
+    if provider is None:
+        # Auto-detect based on content
+        if "eyath" in scanned["detect"]:
+            provider = "eyath"
+        elif "dei" in scanned["detect"]:
+            provider = "dei"
+    if provider == "eyath":
+        return parse_eyath_email(processed_content, scanned)
+    if provider == "dei":
+        return parse_dei_email(processed_content, scanned)
+    return {"error": "Could not determine email type. Use --eyath or --dei, or ensure 'eyath.gr' or 'dei.gr' is in the email content."}
+
+def parse_text(processed_content, provider=None):
+    if processed_content is None:
+        return {"error": NO_TEXT_ERROR}
+    with timings.stage("parse"):
+        return parse_email_content(processed_content, provider)
+
+def parse_message(msg, provider=None):
+    with timings.stage("decode"):
+        processed_content = extract_plain_text(msg)
+    return parse_text(processed_content, provider)
+
+def parse_stream(fp, provider=None):
+    """
+    Streaming mode: parses a raw email from a binary stream, reading only as
+    far as its text part (see mime_stream.py). Returns (Message-ID, result).
+    """
+    headers, processed_content = mime_stream.read_plain_text(fp)
+    return headers.get("Message-ID"), parse_text(processed_content, provider)
 
-    # Amount: "Τελικό Ποσό Πληρωμής"
-    amount_match = re.search(r"Τελικό Ποσό Πληρωμής\s*([0-9,\.]+)\s*€", processed_content)
-    if amount_match:
-        data["amount"] = amount_match.group(1).replace(',', '.')
+def load_checkpoint(checkpoint_path):
+    """Returns the set of message keys already written by an earlier run."""
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
 
-    # Payment Due: "Ημερομηνία Λήξης"
-    payment_due_match = re.search(r"Ημερομηνία Λήξης\s*(\d{2}/\d{2}/\d{4})", processed_content)
-    if payment_due_match:
-        data["paymentDue"] = payment_due_match.group(1)
+def read_mailbox_message(box, key, provider, ledger, parser_key, stream):
+    """
+    {"key", "messageId", "data"} of one mailbox message (plus its "digest"
+    when there is a ledger), or None when the ledger already has it.
+    """
+    if stream and not ledger:
+        with box.get_file(key) as message_file:
+            message_id, data = parse_stream(message_file, provider)
+        return {"key": str(key), "messageId": message_id, "data": data}
+    with timings.stage("read"):
+        raw = box.get_bytes(key)
+    record = {"key": str(key)}
+    if ledger:
+        with timings.stage("ledger"):
+            record["digest"] = content_hash(raw)
+            if ledger.lookup(record["digest"], parser_key) is not None:
+                return None
+    if stream:
+        record["messageId"], record["data"] = parse_stream(io.BytesIO(raw), provider)
+    else:
+        with timings.stage("mime"):
+            msg = message_from_bytes(raw)
+        record["messageId"], record["data"] = msg.get("Message-ID"), parse_message(msg, provider)
+    return record
+
+def ingest_mailbox(box, out, checkpoint_path=None, provider=None, ledger=None, box_name=None, stream=False):
+    """
+    Parses every message of an mbox or Maildir, one at a time, and writes one
+    JSON line per message to `out`. Only one message is held in memory.
+
+    Each key is appended to the checkpoint file after its record is written,
+    so an interrupted run resumes where it stopped. Keys are the mailbox keys
+    (positions for mbox, file names for Maildir); an mbox checkpoint is only
+    valid while the mbox is appended to and not rewritten.
+
+    With a bill ledger, messages whose bytes it already knows are skipped and
+    new bills are recorded, so the same email in another mailbox (or a
+    re-sent one) is not counted twice.
+
+    With `stream`, each message is read only as far as its text part
+    (mime_stream.py); the ledger still needs the whole message, for its hash.
+    """
+    parser_key = f"email:{PARSER_VERSION}"
+    done = load_checkpoint(checkpoint_path)
+    checkpoint = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
+    processed = skipped = failed = 0
+    try:
+        for key in box.iterkeys():
+            if str(key) in done:
+                skipped += 1
+                continue
+            with timings.record(str(key)) as stage_timings:
+                try:
+                    record = read_mailbox_message(box, key, provider, ledger, parser_key, stream)
+                    if record is None:
+                        skipped += 1
+                        continue
+                    digest = record.pop("digest", None)
+                    if "error" in record["data"]:
+                        failed += 1
+                    elif ledger:
+                        ledger.add(digest, f"{box_name}:{key}" if box_name else str(key), "email", record["data"]["company"], parser_key, record["data"])
+                except Exception as e:
+                    record = {"key": str(key), "error": f"{type(e).__name__}: {e}"}
+                    failed += 1
+                with timings.stage("serialize"):
+                    line = json.dumps(record, ensure_ascii=False)
+            out.write(line + "\n")
+            if stage_timings is not None:
+                out.write(json.dumps({"key": str(key), "timings": stage_timings.as_dict()}, ensure_ascii=False) + "\n")
+            out.flush()
+            if checkpoint:
+                checkpoint.write(f"{key}\n")
+                checkpoint.flush()
+            processed += 1
+    finally:
+        if checkpoint:
+            checkpoint.close()
+        if ledger:
+            ledger.flush()
+    print(f"Processed {processed} messages ({failed} without bill data), skipped {skipped} from checkpoint or ledger.", file=sys.stderr)
+
+def ingest_imap(target, out, state_path=None, provider=None, ledger=None, senders=None, connections=None):
+    """
+    Fetches the new bill notices of an IMAP mailbox (imap_fetch.py) and
+    writes one JSON line per message to `out`, as ingest_mailbox() does; keys
+    are UIDs. Only the text part of each notice is downloaded, over a few
+    concurrent connections, and each message is parsed as soon as its chunk
+    arrives.
 
-    return json.dumps(data, ensure_ascii=False, indent=4)
+    The state file keeps the mailbox's UIDVALIDITY and the highest UID
+    handled, so the next run only searches after it. Without a state file
+    every run reads all the notices in the mailbox.
+    """
+    import asyncio
+    import imap_fetch # only the IMAP mode needs it
+
+    parser_key = f"email:{PARSER_VERSION}"
+    key = imap_fetch.display_url(target)
+    uidvalidity, start = imap_fetch.load_state(state_path, key)
+    counts = {"processed": 0, "failed": 0, "skipped": 0}
+
+    async def run():
+        async with imap_fetch.ImapFetcher(target, senders or imap_fetch.DEFAULT_SENDERS,
+                                          connections or imap_fetch.DEFAULT_CONNECTIONS) as fetcher:
+            current_uidvalidity, uids = await fetcher.search(start, uidvalidity)
+            watermark = imap_fetch.Watermark(start if current_uidvalidity == uidvalidity else 0, uids)
+            try:
+                async for message in fetcher.messages(uids):
+                    write_imap_message(message, out, provider, ledger, parser_key, key, counts)
+                    watermark.done(message.uid)
+                if uids:
+                    watermark.value = uids[-1] # messages deleted since the search are done too
+            finally:
+                if state_path and current_uidvalidity is not None:
+                    imap_fetch.save_state(state_path, key, current_uidvalidity, watermark.value)
+                if ledger:
+                    ledger.flush()
+            return len(uids), len(fetcher.opened), fetcher.bytes_received, watermark.value
+
+    found, opened, received, watermark = asyncio.run(run())
+    print(f"Processed {counts['processed']} of {found} new messages ({counts['failed']} without bill data), "
+          f"skipped {counts['skipped']} from the ledger; {received / 1024:.1f} KiB over {opened} connection(s), "
+          f"UID watermark {watermark}.", file=sys.stderr)
+
+def write_imap_message(message, out, provider, ledger, parser_key, source, counts):
+    with timings.record(str(message.uid)) as stage_timings:
+        record = {"key": str(message.uid), "messageId": message.message_id}
+        digest = None
+        if ledger and message.text is not None:
+            with timings.stage("ledger"):
+                digest = content_hash(message.text.encode("utf-8"))
+                if ledger.lookup(digest, parser_key) is not None:
+                    counts["skipped"] += 1
+                    return
+        record["data"] = parse_text(message.text, provider)
+        if "error" in record["data"]:
+            counts["failed"] += 1
+        elif ledger:
+            ledger.add(digest, f"{source}/{message.uid}", "email", record["data"]["company"], parser_key, record["data"])
+        with timings.stage("serialize"):
+            line = json.dumps(record, ensure_ascii=False)
+    out.write(line + "\n")
+    if stage_timings is not None:
+        out.write(json.dumps({"key": str(message.uid), "timings": stage_timings.as_dict()}, ensure_ascii=False) + "\n")
+    out.flush()
+    counts["processed"] += 1
 
 def get_email_content(args):
+    # Raw bytes: each part is decoded in its own charset, not the whole file as UTF-8.
     if args.file:
-        with open(args.file, "r", encoding="utf-8") as f:
+        with open(args.file, "rb") as f:
             return f.read()
     else:
-        return sys.stdin.read()
+        return sys.stdin.buffer.read()
+
+def parse_single(args):
+    """Parses one email (file or stdin); returns the text to print, or None on error."""
+    if args.stream:
+        # Only the headers and the text part are read (mime_stream.py).
+        message_file = open(args.file, "rb") if args.file else sys.stdin.buffer
+        try:
+            _headers, processed_content = mime_stream.read_plain_text(message_file)
+        finally:
+            if args.file:
+                message_file.close()
+    else:
+        with timings.stage("read"):
+            email_content = get_email_content(args)
+
+        with timings.stage("mime"):
+            msg = message_from_bytes(email_content)
+        with timings.stage("decode"):
+            processed_content = extract_plain_text(msg)
+
+    if processed_content is None:
+        processed_content = "" # Or handle error appropriately
+        # For now, let's assume it's an error if no plain text payload
+        if not args.debug: # Only return error if not in debug mode
+            print(json.dumps({"error": NO_TEXT_ERROR}, ensure_ascii=False, indent=4))
+            return None
+
+    if args.debug:
+        return processed_content.replace("\n", "\t").replace("\r", "\t")
+    
+    provider = "eyath" if args.eyath else "dei" if args.dei else None
+    ledger = open_ledger(args.ledger)
+    parser_key = f"email:{PARSER_VERSION}"
+    result = digest = None
+    try:
+        if ledger and (args.file or not args.stream): # a streamed stdin is not kept, so it cannot be hashed
+            with timings.stage("ledger"):
+                digest = file_hash(args.file) if args.stream else content_hash(email_content)
+                result = ledger.lookup(digest, parser_key)
+        if result is None:
+            with timings.stage("parse"):
+                result = parse_email_content(processed_content, provider)
+            if digest and "error" not in result:
+                ledger.add(digest, args.file or "-", "email", result["company"], parser_key, result)
+    finally:
+        if ledger:
+            ledger.close()
+    with timings.stage("serialize"):
+        return json.dumps(result, ensure_ascii=False, indent=4)
 
 def main():
     parser = argparse.ArgumentParser(description="Parse email content for utility data.")
     parser.add_argument("--eyath", action="store_true", help="Parse as EYATH email.")
     parser.add_argument("--dei", action="store_true", help="Parse as DEI email.")
     parser.add_argument("-d", "--debug", action="store_true", help="Print decoded content as a single line for debugging.")
+    parser.add_argument("--mbox", help="Parse every message of an mbox file (JSON Lines output).")
+    parser.add_argument("--maildir", help="Parse every message of a Maildir (JSON Lines output).")
+    parser.add_argument("--imap", metavar="URL", help="Fetch new bill notices from imap://user@host/MAILBOX or imaps://... (JSON Lines output; password in AUTO_UTILITY_IMAP_PASSWORD).")
+    parser.add_argument("--imap-connections", type=int, metavar="N", help="IMAP connections used concurrently with --imap (default: 3).")
+    parser.add_argument("--imap-from", action="append", metavar="DOMAIN", help="Sender to search for with --imap; repeatable (default: eyath.gr and dei.gr).")
+    parser.add_argument("-o", "--output", help="Append JSON Lines to this file instead of stdout (with --mbox/--maildir/--imap).")
+    parser.add_argument("--checkpoint", help="File with the keys of processed messages; lets an interrupted --mbox/--maildir run resume. With --imap: the UID watermark, so only new mail is fetched.")
+    parser.add_argument("--timings", action="store_true", help="Report wall time per stage as JSON on stderr, or as extra lines with --mbox/--maildir (or set AUTO_UTILITY_TIMINGS).")
+    parser.add_argument("--timings-mode", choices=timings.MODES, help="What --timings measures: wall (the default) or memory, which adds the peak Python memory of every stage and is slower; implies --timings.")
+    parser.add_argument("--profile", metavar="FILE", help="Write a cProfile dump of the run to FILE (or set AUTO_UTILITY_PROFILE).")
+    parser.add_argument("--ledger", metavar="FILE", help="Bill ledger: skip emails already parsed and record new bills (or set AUTO_UTILITY_LEDGER).")
+    parser.add_argument("--stream", action="store_true", help="Read each message as bytes only as far as its text part, skipping attachments (for large messages).")
     parser.add_argument("file", nargs="?", help="Path to the email file (optional, reads from stdin if not provided).")
     args = parser.parse_args()
+    if args.timings or args.timings_mode:
+        timings.enable_timings(args.timings_mode or "wall")
+    if args.profile:
+        timings.enable_profile(args.profile)
 
-    email_content = get_email_content(args)
-
-    msg = message_from_string(email_content)
-    plain_text_payload = None
-    for part in msg.walk():
-        if part.get_content_type() == "text/plain" and part.get("Content-Transfer-Encoding") == "base64":
-            plain_text_payload = part.get_payload()
-            break
-
-    if plain_text_payload is None:
-        processed_content = "" # Or handle error appropriately
-        # For now, let's assume it's an error if no plain text payload
-        if not args.debug: # Only return error if not in debug mode
-            print(json.dumps({"error": "Could not find base64 encoded plain text part."}, ensure_ascii=False, indent=4))
+    if args.imap:
+        import imaplib
+        import imap_fetch
+        try:
+            target = imap_fetch.parse_url(args.imap)
+        except ValueError as e:
+            parser.error(str(e))
+        provider = "eyath" if args.eyath else "dei" if args.dei else None
+        out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+        ledger = open_ledger(args.ledger)
+        try:
+            with timings.profiled():
+                ingest_imap(target, out, args.checkpoint, provider, ledger, args.imap_from, args.imap_connections)
+        except (OSError, imaplib.IMAP4.error) as e:
+            print(f"IMAP error: {e}", file=sys.stderr)
             sys.exit(1)
-    else:
-        processed_content = base64.b64decode(plain_text_payload).decode('utf-8').replace('>', '')
+        finally:
+            if ledger:
+                ledger.close()
+            if args.output:
+                out.close()
+        sys.exit(0)
 
-    if args.debug:
-        print(processed_content.replace("\n", "\t").replace("\r", "\t"))
+    if args.mbox or args.maildir:
+        provider = "eyath" if args.eyath else "dei" if args.dei else None
+        import mailbox # only the mailbox modes need it
+        box = mailbox.mbox(args.mbox, create=False) if args.mbox else mailbox.Maildir(args.maildir, create=False)
+        out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+        ledger = open_ledger(args.ledger)
+        try:
+            with timings.profiled():
+                ingest_mailbox(box, out, args.checkpoint, provider, ledger, args.mbox or args.maildir, args.stream)
+        finally:
+            if ledger:
+                ledger.close()
+            if args.output:
+                out.close()
         sys.exit(0)
-    
-    result = None
-    if args.eyath:
-        result = parse_eyath_email(processed_content)
-    elif args.dei:
-        result = parse_dei_email(processed_content)
-    else:
-        # Auto-detect based on content
-        if "eyath.gr" in processed_content:
-            result = parse_eyath_email(processed_content)
-        elif "dei.gr" in processed_content:
-            result = parse_dei_email(processed_content)
-        else:
-            result = json.dumps({"error": "Could not determine email type. Use --eyath or --dei, or ensure 'eyath.gr' or 'dei.gr' is in the email content."}, ensure_ascii=False, indent=4)
-    
-    print(result)
+
+    with timings.profiled(), timings.record(args.file or "-") as record:
+        result = parse_single(args)
+    if result is not None:
+        print(result)
+    timings.emit(record)
+    if result is None:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
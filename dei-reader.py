@@ -1,10 +1,19 @@
 
-from pypdf import PdfReader
-import datetime
-import os
 import argparse
 import re
 import json
+import sys
+from extraction_cache import cached_extract_and_parse, enable_cache
+import text_backends
+import timings
+
+PARSER_VERSION = 1 # Αύξηση σε κάθε αλλαγή των regex, ώστε να ακυρώνεται η cache των αποτελεσμάτων
+
+# Μεταγλωττίζονται μία φορά, κατά τη φόρτωση
+AMOUNT_PATTERN = re.compile(r"ΠΟΣΟ ΠΛΗΡΩΜΗΣ\s*\*\s*([\d.,]+)\s*€")
+RF_PATTERN = re.compile(r"(RF\d{20,})")
+DUE_DATE_PATTERN = re.compile(r"ΕΞΟΦΛΗΣΗ ΕΩΣ\s*\n\s*([\d./]+)")
+NEXT_READING_PATTERN = re.compile(r"Επόμενη καταμέτρηση\s*\n\s*([\d./]+)")
 
 def extract_text_from_pdf(pdf_path):
     """
@@ -16,42 +25,32 @@ def extract_text_from_pdf(pdf_path):
     Returns:
         str: Το εξαγόμενο κείμενο από το PDF.
     """
-    text = ""
     try:
-        reader = PdfReader(pdf_path)
-        num_pages = len(reader.pages)
-
-        for page_num in range(num_pages):
-            page = reader.pages[page_num]
-            text += page.extract_text() + "\n" # Προσθέτουμε αλλαγή γραμμής μεταξύ των σελίδων
-        return text
+        return read_pdf_text(pdf_path)
     except Exception as e:
         return f"Σφάλμα κατά την ανάγνωση του PDF: {e}"
 
-# Χρήση της συνάρτησης
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Εξαγωγή κειμένου από αρχείο PDF.")
-    # Αλλαγή: Ορισμός του ορίσματος ως positional (χωρίς -o ή --output)
-    parser.add_argument("pdf_file_path", help="Η διαδρομή προς το αρχείο PDF που θα διαβαστεί.")
-    args = parser.parse_args()
-
-    pdf_file = args.pdf_file_path # Πρόσβαση στο όρισμα με το όνομά του
-
-    extracted_content = extract_text_from_pdf(pdf_file)
+def read_pdf_text(pdf_path):
+    """
+    Όπως η extract_text_from_pdf, αλλά αφήνει τα σφάλματα να περάσουν στον καλούντα.
+    Το κείμενο εξάγεται από το ενεργό backend (text_backends.py), με αλλαγή γραμμής μετά από κάθε σελίδα.
+    """
+    return text_backends.read_text(pdf_path)
 
+def parse_dei_text(extracted_content):
     # Εξαγωγή πληροφοριών
     data = {}
 
     # 1. ΠΟΣΟ ΠΛΗΡΩΜΗΣ
     # Regex: "ΠΟΣΟ ΠΛΗΡΩΜΗΣ" ακολουθούμενο από *, κενά, το ποσό (αριθμοί, κόμματα, τελείες) και €
-    match_amount = re.search(r"ΠΟΣΟ ΠΛΗΡΩΜΗΣ\s*\*\s*([\d.,]+)\s*€", extracted_content)
+    match_amount = AMOUNT_PATTERN.search(extracted_content)
     if match_amount:
         data["amountToPay"] = match_amount.group(1)
 
     # 2. Κωδικός ηλεκτρονικής πληρωμής (RF)
     # Regex: RF ακολουθούμενο από 20 ή περισσότερα ψηφία (ή όσα είναι συνήθως)
     # Θα πρέπει να είναι πιο συγκεκριμένο αν υπάρχουν άλλα RF στο κείμενο
-    match_rf = re.search(r"(RF\d{20,})", extracted_content)
+    match_rf = RF_PATTERN.search(extracted_content)
     if match_rf:
         data["RFcode"] = match_rf.group(1)
         # 5. Αριθμός Συμβολαίου (Contract Number)
@@ -60,17 +59,50 @@ if __name__ == "__main__":
 
     # 3. ΕΞΟΦΛΗΣΗ ΕΩΣ (ημερομηνία στην επόμενη γραμμή)
     # Regex: "ΕΞΟΦΛΗΣΗ ΕΩΣ" ακολουθούμενο από οτιδήποτε μέχρι την επόμενη γραμμή, και μετά την ημερομηνία
-    match_due_date = re.search(r"ΕΞΟΦΛΗΣΗ ΕΩΣ\s*\n\s*([\d./]+)", extracted_content)
+    match_due_date = DUE_DATE_PATTERN.search(extracted_content)
     if match_due_date:
         data["paymentDue"] = match_due_date.group(1)
 
     # 4. Επόμενη καταμέτρηση (ημερομηνία στην επόμενη γραμμή)
     # Regex: "Επόμενη καταμέτρηση" ακολουθούμενο από οτιδήποτε μέχρι την επόμενη γραμμή, και μετά την ημερομηνία
-    match_next_reading = re.search(r"Επόμενη καταμέτρηση\s*\n\s*([\d./]+)", extracted_content)
+    match_next_reading = NEXT_READING_PATTERN.search(extracted_content)
     if match_next_reading:
         data["nextMeasurement"] = match_next_reading.group(1)
+    return data
+
+def process_pdf_file(pdf_path):
+    """Τα πεδία ενός PDF της ΔΕΗ, μέσω της cache εξαγωγής όταν είναι ενεργή (extraction_cache.py)."""
+    return cached_extract_and_parse(pdf_path, read_pdf_text, timings.timed("parse", parse_dei_text), f"dei-reader:{PARSER_VERSION}")
+
+# Χρήση της συνάρτησης
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Εξαγωγή κειμένου από αρχείο PDF.")
+    # Αλλαγή: Ορισμός του ορίσματος ως positional (χωρίς -o ή --output)
+    parser.add_argument("pdf_file_path", help="Η διαδρομή προς το αρχείο PDF που θα διαβαστεί.")
+    parser.add_argument("--cache", metavar="DIR", help="Φάκελος της cache εξαγωγής κειμένου (ή μεταβλητή AUTO_UTILITY_CACHE).")
+    parser.add_argument("--timings", action="store_true", help="Χρόνος ανά στάδιο σε JSON στο stderr (ή μεταβλητή AUTO_UTILITY_TIMINGS).")
+    parser.add_argument("--timings-mode", choices=timings.MODES, help="Τι μετράει το --timings: wall (προεπιλογή) ή memory, που προσθέτει τη μέγιστη μνήμη Python κάθε σταδίου και είναι πιο αργό· ενεργοποιεί και το --timings.")
+    parser.add_argument("--profile", metavar="FILE", help="Αποθήκευση προφίλ cProfile της εκτέλεσης στο FILE (ή μεταβλητή AUTO_UTILITY_PROFILE).")
+    args = parser.parse_args()
+
+    pdf_file = args.pdf_file_path # Πρόσβαση στο όρισμα με το όνομά του
+    if args.cache:
+        enable_cache(args.cache)
+    if args.timings or args.timings_mode:
+        timings.enable_timings(args.timings_mode or "wall")
+    if args.profile:
+        timings.enable_profile(args.profile)
+
+    with timings.profiled(), timings.record(pdf_file) as record:
+        try:
+            data = process_pdf_file(pdf_file)
+        except Exception as e:
+            print(f"Σφάλμα κατά την ανάγνωση του PDF: {e}", file=sys.stderr)
+            data = {} # όπως πριν: κανένα πεδίο από ένα PDF που δεν διαβάζεται
 
-    
+        with timings.stage("serialize"):
+            output = json.dumps(data, ensure_ascii=False, indent=4)
 
     # Εμφάνιση των δεδομένων σε μορφή JSON
-    print(json.dumps(data, ensure_ascii=False, indent=4))
+    print(output)
+    timings.emit(record)
@@ -1,10 +1,27 @@
 
-from pypdf import PdfReader
-import datetime
-import os
 import argparse
 import re
 import json
+import sys
+from functools import partial
+from batch_runner import expand_inputs, is_batch_request, run_batch, print_batch_results
+from extraction_cache import cached_extract_and_parse, default_cache, enable_cache
+from page_extract import DEFAULT_MAX_PAGES, DEFAULT_PARALLEL_MIN_PAGES, read_pages_parallel, read_pages_until
+from bill_ledger import open_ledger
+from region_extract import layout_parser_key, process_layout_file
+import bill_rules
+import text_backends
+import timings
+
+PARSER_VERSION = 1 # Αύξηση σε κάθε αλλαγή των regex, ώστε να ακυρώνεται η cache των αποτελεσμάτων
+
+def read_pdf_text(pdf_path):
+    """
+    Όπως η extract_text_from_pdf, αλλά αφήνει τα σφάλματα να περάσουν στον καλούντα
+    (χρησιμοποιείται στη μαζική επεξεργασία για αναφορά σφάλματος ανά αρχείο).
+    Το κείμενο εξάγεται από το ενεργό backend (text_backends.py), με αλλαγή γραμμής μετά από κάθε σελίδα.
+    """
+    return text_backends.read_text(pdf_path)
 
 def extract_text_from_pdf(pdf_path):
     """
@@ -16,57 +33,50 @@ def extract_text_from_pdf(pdf_path):
     Returns:
         str: Το εξαγόμενο κείμενο από το PDF.
     """
-    text = ""
     try:
-        reader = PdfReader(pdf_path)
-        num_pages = len(reader.pages)
-
-        for page_num in range(num_pages):
-            page = reader.pages[page_num]
-            text += page.extract_text() + "\n" # Προσθέτουμε αλλαγή γραμμής μεταξύ των σελίδων
-        return text
+        return read_pdf_text(pdf_path)
     except Exception as e:
         return f"Σφάλμα κατά την ανάγνωση του PDF: {e}"
 
 # Χρήση της συνάρτησης
-def extract_rf_code(extracted_content):
+def extract_rf_code(extracted_content, scanned=None):
     rf_data = {}
-    match_rf = re.search(r"(RF\d{20,})", extracted_content)
-    if match_rf:
-        rf_data["RFcode"] = match_rf.group(1)
+    # RF ακολουθούμενο από 20 ή περισσότερα ψηφία ("RFcode" στους κανόνες του bill_rules.py)
+    fields = bill_rules.extract("dei_pdf", extracted_content, scanned)
+    if "RFcode" in fields:
+        rf_data["RFcode"] = fields["RFcode"]
         rf_data["contractNumber"] = rf_data["RFcode"][-12:]
     return rf_data
 
 def parse_dei_data(extracted_content):
     data = {}
-    # 1. ΠΟΣΟ ΠΛΗΡΩΜΗΣ
-    # Regex: "ΠΟΣΟ ΠΛΗΡΩΜΗΣ" ακολουθούμενο από *, κενά, το ποσό (αριθμοί, κόμματα, τελείες) και €
-    match_amount = re.search(r"ΠΟΣΟ ΠΛΗΡΩΜΗΣ\s*\*\s*([\d.,]+)\s*€", extracted_content)
-    if match_amount:
-        data["amountToPay"] = match_amount.group(1)
-
-    # 2. Κωδικός ηλεκτρονικής πληρωμής (RF) and Contract Number
-    rf_data = extract_rf_code(extracted_content)
-    data.update(rf_data)
-
+    # Όλα τα πεδία βρίσκονται με ένα πέρασμα του κειμένου (κανόνες "dei_pdf" στο bill_rules.py):
+    # 1. ΠΟΣΟ ΠΛΗΡΩΜΗΣ: "ΠΟΣΟ ΠΛΗΡΩΜΗΣ" ακολουθούμενο από *, κενά, το ποσό και €
+    # 2. Κωδικός ηλεκτρονικής πληρωμής (RF) και Contract Number
     # 3. ΕΞΟΦΛΗΣΗ ΕΩΣ (ημερομηνία στην επόμενη γραμμή)
-    # Regex: "ΕΞΟΦΛΗΣΗ ΕΩΣ" ακολουθούμενο από οτιδήποτε μέχρι την επόμενη γραμμή, και μετά την ημερομηνία
-    match_due_date = re.search(r"ΕΞΟΦΛΗΣΗ ΕΩΣ\s*\n\s*([\d./]+)", extracted_content)
-    if match_due_date:
-        data["paymentDue"] = match_due_date.group(1)
-
     # 4. Επόμενη καταμέτρηση (ημερομηνία στην επόμενη γραμμή)
-    # Regex: "Επόμενη καταμέτρηση" ακολουθούμενο από οτιδήποτε μέχρι την επόμενη γραμμή, και μετά την ημερομηνία
-    match_next_reading = re.search(r"Επόμενη καταμέτρηση\s*\n\s*([\d./]+)", extracted_content)
-    if match_next_reading:
-        data["nextMeasurement"] = match_next_reading.group(1)
+    scanned = bill_rules.scan(extracted_content)
+    fields = bill_rules.extract("dei_pdf", extracted_content, scanned)
+    if "amountToPay" in fields:
+        data["amountToPay"] = fields["amountToPay"]
+
+    data.update(extract_rf_code(extracted_content, scanned))
+
+    if "paymentDue" in fields:
+        data["paymentDue"] = fields["paymentDue"]
+    if "nextMeasurement" in fields:
+        data["nextMeasurement"] = fields["nextMeasurement"]
     return data
 
+# Ποσό: αριθμοί με κόμμα/τελεία ακολουθούμενοι από €. Δεν είναι κανόνας του bill_rules.py,
+# γιατί αναζητείται μόνο μετά την ημερομηνία πληρωμής (σύντομη αναζήτηση, όχι σάρωση όλου του κειμένου).
+ZENITH_AMOUNT_PATTERN = re.compile(r"([\d.,]+)\s*€")
+
 def parse_zenith_data(extracted_content):
     data = {}
-    # Regex to find dates in DD/MM/YYYY format
-    date_pattern = r"\d{2}/\d{2}/\d{4}"
-    all_dates = re.findall(date_pattern, extracted_content)
+    # Ημερομηνίες σε μορφή DD/MM/YYYY και RF με ένα πέρασμα (κανόνες "zenith_pdf" στο bill_rules.py)
+    scanned = bill_rules.scan(extracted_content)
+    all_dates = bill_rules.extract("zenith_pdf", extracted_content, scanned)["dates"]
 
     # Check if there are at least 5 dates
     if len(all_dates) >= 5:
@@ -75,11 +85,8 @@ def parse_zenith_data(extracted_content):
         due_payment_index = extracted_content.find(data["paymentDue"])
         if due_payment_index != -1:
             # Search for amount after the duePayment date
-            # Regex for amount: numbers with optional comma/dot for decimals, followed by €
-            amount_pattern = r"([\d.,]+)\s*€"
             # Search only in the part of the string after the duePayment date
-            search_area = extracted_content[due_payment_index + len(data["paymentDue"]):]
-            match_amount = re.search(amount_pattern, search_area)
+            match_amount = ZENITH_AMOUNT_PATTERN.search(extracted_content, due_payment_index + len(data["paymentDue"]))
             if match_amount:
                 data["amountToPay"] = match_amount.group(1)
             else:
@@ -91,32 +98,128 @@ def parse_zenith_data(extracted_content):
         data["amountToPay"] = "Not found" # If duePayment not found, amount also not found
 
     # RFcode and Contract Number
-    rf_data = extract_rf_code(extracted_content)
+    rf_data = extract_rf_code(extracted_content, scanned)
     data.update(rf_data)
 
     return data
 
+def dei_fields_complete(extracted_content):
+    """Αληθές όταν το κείμενο που διαβάστηκε ως τώρα περιέχει όλα τα πεδία της ΔΕΗ."""
+    data = parse_dei_data(extracted_content)
+    return all(field in data for field in ("amountToPay", "RFcode", "paymentDue", "nextMeasurement"))
+
+def zenith_fields_complete(extracted_content):
+    """Αληθές όταν το κείμενο που διαβάστηκε ως τώρα περιέχει όλα τα πεδία της Zenith."""
+    data = parse_zenith_data(extracted_content)
+    return data["paymentDue"] != "Not found" and data["amountToPay"] != "Not found" and "RFcode" in data
+
+def _extractor(is_complete, early_exit, max_pages, page_jobs=None, parallel_min_pages=DEFAULT_PARALLEL_MIN_PAGES):
+    if early_exit:
+        return partial(read_pages_until, is_complete=is_complete, max_pages=max_pages)
+    if page_jobs:
+        return partial(read_pages_parallel, jobs=page_jobs, min_pages=parallel_min_pages)
+    return read_pdf_text
+
+def process_dei_file(pdf_path, early_exit=False, max_pages=DEFAULT_MAX_PAGES, page_jobs=None, parallel_min_pages=DEFAULT_PARALLEL_MIN_PAGES):
+    """
+    Εργάτης μαζικής επεξεργασίας για PDF της ΔΕΗ (περνά από την cache αν είναι ενεργή).
+    Με early_exit σταματά στην πρώτη σελίδα όπου έχουν βρεθεί όλα τα πεδία.
+    Με page_jobs, ένα PDF με τουλάχιστον parallel_min_pages σελίδες διαβάζεται από τόσες διεργασίες.
+    """
+    extract = _extractor(dei_fields_complete, early_exit, max_pages, page_jobs, parallel_min_pages)
+    return cached_extract_and_parse(pdf_path, extract, timings.timed("parse", parse_dei_data), f"dei:{PARSER_VERSION}", cache_text=not early_exit)
+
+def process_zenith_file(pdf_path, early_exit=False, max_pages=DEFAULT_MAX_PAGES, page_jobs=None, parallel_min_pages=DEFAULT_PARALLEL_MIN_PAGES):
+    """
+    Εργάτης μαζικής επεξεργασίας για PDF της Zenith (περνά από την cache αν είναι ενεργή).
+    Με early_exit σταματά στην πρώτη σελίδα όπου έχουν βρεθεί όλα τα πεδία.
+    Με page_jobs, ένα PDF με τουλάχιστον parallel_min_pages σελίδες διαβάζεται από τόσες διεργασίες.
+    """
+    extract = _extractor(zenith_fields_complete, early_exit, max_pages, page_jobs, parallel_min_pages)
+    return cached_extract_and_parse(pdf_path, extract, timings.timed("parse", parse_zenith_data), f"zenith:{PARSER_VERSION}", cache_text=not early_exit)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Εξαγωγή κειμένου από αρχείο PDF.")
-    parser.add_argument("pdf_file_path", help="Η διαδρομή προς το αρχείο PDF που θα διαβαστεί.")
+    parser.add_argument("pdf_file_paths", nargs="+", help="Αρχεία PDF, φάκελοι ή μοτίβα glob. Με περισσότερα από ένα ενεργοποιείται η μαζική επεξεργασία (μία γραμμή JSON ανά αρχείο).")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Πλήθος διεργασιών στη μαζική επεξεργασία (προεπιλογή: πλήθος CPU).")
+    parser.add_argument("--cache", metavar="DIR", help="Φάκελος της cache εξαγωγής κειμένου (ή μεταβλητή AUTO_UTILITY_CACHE).")
+    parser.add_argument("--early-exit", action="store_true", help="Ανάγνωση ανά σελίδα· σταματά μόλις βρεθούν όλα τα πεδία.")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES, help="Σελίδες που ελέγχονται μία-μία με --early-exit πριν την πλήρη ανάγνωση (προεπιλογή: %(default)s).")
+
+    parser.add_argument("--timings", action="store_true", help="Χρόνος ανά στάδιο σε JSON στο stderr, ή ως επιπλέον γραμμές στη μαζική επεξεργασία (ή μεταβλητή AUTO_UTILITY_TIMINGS).")
+    parser.add_argument("--timings-mode", choices=timings.MODES, help="Τι μετράει το --timings: wall (προεπιλογή) ή memory, που προσθέτει τη μέγιστη μνήμη Python κάθε σταδίου και είναι πιο αργό· ενεργοποιεί και το --timings.")
+    parser.add_argument("--profile", metavar="FILE", help="Αποθήκευση προφίλ cProfile μιας εκτέλεσης στο FILE (ή μεταβλητή AUTO_UTILITY_PROFILE).")
+    parser.add_argument("--ledger", metavar="FILE", help="Βιβλίο λογαριασμών: παράλειψη PDF που έχουν ήδη διαβαστεί και καταγραφή των νέων (ή μεταβλητή AUTO_UTILITY_LEDGER).")
+    parser.add_argument("--layout", action="store_true", help="Πειραματικό: ανάγνωση κάθε πεδίου από τη δική του περιοχή της πρώτης σελίδας (region_extract.py) αντί για όλο το κείμενο. Οι περιοχές ταιριάζουν μόνο στους συνθετικούς λογαριασμούς, οπότε οι άλλοι διαβάζονται δύο φορές (περιοχές, μετά κείμενο)· μόνο για μεμονωμένα αρχεία.")
+    parser.add_argument("--pdf-backend", choices=text_backends.CHOICES, help="Backend εξαγωγής κειμένου PDF (text_backends.py· προεπιλογή: το ταχύτερο από pypdf και pypdfium2, το pdftotext μόνο όταν ζητηθεί ρητά· ή μεταβλητή AUTO_UTILITY_PDF_BACKEND).")
+    parser.add_argument("--page-jobs", type=int, default=None, help="Ανάγνωση των σελίδων ενός μεγάλου PDF από τόσες διεργασίες (η μαζική επεξεργασία ήδη διαβάζει ένα αρχείο ανά διεργασία).")
+    parser.add_argument("--parallel-min-pages", type=int, default=DEFAULT_PARALLEL_MIN_PAGES, help="Ελάχιστες σελίδες ενός PDF για να χρησιμοποιηθεί το --page-jobs (προεπιλογή: %(default)s).")
 
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("--dei", action="store_true", help="Επεξεργασία αρχείου PDF της ΔΕΗ.")
     group.add_argument("--zenith", action="store_true", help="Επεξεργασία αρχείου PDF της Zenith.")
 
     args = parser.parse_args()
+    if args.layout and is_batch_request(args.pdf_file_paths):
+        parser.error("το --layout είναι πειραματικό και διαβάζει μόνο μεμονωμένα αρχεία")
+
+    if args.pdf_backend:
+        try:
+            text_backends.select_backend(args.pdf_backend)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.cache:
+        enable_cache(args.cache)
+    if args.timings or args.timings_mode:
+        timings.enable_timings(args.timings_mode or "wall")
+    if args.profile:
+        timings.enable_profile(args.profile)
+    worker = partial(process_dei_file if args.dei else process_zenith_file,
+                     early_exit=args.early_exit, max_pages=args.max_pages)
+    provider = "dei" if args.dei else "zenith"
+    parser_key = f"{provider}:{PARSER_VERSION}"
+    if args.layout:
+        worker = partial(process_layout_file, provider=provider, fallback=worker)
+        parser_key = layout_parser_key(provider)
+    ledger = open_ledger(args.ledger)
+
+    if is_batch_request(args.pdf_file_paths):
+        pdf_paths = expand_inputs(args.pdf_file_paths)
+        if ledger:
+            pdf_paths, hashes, skipped = ledger.skip_known(pdf_paths, parser_key)
+            print(f"Παράλειψη {skipped} αρχείων PDF που υπάρχουν ήδη στο βιβλίο λογαριασμών", file=sys.stderr)
+        print(f"Μαζική επεξεργασία {len(pdf_paths)} αρχείων PDF", file=sys.stderr)
+        results = run_batch(worker, pdf_paths, args.jobs)
+        if ledger:
+            results = ledger.record_results(results, hashes, provider, parser_key)
+        failures = print_batch_results(results)
+        sys.exit(1 if failures else 0)
+
+    pdf_file = args.pdf_file_paths[0]
+    if args.page_jobs and not args.layout:
+        worker = partial(worker, page_jobs=args.page_jobs, parallel_min_pages=args.parallel_min_pages)
+
+    with timings.profiled(), timings.record(pdf_file) as record:
+        if ledger:
+            with timings.stage("ledger"):
+                data = ledger.parse_once(pdf_file, provider, parser_key, worker)
+        elif default_cache() is not None or args.early_exit or args.layout or args.page_jobs:
+            data = worker(pdf_file)
+        else:
+            extracted_content = extract_text_from_pdf(pdf_file)
 
-    pdf_file = args.pdf_file_path
-
-    extracted_content = extract_text_from_pdf(pdf_file)
+            with timings.stage("parse"):
+                if args.dei:
+                    data = parse_dei_data(extracted_content)
+                elif args.zenith:
+                    data = parse_zenith_data(extracted_content)
+                else:
+                    data = {} # Should not happen due to required=True in mutually exclusive group
 
-    if args.dei:
-        data = parse_dei_data(extracted_content)
-    elif args.zenith:
-        data = parse_zenith_data(extracted_content)
-    else:
-        data = {} # Should not happen due to required=True in mutually exclusive group
+        with timings.stage("serialize"):
+            output = json.dumps(data, ensure_ascii=False, indent=4)
 
     # Εμφάνιση των δεδομένων σε μορφή JSON
-    print(json.dumps(data, ensure_ascii=False, indent=4))
+    print(output)
+    timings.emit(record)
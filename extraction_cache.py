@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache for PDF text extraction, shared by all PDF readers.
+
+Entries are keyed by the SHA-256 of the PDF bytes. There are two layers:
+
+    text    the raw extracted text, keyed by content hash + extractor version
+    parsed  the parsed fields (JSON), keyed additionally by parser name and
+            parser version
+
+so bumping a reader's PARSER_VERSION after a regex fix re-runs only the
+parser over the cached text and never opens the PDF again.
+
+Everything lives in one SQLite file, which keeps concurrent batch workers
+safe. Total size is bounded; the least recently used entries are evicted
+first, a batch at a time, down to EVICT_TO of the budget. A lookup only
+reads: the hit/miss counters and last-access times it changes are kept in
+memory and written with the next put, every FLUSH_EVERY lookups, by stats()
+and on close().
+
+The cache is off unless a directory is given, either with the readers'
+--cache option or the AUTO_UTILITY_CACHE environment variable.
+"""
+import argparse
+import io
+import json
+import os
+import threading
+import time
+import timings
+
+EXTRACTOR_REVISION = 3 # Bump when the way text is pulled out of the PDF (or normalized) changes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+EVICT_TO = 0.9 # eviction frees entries until the cache is at 90% of its budget
+FLUSH_EVERY = 100 # lookups between two writes of the counters and access times
+CACHE_ENV = "AUTO_UTILITY_CACHE"
+CACHE_SIZE_ENV = "AUTO_UTILITY_CACHE_MAX_MB"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    layer TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (layer, key)
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    layer TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+-- Filled once from the entries of a cache made before the running totals
+INSERT OR IGNORE INTO totals (id, entries, bytes)
+    SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE NOT EXISTS (SELECT 1 FROM totals);
+"""
+
+_extractor_version = None
+_default_cache = None
+
+
+def extractor_version():
+    """Active text backend (text_backends.py) and its version plus our own revision."""
+    global _extractor_version
+    if _extractor_version is None:
+        import text_backends
+        backend = text_backends.active_backend()
+        _extractor_version = f"{backend}-{text_backends.backend_version(backend)}-r{EXTRACTOR_REVISION}"
+    return _extractor_version
+
+
+def content_hash(content):
+    import hashlib
+    return hashlib.sha256(content).hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "extraction-cache.sqlite3")
+        self.max_bytes = max_bytes
+        # One connection per process, shared by bill-daemon's threads under a lock.
+        self.lock = threading.Lock()
+        self.counts = {} # layer -> [hits, misses] not written yet
+        self.accessed = {} # (layer, key) -> last access time not written yet
+        self.lookups = 0
+        import sqlite3
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(_SCHEMA)
+
+    def _get(self, layer, key):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM entries WHERE layer = ? AND key = ?", (layer, key)).fetchone()
+            self.counts.setdefault(layer, [0, 0])[row is None] += 1
+            if row is not None:
+                self.accessed[(layer, key)] = time.time()
+            self.lookups += 1
+            if self.lookups >= FLUSH_EVERY:
+                with self.db:
+                    self._write_lookups()
+        return None if row is None else row[0]
+
+    def _put(self, layer, key, value):
+        size = len(value.encode("utf-8"))
+        with self.lock, self.db:
+            self._write_lookups()
+            old = self.db.execute("SELECT size FROM entries WHERE layer = ? AND key = ?", (layer, key)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO entries (layer, key, value, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                            (layer, key, value, size, time.time()))
+            entries, total = self._add_totals(0 if old else 1, size - (old[0] if old else 0))
+            if total > self.max_bytes:
+                self._evict(entries, total)
+
+    def _write_lookups(self):
+        """Writes the counters and access times of the lookups since the last write (inside a transaction)."""
+        for layer, (hits, misses) in self.counts.items():
+            self.db.execute("INSERT OR IGNORE INTO stats (layer) VALUES (?)", (layer,))
+            self.db.execute("UPDATE stats SET hits = hits + ?, misses = misses + ? WHERE layer = ?", (hits, misses, layer))
+        self.db.executemany("UPDATE entries SET last_access = ? WHERE layer = ? AND key = ?",
+                            [(accessed, layer, key) for (layer, key), accessed in self.accessed.items()])
+        self.counts.clear()
+        self.accessed.clear()
+        self.lookups = 0
+
+    def _add_totals(self, entries, size):
+        self.db.execute("UPDATE totals SET entries = entries + ?, bytes = bytes + ? WHERE id = 0", (entries, size))
+        return self.db.execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+
+    def _evict(self, entries, total):
+        """Deletes the least recently used entries, a batch sized from the average entry, until the total is at EVICT_TO."""
+        target = int(self.max_bytes * EVICT_TO)
+        while total > target and entries > 0:
+            count = max(1, -(-(total - target) * entries // total)) # ceil(excess / average size)
+            oldest = "SELECT rowid, size FROM entries ORDER BY last_access LIMIT ?"
+            freed, deleted = self.db.execute(f"SELECT COALESCE(SUM(size), 0), COUNT(*) FROM ({oldest})", (count,)).fetchone()
+            self.db.execute(f"DELETE FROM entries WHERE rowid IN (SELECT rowid FROM ({oldest}))", (count,))
+            entries, total = self._add_totals(-deleted, -freed)
+
+    def get_text(self, digest):
+        return self._get("text", f"{digest}:{extractor_version()}")
+
+    def put_text(self, digest, text):
+        self._put("text", f"{digest}:{extractor_version()}", text)
+
+    def get_parsed(self, digest, parser_key):
+        value = self._get("parsed", f"{digest}:{extractor_version()}:{parser_key}")
+        return None if value is None else json.loads(value)
+
+    def put_parsed(self, digest, parser_key, data):
+        self._put("parsed", f"{digest}:{extractor_version()}:{parser_key}", json.dumps(data, ensure_ascii=False))
+
+    def flush(self):
+        """Writes the pending counters and access times."""
+        with self.lock, self.db:
+            self._write_lookups()
+
+    def stats(self):
+        self.flush()
+        result = {"entries": 0, "bytes": 0, "maxBytes": self.max_bytes}
+        result["entries"], result["bytes"] = self.db.execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+        for layer, hits, misses in self.db.execute("SELECT layer, hits, misses FROM stats ORDER BY layer"):
+            result[layer] = {"hits": hits, "misses": misses}
+        return result
+
+    def clear(self):
+        with self.lock, self.db:
+            self.counts.clear()
+            self.accessed.clear()
+            self.db.execute("DELETE FROM entries")
+            self.db.execute("DELETE FROM stats")
+            self.db.execute("UPDATE totals SET entries = 0, bytes = 0 WHERE id = 0")
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+def enable_cache(cache_dir):
+    """Turns the cache on for this process and for worker processes it starts."""
+    global _default_cache
+    os.environ[CACHE_ENV] = cache_dir
+    _default_cache = None
+
+
+def default_cache():
+    """The cache configured through AUTO_UTILITY_CACHE, or None when caching is off."""
+    global _default_cache
+    cache_dir = os.environ.get(CACHE_ENV)
+    if not cache_dir:
+        return None
+    if _default_cache is None:
+        max_mb = os.environ.get(CACHE_SIZE_ENV)
+        max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+        _default_cache = ExtractionCache(cache_dir, max_bytes)
+    return _default_cache
+
+
+def _read_source(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, "read"):
+        return source.read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def cached_extract_and_parse(source, extract, parse, parser_key, cache=None, cache_text=True, text_layer=True):
+    """
+    Returns parse(extract(source)), going through the cache when it is on.
+
+    `source` is a path, bytes or a binary stream. `extract` receives a binary
+    stream and must return the raw text; `parse` receives that text.
+    `parser_key` names the parser and its version, e.g. "dei:1".
+    Pass cache_text=False when `extract` may stop before the last page: the
+    text layer only holds full-document text, though it is still read.
+    Pass text_layer=False when `extract` does not return the document's text
+    at all (region_extract.py): the text layer is then neither read nor
+    written.
+    """
+    cache = cache or default_cache()
+    if cache is None:
+        return parse(extract(source))
+
+    with timings.stage("cache"):
+        content = _read_source(source)
+        digest = content_hash(content)
+        data = cache.get_parsed(digest, parser_key)
+        if data is not None:
+            return data
+        text = cache.get_text(digest) if text_layer else None
+    if text is None:
+        text = extract(io.BytesIO(content))
+        if cache_text and text_layer:
+            with timings.stage("cache"):
+                cache.put_text(digest, text)
+    data = parse(text)
+    with timings.stage("cache"):
+        cache.put_parsed(digest, parser_key, data)
+    return data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the PDF extraction cache.")
+    parser.add_argument("cache_dir", nargs="?", default=os.environ.get(CACHE_ENV), help="Cache directory (default: $AUTO_UTILITY_CACHE).")
+    parser.add_argument("--clear", action="store_true", help="Remove every entry and reset the counters.")
+    args = parser.parse_args()
+    if not args.cache_dir:
+        parser.error("no cache directory given and AUTO_UTILITY_CACHE is not set")
+
+    cache = ExtractionCache(args.cache_dir)
+    if args.clear:
+        cache.clear()
+    print(json.dumps(cache.stats(), indent=4))
@@ -1,34 +1,43 @@
 #!/usr/bin/env python3
 import sys
-import re
 import json
-from pypdf import PdfReader
 import email
-import os
-import tempfile
 import argparse
-
-def extract_data_from_pdf(pdf_path):
-    reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n" # Add newline to separate page content
-
+from functools import partial
+from batch_runner import expand_inputs, is_batch_request, run_batch, print_batch_results
+from extraction_cache import cached_extract_and_parse, enable_cache
+from page_extract import DEFAULT_MAX_PAGES, DEFAULT_PARALLEL_MIN_PAGES, read_pages_parallel, read_pages_until
+from bill_ledger import open_ledger
+from region_extract import layout_parser_key, process_layout_file
+import bill_rules
+import text_backends
+import timings
+
+PARSER_VERSION = 1 # Bump on every regex change so cached results are re-parsed
+
+def read_pdf_text(pdf_path):
+    # pdf_path may also be the PDF itself (bytes) or a binary stream.
+    # Extracted by the active text backend (text_backends.py), with a newline after each page.
+    return text_backends.read_text(pdf_path)
+
+def extract_text(pdf_path):
     # Convert to one-liner and replace newlines with tabs
-    one_liner_text = text.replace('\n', '\t')
+    return read_pdf_text(pdf_path).replace('\n', '\t')
 
+def parse_eyath_data(one_liner_text):
     data = {}
+    # Every match below comes from one scan of the text ("eyath_pdf" rules in bill_rules.py).
+    fields = bill_rules.extract("eyath_pdf", one_liner_text)
 
     # RFpayment
     # The first string occurrence that starts with RF and ends with a tab.
-    rf_match = re.search(r"\*\s*(RF[^*]+?)\s*\*", one_liner_text)
-    if rf_match:
-        data["RFpayment"] = rf_match.group(1).replace(' ', '').strip()
+    if "RFpayment" in fields:
+        data["RFpayment"] = fields["RFpayment"]
 
     # Dates
     # The first date with numbers like 11/04/2025 is the json startMeasurement.
     # The next date is endMeasurement. The next date is ignored. The next date is the nextStartMeasurement.
-    dates = re.findall(r"\d{2}/\d{2}/\d{4}", one_liner_text)
+    dates = fields["dates"]
     if len(dates) >= 4:
         data["startMeasurement"] = dates[0]
         data["endMeasurement"] = dates[1]
@@ -48,17 +57,16 @@ def extract_data_from_pdf(pdf_path):
 
     # Existing duePayment logic as a fallback if not found by new rule
     if not due_payment_found:
-        due_payment_pagio_match = re.search(r"(\d{2}/\d{2}/\d{4})\s*ΠΑΓΙΟ ΤΕΛΟΣ", one_liner_text)
-        due_payment_poli_match = re.search(r"(\d{2}/\d{2}/\d{4})\s*ΠΟΛΗ", one_liner_text)
-
-        if due_payment_pagio_match and due_payment_poli_match and \
-           due_payment_pagio_match.group(1) == due_payment_poli_match.group(1):
-            data["duePayment"] = due_payment_pagio_match.group(1)
-        elif due_payment_pagio_match:
-            data["duePayment"] = due_payment_pagio_match.group(1)
+        due_payment_pagio = fields.get("duePaymentPagio") # date before "ΠΑΓΙΟ ΤΕΛΟΣ"
+        due_payment_poli = fields.get("duePaymentPoli") # date before "ΠΟΛΗ"
+
+        if due_payment_pagio and due_payment_poli and due_payment_pagio == due_payment_poli:
+            data["duePayment"] = due_payment_pagio
+        elif due_payment_pagio:
+            data["duePayment"] = due_payment_pagio
             print("Warning: 'ΠΑΓΙΟ ΤΕΛΟΣ' date found, but 'ΠΟΛΗ' date not found or mismatched for duePayment.", file=sys.stderr)
-        elif due_payment_poli_match:
-            data["duePayment"] = due_payment_poli_match.group(1)
+        elif due_payment_poli:
+            data["duePayment"] = due_payment_poli
             print("Warning: 'ΠΟΛΗ' date found, but 'ΠΑΓΙΟ ΤΕΛΟΣ' date not found or mismatched for duePayment.", file=sys.stderr)
         else:
             print("Warning: Could not find consistent 'duePayment' date based on 'ΠΑΓΙΟ ΤΕΛΟΣ' and 'ΠΟΛΗ'.", file=sys.stderr)
@@ -67,10 +75,9 @@ def extract_data_from_pdf(pdf_path):
     # amount
     # Before UID text is the amount json data.
     # Assuming it's a number that might have a decimal point or comma.
-    amount_match = re.search(r"ΑΡ\s*\.ΠΑΡΑΣΤΑΤΙΚΟΥ\s*:\s*(\d+(?:[.,]\d{1,2})?)", one_liner_text)
-    if amount_match:
-        # Replace comma with dot for float conversion
-        amount_str = amount_match.group(1).replace(',', '.')
+    if "amount" in fields:
+        # Comma already replaced with dot for float conversion
+        amount_str = fields["amount"]
         try:
             data["amount"] = float(amount_str)
         except ValueError:
@@ -78,18 +85,104 @@ def extract_data_from_pdf(pdf_path):
 
     # consumerNumber
     # Format: XX-XX-XXX-XX-XX (e.g., 38-17-077-50-90)
-    consumer_number_match = re.search(r"\d{2}-\d{2}-\d{3}-\d{2}-\d{2}", one_liner_text)
-    if consumer_number_match:
-        data["consumerNumber"] = consumer_number_match.group(0)
+    if "consumerNumber" in fields:
+        data["consumerNumber"] = fields["consumerNumber"]
+
+    return data
 
-    return json.dumps(data, indent=4, ensure_ascii=False), one_liner_text
+def extract_data_from_pdf(pdf_path):
+    one_liner_text = extract_text(pdf_path)
+    with timings.stage("parse"):
+        data = parse_eyath_data(one_liner_text)
+    with timings.stage("serialize"):
+        return json.dumps(data, indent=4, ensure_ascii=False), one_liner_text
+
+def parse_raw_text(text):
+    return parse_eyath_data(text.replace('\n', '\t'))
+
+def fields_complete(text):
+    """
+    True once no later page can change what parse_eyath_data reads from the text:
+    - RFpayment, amount and consumerNumber are first-match rules, final once found
+      (every page ends in a separator, so a match cannot grow or move earlier)
+    - the first six dates are final once there are six; they give the measurement
+      period and the 5th/6th date rule for duePayment
+    - when the 5th and 6th dates differ, duePayment is the date before ΠΑΓΙΟ ΤΕΛΟΣ
+      if there is one anywhere, so it is final only once that date was found
+    """
+    one_liner_text = text.replace('\n', '\t')
+    fields = bill_rules.extract("eyath_pdf", one_liner_text)
+    dates = fields["dates"]
+    if len(dates) < 6 or not all(field in fields for field in ("RFpayment", "amount", "consumerNumber")):
+        return False
+    return dates[4] == dates[5] or "duePaymentPagio" in fields
+
+def process_pdf_file(pdf_path, early_exit=False, max_pages=DEFAULT_MAX_PAGES, page_jobs=None, parallel_min_pages=DEFAULT_PARALLEL_MIN_PAGES):
+    """
+    Batch worker: returns the parsed fields of one PDF as a dict (through the cache when enabled).
+    With early_exit, pages after the one where every field was found are not extracted.
+    With page_jobs, a PDF of at least parallel_min_pages pages is extracted by that many processes.
+    """
+    extract = read_pdf_text
+    if page_jobs:
+        extract = partial(read_pages_parallel, jobs=page_jobs, min_pages=parallel_min_pages)
+    if early_exit:
+        extract = partial(read_pages_until, is_complete=fields_complete, max_pages=max_pages)
+    return cached_extract_and_parse(pdf_path, extract, timings.timed("parse", parse_raw_text), f"eyath:{PARSER_VERSION}", cache_text=not early_exit)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process PDF or email to extract data.")
     parser.add_argument("-d", "--debug", action="store_true", help="Print only the one-liner text for debugging.")
-    parser.add_argument("input_file", nargs='?', default='-', help="Path to PDF file or '-' for stdin (email).")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes in batch mode (default: CPU count).")
+    parser.add_argument("input_files", nargs='*', default=['-'], help="PDF files, directories or glob patterns, or '-' for stdin (email). More than one input switches to batch mode (one JSON line per file).")
+    parser.add_argument("--cache", metavar="DIR", help="Extraction cache directory (or set AUTO_UTILITY_CACHE).")
+    parser.add_argument("--early-exit", action="store_true", help="Extract page by page and stop once every field is found.")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES, help="Pages checked one by one with --early-exit before falling back to the full document (default: %(default)s).")
+    parser.add_argument("--timings", action="store_true", help="Report wall time per stage as JSON on stderr, or as extra lines in batch mode (or set AUTO_UTILITY_TIMINGS).")
+    parser.add_argument("--timings-mode", choices=timings.MODES, help="What --timings measures: wall (the default) or memory, which adds the peak Python memory of every stage and is slower; implies --timings.")
+    parser.add_argument("--profile", metavar="FILE", help="Write a cProfile dump of a single run to FILE (or set AUTO_UTILITY_PROFILE).")
+    parser.add_argument("--ledger", metavar="FILE", help="Bill ledger: skip PDFs already parsed and record new results (or set AUTO_UTILITY_LEDGER).")
+    parser.add_argument("--layout", action="store_true", help="Experimental: read every field from its region of the first page (region_extract.py) instead of the whole text. The regions fit only the synthetic bills, so other bills are read twice (regions, then text); single files only.")
+    parser.add_argument("--pdf-backend", choices=text_backends.CHOICES, help="PDF text backend (text_backends.py; default: the faster of pypdf and pypdfium2, pdftotext only when named; or set AUTO_UTILITY_PDF_BACKEND).")
+    parser.add_argument("--page-jobs", type=int, default=None, help="Extract the pages of a single long PDF in this many processes (batch mode already runs one file per process).")
+    parser.add_argument("--parallel-min-pages", type=int, default=DEFAULT_PARALLEL_MIN_PAGES, help="Pages a PDF needs for --page-jobs to be used (default: %(default)s).")
     args = parser.parse_args()
-
+    if args.layout and is_batch_request(args.input_files):
+        parser.error("--layout is experimental and reads single files only")
+    if args.pdf_backend:
+        try:
+            text_backends.select_backend(args.pdf_backend)
+        except ValueError as e:
+            parser.error(str(e))
+    process_file = partial(process_pdf_file, early_exit=args.early_exit, max_pages=args.max_pages)
+    parser_key = f"eyath:{PARSER_VERSION}"
+    if args.layout:
+        process_file = partial(process_layout_file, provider="eyath", fallback=process_file)
+        parser_key = layout_parser_key("eyath")
+    ledger = open_ledger(args.ledger)
+
+    if args.cache:
+        enable_cache(args.cache)
+    if args.timings or args.timings_mode:
+        timings.enable_timings(args.timings_mode or "wall")
+    if args.profile:
+        timings.enable_profile(args.profile)
+
+    if is_batch_request(args.input_files):
+        pdf_paths = expand_inputs(args.input_files)
+        if ledger:
+            pdf_paths, hashes, skipped = ledger.skip_known(pdf_paths, parser_key)
+            print(f"Skipping {skipped} PDF files already in the ledger", file=sys.stderr)
+        print(f"Processing {len(pdf_paths)} PDF files in batch mode", file=sys.stderr)
+        results = run_batch(process_file, pdf_paths, args.jobs)
+        if ledger:
+            results = ledger.record_results(results, hashes, "eyath", parser_key)
+        failures = print_batch_results(results)
+        sys.exit(1 if failures else 0)
+
+    if args.page_jobs and not args.layout:
+        process_file = partial(process_file, page_jobs=args.page_jobs, parallel_min_pages=args.parallel_min_pages)
+    args.input_file = args.input_files[0]
     input_source = None
     if args.input_file == '-':
         # Read from stdin
@@ -100,53 +193,57 @@ if __name__ == "__main__":
         pdf_file_path = args.input_file
         print(f"Processing PDF from file: {pdf_file_path}", file=sys.stderr)
         try:
-            extracted_json, one_liner_text = extract_data_from_pdf(pdf_file_path)
-            if args.debug:
-                print(one_liner_text)
-            else:
-                print(extracted_json)
+            with timings.profiled(), timings.record(pdf_file_path) as record:
+                if args.debug:
+                    extracted_json, one_liner_text = extract_data_from_pdf(pdf_file_path)
+                    output = one_liner_text
+                else:
+                    if ledger:
+                        with timings.stage("ledger"):
+                            data = ledger.parse_once(pdf_file_path, "eyath", parser_key, process_file)
+                    else:
+                        data = process_file(pdf_file_path)
+                    with timings.stage("serialize"):
+                        output = json.dumps(data, indent=4, ensure_ascii=False)
+            print(output)
+            timings.emit(record)
         except Exception as e:
             print(f"An error occurred while processing file {pdf_file_path}: {e}", file=sys.stderr)
             sys.exit(1)
         sys.exit(0) # Exit after processing the file
 
-    # If we are here, it means we are processing from stdin
-    raw_email = input_source.read()
-    msg = email.message_from_bytes(raw_email)
-
-    pdf_found = False
-    for part in msg.walk():
-        if part.get_content_maintype() == 'application' and part.get_content_subtype() == 'pdf':
-            pdf_found = True
-            filename = part.get_filename()
-            if not filename:
-                filename = "attachment.pdf"
-
-            # Get system temp directory
-            temp_dir = tempfile.gettempdir()
-            # Construct path for 'dei' folder inside temp directory
-            eyath_folder = os.path.join(temp_dir, 'eyath')
-            # Create 'dei' folder if it doesn't exist
-            os.makedirs(eyath_folder, exist_ok=True)
-
-            # Create a temporary file inside the 'dei' folder
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=eyath_folder) as temp_pdf:
-                temp_pdf.write(part.get_payload(decode=True))
-                temp_pdf_path = temp_pdf.name
-
-            print(f"Processing attached PDF: {filename} (saved to {temp_pdf_path})", file=sys.stderr)
-            try:
-                extracted_json, one_liner_text = extract_data_from_pdf(temp_pdf_path)
-                if args.debug:
-                    print(one_liner_text)
-                else:
-                    print(extracted_json)
-                    print(one_liner_text)
-            except Exception as e:
-                print(f"Error processing PDF attachment {filename}: {e}", file=sys.stderr)
-            finally:
-                os.remove(temp_pdf_path)
-            break # Assuming only one PDF attachment is expected
+    # If we are here, it means we are processing from stdin.
+    # One profile covers the whole message, not one per attachment.
+    with timings.profiled():
+        raw_email = input_source.read()
+        with timings.record("-") as record:
+            with timings.stage("mime"):
+                msg = email.message_from_bytes(raw_email)
+        timings.emit(record)
+
+        pdf_found = False
+        for part in msg.walk():
+            if part.get_content_maintype() == 'application' and part.get_content_subtype() == 'pdf':
+                pdf_found = True
+                filename = part.get_filename()
+                if not filename:
+                    filename = "attachment.pdf"
+
+                # The decoded attachment goes to pypdf straight from memory.
+                print(f"Processing attached PDF: {filename}", file=sys.stderr)
+                try:
+                    with timings.record(filename) as record:
+                        with timings.stage("decode"):
+                            attachment = part.get_payload(decode=True)
+                        extracted_json, one_liner_text = extract_data_from_pdf(attachment)
+                    timings.emit(record)
+                    if args.debug:
+                        print(one_liner_text)
+                    else:
+                        print(extracted_json)
+                        print(one_liner_text)
+                except Exception as e:
+                    print(f"Error processing PDF attachment {filename}: {e}", file=sys.stderr)
 
     if not pdf_found:
         print("No PDF attachment found in the email.", file=sys.stderr)
@@ -0,0 +1,262 @@
+"""
+Filesystem change notifications for download and watch-folder code.
+
+DirectoryWatcher wakes up on inotify events for one directory (Linux, through
+ctypes, no extra package). Where inotify is not available it falls back to
+sleeping for a short poll interval, so callers can use the same loop on any
+platform: wait for a wake-up, then look at the directory.
+
+TreeWatcher reports which files changed under several directory trees, with
+new subdirectories watched as they appear; without inotify it compares
+directory listings every poll interval instead.
+"""
+import ctypes
+import os
+import select
+import struct
+import time
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+DEFAULT_MASK = IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE
+POLL_INTERVAL = 0.2
+
+_EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        import ctypes.util # find_library() pulls in subprocess; only needed once
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform")
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc = libc
+    return _libc
+
+
+class DirectoryWatcher:
+    """
+    Watches one directory. wait(timeout) blocks until something changes in it
+    (or the timeout passes) and returns the names that changed as
+    [(mask, name)]; an empty list means the timeout passed, or that polling is
+    in use and the caller should re-scan. Use as a context manager.
+    """
+
+    def __init__(self, directory, mask=DEFAULT_MASK, poll_interval=POLL_INTERVAL):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.fd = None
+        try:
+            libc = _load_libc()
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+                errno = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(errno, f"inotify_add_watch failed for {directory}")
+            self.fd = fd
+        except OSError:
+            self.fd = None # polling fallback
+
+    @property
+    def uses_inotify(self):
+        return self.fd is not None
+
+    def wait(self, timeout=None):
+        if self.fd is None:
+            time.sleep(self.poll_interval if timeout is None else min(timeout, self.poll_interval))
+            return []
+        return [(mask, name) for _, mask, name in _read_events(self.fd, timeout)]
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _read_events(fd, timeout):
+    """[(wd, mask, name)] of the inotify events on `fd`, waiting at most `timeout` seconds."""
+    readable, _, _ = select.select([fd], [], [], timeout)
+    if not readable:
+        return []
+    try:
+        data = os.read(fd, 64 * 1024)
+    except BlockingIOError:
+        return []
+    events = []
+    offset = 0
+    while offset + _EVENT_HEADER.size <= len(data):
+        wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+        offset += _EVENT_HEADER.size
+        name = data[offset:offset + name_len].split(b"\0", 1)[0]
+        offset += name_len
+        events.append((wd, mask, os.fsdecode(name)))
+    return events
+
+
+def walk_files(directory):
+    """{path: (size, mtime)} of every file under `directory`."""
+    files = {}
+    for root, _dirs, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files[path] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+class TreeWatcher:
+    """
+    Watches several directory trees. wait(timeout) returns [(mask, path)]
+    for the files that changed; (IN_Q_OVERFLOW, None) means events were lost
+    and the caller should re-scan. A directory created (or moved in) later
+    is watched from then on, and the files it already holds are reported as
+    IN_CLOSE_WRITE so none is missed between its creation and its watch.
+
+    Without inotify every poll compares the trees with the previous listing
+    and reports new or changed files as IN_CLOSE_WRITE.
+    """
+
+    def __init__(self, directories, mask=IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE, poll_interval=POLL_INTERVAL):
+        self.directories = list(directories)
+        self.mask = mask | IN_CREATE | IN_MOVED_TO # needed to follow new subdirectories
+        self.poll_interval = poll_interval
+        self.fd = None
+        self.watches = {} # wd -> directory
+        self.listing = None
+        try:
+            libc = _load_libc()
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            self.fd = fd
+            for directory in self.directories:
+                for root, _dirs, _names in os.walk(directory):
+                    self._add_watch(root)
+        except OSError:
+            self.close()
+            self.listing = self._scan() # polling fallback
+
+    @property
+    def uses_inotify(self):
+        return self.fd is not None
+
+    def _add_watch(self, directory):
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(directory), self.mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.watches[wd] = directory
+
+    def _scan(self):
+        listing = {}
+        for directory in self.directories:
+            listing.update(walk_files(directory))
+        return listing
+
+    def wait(self, timeout=None):
+        if self.fd is None:
+            time.sleep(self.poll_interval if timeout is None else min(timeout, self.poll_interval))
+            listing = self._scan()
+            changed = [(IN_CLOSE_WRITE, path) for path, state in listing.items() if self.listing.get(path) != state]
+            self.listing = listing
+            return changed
+        events = []
+        for wd, mask, name in _read_events(self.fd, timeout):
+            if mask & IN_Q_OVERFLOW:
+                events.append((IN_Q_OVERFLOW, None))
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    for root, _dirs, _names in os.walk(path):
+                        try:
+                            self._add_watch(root)
+                        except OSError:
+                            continue # removed again before we got to it
+                    events.extend((IN_CLOSE_WRITE, file_path) for file_path in walk_files(path))
+                continue
+            events.append((mask, path))
+        return events
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.watches.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _complete_candidates(directory, existing, suffix):
+    """Names ending in `suffix` that are new, non-empty and have no .part companion, with their sizes."""
+    try:
+        names = set(os.listdir(directory))
+    except FileNotFoundError:
+        return {}
+    candidates = {}
+    for name in names - existing:
+        if not name.endswith(suffix) or name + ".part" in names:
+            continue
+        try:
+            size = os.stat(os.path.join(directory, name)).st_size
+        except FileNotFoundError:
+            continue
+        if size > 0:
+            candidates[name] = size
+    return candidates
+
+
+def wait_for_new_file(directory, existing, suffix=".pdf", timeout=60, settle=0.3):
+    """
+    Waits for a file that was not in `existing` (names listed before the
+    download started) to be fully written: it ends in `suffix`, has no
+    `<name>.part` companion (Firefox's in-progress file) and its size has not
+    changed for `settle` seconds. Returns its full path, or None on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    seen = {} # name -> (size, time that size was first seen)
+    with DirectoryWatcher(directory) as watcher:
+        while True:
+            now = time.monotonic()
+            candidates = _complete_candidates(directory, existing, suffix)
+            seen = {name: seen[name] if name in seen and seen[name][0] == size else (size, now)
+                    for name, size in candidates.items()}
+            for name, (_, first_seen) in seen.items():
+                if now - first_seen >= settle:
+                    return os.path.join(directory, name)
+            remaining = deadline - now
+            if remaining <= 0:
+                return None
+            # Wake up on the next change, or when a candidate's settle time is over.
+            pending = [first_seen + settle - now for _, first_seen in seen.values()]
+            watcher.wait(max(0.0, min([remaining] + pending)))
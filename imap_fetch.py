@@ -0,0 +1,426 @@
+"""
+Fetches new bill notices from an IMAP mailbox for body-reader.py --imap,
+downloading only what the parsers read.
+
+A run costs one UID SEARCH when nothing is new, and a few round trips per
+FETCH_CHUNK new notices otherwise:
+
+    UID SEARCH UID <watermark+1>:* FROM ...   new messages from the bill
+                                              senders only (DEFAULT_SENDERS)
+    UID FETCH (BODYSTRUCTURE ...)             the MIME tree and Message-ID of
+                                              a chunk of them, no bodies
+    UID FETCH (BODY.PEEK[<section>])          the text/plain part of each,
+                                              chosen as mime_stream does it;
+                                              attachments are never fetched
+
+The watermark is the highest UID already handled (with the mailbox's
+UIDVALIDITY: when that changes, UIDs were reassigned and the mailbox is read
+again from the start), so the traffic of a run grows with the new mail, not
+with the size of the mailbox. BODY.PEEK leaves the \\Seen flags alone, and
+the mailbox is opened read-only.
+
+Chunks are fetched concurrently over a small pool of connections
+(imaplib in worker threads, driven by asyncio) and handed to the caller as
+each one completes.
+"""
+import asyncio
+import contextlib
+import imaplib
+import json
+import os
+import re
+import urllib.parse
+from collections import namedtuple
+
+import mime_stream
+
+DEFAULT_SENDERS = ("eyath.gr", "dei.gr")
+DEFAULT_CONNECTIONS = 3
+FETCH_CHUNK = 50
+PASSWORD_ENV = "AUTO_UTILITY_IMAP_PASSWORD"
+
+ImapTarget = namedtuple("ImapTarget", "host port ssl user password mailbox")
+FetchedMessage = namedtuple("FetchedMessage", "uid message_id text")
+
+_LITERAL = re.compile(rb"\{(\d+)\+?\}\r\n")
+_ATOM_END = frozenset(b" ()\r\n")
+
+
+def parse_url(url, password=None):
+    """
+    ImapTarget of imap://user@host[:port]/MAILBOX (imaps:// for TLS). The
+    password comes from the URL, `password` or $AUTO_UTILITY_IMAP_PASSWORD.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("imap", "imaps"):
+        raise ValueError(f"Not an imap:// or imaps:// URL: {url}")
+    if not parts.hostname or not parts.username:
+        raise ValueError(f"The IMAP URL needs a user and a host (imap://user@host/INBOX): {url}")
+    password = urllib.parse.unquote(parts.password) if parts.password else password or os.environ.get(PASSWORD_ENV)
+    if password is None:
+        raise ValueError(f"No IMAP password: set {PASSWORD_ENV}")
+    ssl = parts.scheme == "imaps"
+    return ImapTarget(parts.hostname, parts.port or (993 if ssl else 143), ssl, urllib.parse.unquote(parts.username),
+                      password, urllib.parse.unquote(parts.path.lstrip("/")) or "INBOX")
+
+
+def display_url(target):
+    """The target as a URL without the password (state key, ledger source)."""
+    return f"{'imaps' if target.ssl else 'imap'}://{urllib.parse.quote(target.user)}@{target.host}:{target.port}/{target.mailbox}"
+
+
+class _Counting:
+    """Counts the bytes read from the server."""
+    received = 0
+
+    def read(self, size):
+        data = super().read(size)
+        self.received += len(data)
+        return data
+
+    def readline(self):
+        line = super().readline()
+        self.received += len(line)
+        return line
+
+
+class _CountingIMAP4(_Counting, imaplib.IMAP4):
+    pass
+
+
+class _CountingIMAP4_SSL(_Counting, imaplib.IMAP4_SSL):
+    pass
+
+
+def quote(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _check(result, command):
+    typ, data = result
+    if typ != "OK":
+        raise imaplib.IMAP4.error(f"{command} failed: {typ} {data}")
+    return data
+
+
+# --- Response parsing -----------------------------------------------------
+
+class _Reader:
+    """Values of IMAP response lines: lists, quoted strings, literals, atoms (as bytes) and NIL (None)."""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def at_end(self):
+        return self.pos >= len(self.data)
+
+    def line(self):
+        """The values of one line, up to its CRLF."""
+        return self._values(None)
+
+    def _values(self, close):
+        values = []
+        data = self.data
+        while True:
+            while self.pos < len(data) and data[self.pos] == 0x20:
+                self.pos += 1
+            if self.pos >= len(data):
+                if close is not None:
+                    raise ValueError("Unterminated list in IMAP response")
+                return values
+            char = data[self.pos]
+            if close is not None and char == close:
+                self.pos += 1
+                return values
+            if char in (0x0D, 0x0A):
+                if close is not None:
+                    raise ValueError("Line ends inside a list in IMAP response")
+                self.pos += 2 if data[self.pos:self.pos + 2] == b"\r\n" else 1
+                return values
+            values.append(self._value())
+
+    def _value(self):
+        data = self.data
+        char = data[self.pos]
+        if char == 0x28: # (
+            self.pos += 1
+            return self._values(0x29)
+        if char == 0x22: # "
+            out = bytearray()
+            self.pos += 1
+            while data[self.pos] != 0x22:
+                if data[self.pos] == 0x5C: # backslash
+                    self.pos += 1
+                out.append(data[self.pos])
+                self.pos += 1
+            self.pos += 1
+            return bytes(out)
+        if char == 0x7B: # {
+            match = _LITERAL.match(data, self.pos)
+            if match is None:
+                raise ValueError("Malformed literal in IMAP response")
+            start = match.end()
+            self.pos = start + int(match.group(1))
+            return data[start:self.pos]
+        start = self.pos
+        depth = 0
+        while self.pos < len(data) and (depth or data[self.pos] not in _ATOM_END):
+            if data[self.pos] == 0x5B: # [ ... ] may hold spaces and parentheses: BODY[HEADER.FIELDS (X)]
+                depth += 1
+            elif data[self.pos] == 0x5D:
+                depth -= 1
+            self.pos += 1
+        atom = data[start:self.pos]
+        return None if atom.upper() == b"NIL" else atom
+
+
+def parse_values(data):
+    """Every value of `data` (one or more lines of IMAP syntax), as one list."""
+    reader = _Reader(data)
+    values = []
+    while not reader.at_end():
+        values.extend(reader.line())
+    return values
+
+
+def fetch_responses(data):
+    """
+    {item name: value} per message of an imaplib FETCH result; names are
+    upper case ("UID", "BODYSTRUCTURE", "BODY[1]").
+    """
+    # imaplib splits a response at its literals: put the protocol text back together.
+    raw = b"".join(item[0] + b"\r\n" + item[1] if isinstance(item, tuple) else item + b"\r\n"
+                   for item in data if item is not None)
+    reader = _Reader(raw)
+    responses = []
+    while not reader.at_end():
+        line = reader.line()
+        if len(line) == 2 and isinstance(line[1], list):
+            items = line[1]
+            responses.append({items[index].decode("ascii", "replace").upper(): items[index + 1]
+                              for index in range(0, len(items) - 1, 2)})
+    return responses
+
+
+# --- BODYSTRUCTURE ---------------------------------------------------------
+
+def _text(value):
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else ""
+
+
+def _leaf_parts(body, prefix=""):
+    """(section, body fields) of every non-multipart part, depth first (the order of Message.walk())."""
+    if isinstance(body[0], list): # multipart: the parts, then the subtype
+        for index, part in enumerate((part for part in body if isinstance(part, list)), 1):
+            yield from _leaf_parts(part, f"{prefix}{index}.")
+    else:
+        yield prefix[:-1] or "1", body
+
+
+def find_text_part(structure):
+    """
+    (section, transfer encoding, charset) of the part mime_stream.pick_plain_text()
+    would choose from a BODYSTRUCTURE: the first base64 text/plain part that
+    is not an attachment, else the first such part. None if there is none.
+    """
+    fallback = None
+    for section, part in _leaf_parts(structure):
+        if _text(part[0]).lower() != "text" or _text(part[1]).lower() != "plain":
+            continue
+        disposition = part[9] if len(part) > 9 else None # text parts: ... size lines md5 disposition
+        if isinstance(disposition, list) and disposition and _text(disposition[0]).lower() == "attachment":
+            continue
+        params = part[2] or []
+        charset = next((_text(params[index + 1]) for index in range(0, len(params) - 1, 2)
+                        if _text(params[index]).lower() == "charset"), None)
+        found = (section, _text(part[5]).lower() or "7bit", charset)
+        if found[1] == "base64":
+            return found
+        fallback = fallback or found
+    return fallback
+
+
+# --- Blocking IMAP calls (run in worker threads) ----------------------------
+
+def _connect(target):
+    connection = (_CountingIMAP4_SSL if target.ssl else _CountingIMAP4)(target.host, target.port)
+    try:
+        _check(connection.login(target.user, target.password), "LOGIN")
+        _check(connection.select(quote(target.mailbox), readonly=True), "EXAMINE")
+        _typ, uidvalidity = connection.response("UIDVALIDITY")
+        connection.uidvalidity = int(uidvalidity[0]) if uidvalidity and uidvalidity[0] else None
+    except BaseException:
+        connection.shutdown()
+        raise
+    return connection
+
+
+def _logout(connection):
+    try:
+        connection.logout()
+    except (OSError, imaplib.IMAP4.error):
+        pass
+
+
+def search_criteria(watermark, senders):
+    """UID SEARCH criteria for messages after the watermark from any of the senders (prefix OR)."""
+    criteria = f"FROM {quote(senders[-1])}"
+    for sender in reversed(senders[:-1]):
+        criteria = f"OR FROM {quote(sender)} {criteria}"
+    return f"UID {watermark + 1}:* {criteria}"
+
+
+def _search(connection, watermark, senders):
+    data = _check(connection.uid("SEARCH", search_criteria(watermark, senders)), "UID SEARCH")
+    # "n:*" always matches the last message, even when its UID is below n.
+    return sorted(uid for uid in (int(value) for value in b" ".join(item for item in data if item).split()) if uid > watermark)
+
+
+def _fetch_chunk(connection, uids):
+    """FetchedMessage of every UID; text is None when a message has no plain text part."""
+    data = _check(connection.uid("FETCH", ",".join(map(str, uids)), "(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])"),
+                  "UID FETCH BODYSTRUCTURE")
+    message_ids, parts = {}, {}
+    for response in fetch_responses(data):
+        if "UID" not in response or "BODYSTRUCTURE" not in response:
+            continue # an unsolicited FETCH (flag change)
+        uid = int(response["UID"])
+        header = next((value for name, value in response.items() if name.startswith("BODY[HEADER")), None) or b""
+        match = re.search(rb"(?im)^message-id:\s*(.+?)\s*$", header)
+        message_ids[uid] = match.group(1).decode("utf-8", "replace") if match else None
+        parts[uid] = find_text_part(response["BODYSTRUCTURE"])
+
+    by_section = {}
+    for uid, part in parts.items():
+        if part is not None:
+            by_section.setdefault(part[0], []).append(uid)
+    texts = {}
+    for section, section_uids in by_section.items(): # one round trip per distinct section, usually one
+        data = _check(connection.uid("FETCH", ",".join(map(str, section_uids)), f"(UID BODY.PEEK[{section}])"),
+                      "UID FETCH BODY")
+        for response in fetch_responses(data):
+            if "UID" not in response:
+                continue
+            uid = int(response["UID"])
+            body = next((value for name, value in response.items() if name.startswith(f"BODY[{section}]")), None)
+            if uid in parts and body is not None:
+                _section, encoding, charset = parts[uid]
+                texts[uid] = mime_stream.decode_body(body, encoding, charset)
+    return [FetchedMessage(uid, message_ids.get(uid), texts.get(uid)) for uid in uids if uid in parts]
+
+
+# --- Concurrent fetcher ------------------------------------------------------
+
+class ImapFetcher:
+    """
+    A pool of up to `connections` IMAP connections to one mailbox, opened as
+    they are needed. Use as `async with ImapFetcher(target) as fetcher:`.
+    """
+
+    def __init__(self, target, senders=DEFAULT_SENDERS, connections=DEFAULT_CONNECTIONS, chunk=FETCH_CHUNK):
+        self.target = target
+        self.senders = tuple(senders)
+        self.connections = max(1, connections)
+        self.chunk = max(1, chunk)
+        self.opened = []
+        self._idle = asyncio.Queue()
+        self._opening = 0
+        self._dropped_bytes = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.gather(*(asyncio.to_thread(_logout, connection) for connection in self.opened))
+
+    @property
+    def bytes_received(self):
+        return self._dropped_bytes + sum(connection.received for connection in self.opened)
+
+    @contextlib.asynccontextmanager
+    async def _connection(self):
+        if self._idle.empty() and len(self.opened) + self._opening < self.connections:
+            self._opening += 1
+            try:
+                connection = await asyncio.to_thread(_connect, self.target)
+            finally:
+                self._opening -= 1
+            self.opened.append(connection)
+        else:
+            connection = await self._idle.get()
+        try:
+            yield connection
+        except BaseException as e:
+            # A command that failed may have left responses unread: the connection is not reused.
+            self.opened.remove(connection)
+            self._dropped_bytes += connection.received
+            if isinstance(e, Exception): # when cancelled, the worker thread may still be using it
+                await asyncio.to_thread(_logout, connection)
+            raise
+        self._idle.put_nowait(connection)
+
+    async def search(self, watermark=0, uidvalidity=None):
+        """
+        (UIDVALIDITY, sorted new UIDs from the senders). A watermark saved
+        under another UIDVALIDITY no longer means anything and counts as 0.
+        """
+        async with self._connection() as connection:
+            if uidvalidity is not None and connection.uidvalidity != uidvalidity:
+                watermark = 0
+            return connection.uidvalidity, await asyncio.to_thread(_search, connection, watermark, self.senders)
+
+    async def messages(self, uids):
+        """Yields a FetchedMessage for each of `uids`, chunk by chunk in the order the chunks complete."""
+        tasks = [asyncio.create_task(self._fetch(uids[start:start + self.chunk])) for start in range(0, len(uids), self.chunk)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                for message in await task:
+                    yield message
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _fetch(self, uids):
+        async with self._connection() as connection:
+            return await asyncio.to_thread(_fetch_chunk, connection, uids)
+
+
+# --- Watermark state -----------------------------------------------------------
+
+def load_state(path, key):
+    """(UIDVALIDITY, watermark UID) saved for `key`, or (None, 0)."""
+    if not path or not os.path.exists(path):
+        return None, 0
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f).get(key) or {}
+    return state.get("uidvalidity"), state.get("uid", 0)
+
+
+def save_state(path, key, uidvalidity, watermark):
+    state = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    state[key] = {"uidvalidity": uidvalidity, "uid": watermark}
+    temp_path = f"{path}.{os.getpid()}"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1)
+    os.replace(temp_path, path)
+
+
+class Watermark:
+    """The highest UID below which every searched message has been handled, whatever order they complete in."""
+
+    def __init__(self, start, uids):
+        self.value = start
+        self._pending = list(uids) # sorted
+        self._done = set()
+        self._next = 0
+
+    def done(self, uid):
+        self._done.add(uid)
+        while self._next < len(self._pending) and self._pending[self._next] in self._done:
+            self.value = self._pending[self._next]
+            self._done.discard(self.value)
+            self._next += 1
@@ -0,0 +1,171 @@
+"""
+Finds and decodes the plain text part of a raw email without building the
+whole message.
+
+body-reader.py only needs the text/plain part of a bill notice, but
+message_from_bytes() reads the whole message and keeps every part,
+PDF attachments included, in memory. read_plain_text() reads the bytes
+line by line instead:
+
+    - the headers of the message and of every part are parsed with
+      email.parser.BytesFeedParser
+    - bodies of parts that are not wanted (attachments, HTML, images) are
+      skipped line by line and never stored
+    - the text part is fed to its own BytesFeedParser, so base64,
+      quoted-printable, 7bit and 8bit bodies and any charset are decoded by
+      the email package
+    - reading stops at the end of the first base64 text/plain part (the
+      format of the bill notices); other text/plain parts are kept as a
+      fallback in case no base64 one follows
+
+pick_plain_text() applies the same choice to an already parsed Message, and
+decode_body() decodes a text body fetched on its own.
+"""
+import codecs
+from email.parser import BytesFeedParser
+
+import timings
+
+MAX_LINE = 64 * 1024 # longer lines are read in pieces, so one line never takes more memory
+
+
+def _is_body_text(part):
+    return part.get_content_type() == "text/plain" and part.get_content_disposition() != "attachment"
+
+
+def _is_base64(part):
+    return str(part.get("Content-Transfer-Encoding", "")).strip().lower() == "base64"
+
+
+def decode_text_part(part):
+    """The decoded text of a text part, in its declared charset (UTF-8 if missing or unknown)."""
+    payload = part.get_payload(decode=True) or b""
+    charset = part.get_content_charset() or "utf-8"
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        charset = "utf-8"
+    return payload.decode(charset, errors="replace").replace('>', '')
+
+
+def decode_body(body, transfer_encoding, charset=None):
+    """
+    The decoded text of a text part's raw body, given its transfer encoding
+    and charset from elsewhere (an IMAP BODYSTRUCTURE, imap_fetch.py).
+    """
+    headers = "Content-Type: text/plain" + (f'; charset="{charset}"' if charset else "")
+    headers += f"\r\nContent-Transfer-Encoding: {transfer_encoding}\r\n\r\n"
+    return decode_text_part(_parse(headers.encode("ascii", "replace") + body))
+
+
+def pick_plain_text(msg):
+    """The first base64 text/plain body part of a Message, else its first text/plain body part, decoded; or None."""
+    fallback = None
+    for part in msg.walk():
+        if _is_body_text(part):
+            if _is_base64(part):
+                return decode_text_part(part)
+            if fallback is None:
+                fallback = part
+    return decode_text_part(fallback) if fallback is not None else None
+
+
+def _read_headers(fp):
+    """Raw header block of a message or part, up to and including the blank line."""
+    lines = []
+    while True:
+        line = fp.readline(MAX_LINE)
+        lines.append(line)
+        if not line or line in (b"\n", b"\r\n"):
+            return b"".join(lines)
+
+
+def _parse(raw):
+    parser = BytesFeedParser()
+    parser.feed(raw)
+    return parser.close()
+
+
+def _boundary_line(line, boundaries):
+    """(index in boundaries, closing) when the line is a delimiter of one of them, else None."""
+    if not line.startswith(b"--"):
+        return None
+    stripped = line.rstrip()
+    for index in range(len(boundaries) - 1, -1, -1):
+        delimiter = b"--" + boundaries[index]
+        if stripped == delimiter:
+            return index, False
+        if stripped == delimiter + b"--":
+            return index, True
+    return None
+
+
+def _skip_to_boundary(fp, boundaries, body=None):
+    """
+    Reads up to the next delimiter of any open multipart and returns what
+    _boundary_line() says about it, or None at the end of the input. With a
+    `body` list the lines read are appended to it; otherwise they are dropped.
+    """
+    while True:
+        line = fp.readline(MAX_LINE)
+        if not line:
+            return None
+        found = _boundary_line(line, boundaries)
+        if found is not None:
+            return found
+        if body is not None:
+            body.append(line)
+
+
+def read_plain_text(fp):
+    """
+    Reads a raw email from the binary stream `fp` as far as needed and
+    returns (headers, text): a Message holding the top-level headers only,
+    and the decoded plain text as pick_plain_text() would choose it, or None.
+    """
+    with timings.stage("mime"):
+        top_headers = _read_headers(fp)
+        headers = _parse(top_headers)
+    if headers.get_content_maintype() != "multipart":
+        if not _is_body_text(headers):
+            return headers, None
+        with timings.stage("decode"):
+            return headers, decode_text_part(_parse(top_headers + fp.read()))
+    boundary = headers.get_boundary()
+    if not boundary:
+        return headers, None
+
+    boundaries = [boundary.encode("ascii", "replace")]
+    fallback = None
+    with timings.stage("mime"):
+        found = _skip_to_boundary(fp, boundaries) # preamble
+    while found is not None:
+        index, closing = found
+        del boundaries[index + 1:] # a delimiter of an outer multipart ends the inner ones
+        if closing:
+            boundaries.pop()
+            if not boundaries:
+                break
+            with timings.stage("mime"):
+                found = _skip_to_boundary(fp, boundaries) # epilogue of the inner multipart
+            continue
+        with timings.stage("mime"):
+            raw_headers = _read_headers(fp)
+            part = _parse(raw_headers)
+            if part.get_content_maintype() == "multipart" and part.get_boundary():
+                boundaries.append(part.get_boundary().encode("ascii", "replace"))
+                found = _skip_to_boundary(fp, boundaries) # preamble of the inner multipart
+                continue
+            wanted = _is_body_text(part) and (fallback is None or _is_base64(part))
+            body = [] if wanted else None
+            found = _skip_to_boundary(fp, boundaries, body)
+        if wanted:
+            with timings.stage("decode"):
+                raw = b"".join(body)
+                # The line break before a delimiter belongs to the delimiter.
+                raw = raw[:-2] if raw.endswith(b"\r\n") else raw[:-1] if raw.endswith(b"\n") else raw
+                text = decode_text_part(_parse(raw_headers + raw))
+            if _is_base64(part):
+                return headers, text
+            fallback = text
+    return headers, fallback
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Local IMAP stand-in for body-reader.py --imap (imap_fetch.py): a read-only
+INBOX of synthetic EYATH and DEI bill notices (synthetic_mail.py), each with
+a PDF attachment, mixed with newsletters from other senders.
+
+    python3 mock-imap.py --port 1143 --bills 200 --noise 200 &
+    AUTO_UTILITY_IMAP_PASSWORD=x python3 body-reader.py --imap imap://me@127.0.0.1:1143/INBOX --checkpoint imap.state
+
+Message UIDs are stable for given --bills, --noise and --seed; restart with
+--new N to append N more notices (new mail) after them. Only what
+imap_fetch.py and imaplib send is understood: CAPABILITY, LOGIN, SELECT/EXAMINE, UID SEARCH (UID, FROM, OR,
+NOT, ALL), UID FETCH (UID, FLAGS, RFC822.SIZE, RFC822, BODYSTRUCTURE,
+BODY[...] and BODY.PEEK[...] with part numbers, HEADER, HEADER.FIELDS, MIME
+and TEXT), NOOP, CLOSE and LOGOUT. The bytes sent on every connection are
+logged when it closes.
+"""
+import argparse
+import email
+import email.policy
+import email.utils
+import mailbox
+import random
+import socketserver
+import sys
+import time
+from email.message import EmailMessage
+from functools import lru_cache
+
+from imap_fetch import parse_values
+import synthetic_mail
+
+UIDVALIDITY = 1
+
+
+def _bill(number, rng, attachment_kb):
+    attachment = ("bill.pdf", b"%PDF-1.4\n" + rng.randbytes(attachment_kb * 1024)) if attachment_kb else None
+    if number % 2:
+        return synthetic_mail.dei_email(contract_account=f"3000{number:08d}", amount=f"{rng.randint(10, 300)},{rng.randint(0, 99):02d}",
+                                        attachment=attachment, message_id=f"<dei-{number}@dei.gr>")
+    return synthetic_mail.eyath_email(consumer_number=f"38-17-{number % 1000:03d}-50-90", amount=f"{rng.randint(10, 90)},{rng.randint(0, 99):02d}",
+                                      attachment=attachment, message_id=f"<eyath-{number}@eyath.gr>")
+
+
+def build_messages(bills, noise, new=0, attachment_kb=100, seed=0):
+    """
+    Raw bytes of the mailbox's messages, in UID order: bill notices and
+    noise interleaved, then `new` more notices.
+    """
+    rng = random.Random(seed)
+    messages = []
+    total = bills + noise
+    number = 0
+    for index in range(total):
+        if noise and index * noise // total != (index + 1) * noise // total:
+            msg = EmailMessage()
+            msg["From"] = f"news@shop{index % 7}.example.com"
+            msg["To"] = "customer@example.com"
+            msg["Subject"] = f"Newsletter {index}"
+            msg["Message-ID"] = f"<news-{index}@example.com>"
+            msg.set_content("Offers of the week.\n" * 20)
+            msg.add_alternative("<p>Offers of the week.</p>" * 20, subtype="html")
+            messages.append(bytes(msg))
+            continue
+        messages.append(bytes(_bill(number, rng, attachment_kb)))
+        number += 1
+    for number in range(number, number + new):
+        messages.append(bytes(_bill(number, rng, attachment_kb)))
+    return messages
+
+
+def _string(value):
+    """An IMAP string: quoted when it can be, else a literal."""
+    if value is None:
+        return "NIL"
+    if all(32 <= ord(char) < 127 for char in value):
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    data = value.encode("utf-8")
+    return "{%d}\r\n" % len(data) + data.decode("utf-8")
+
+
+def _params(pairs):
+    return "(" + " ".join(f"{_string(name)} {_string(value)}" for name, value in pairs) + ")" if pairs else "NIL"
+
+
+def _raw_payload(part):
+    payload = part.get_payload()
+    return payload.encode("utf-8", "surrogateescape") if isinstance(payload, str) else b""
+
+
+def bodystructure(part):
+    if part.is_multipart():
+        return "(" + "".join(bodystructure(child) for child in part.get_payload()) + f" {_string(part.get_content_subtype())})"
+    maintype, subtype = part.get_content_maintype(), part.get_content_subtype()
+    params = [(name, email.utils.collapse_rfc2231_value(value)) for name, value in (part.get_params() or [])[1:]]
+    body = _raw_payload(part)
+    fields = [_string(maintype), _string(subtype), _params(params), _string(part.get("Content-ID")),
+              _string(part.get("Content-Description")), _string(part.get("Content-Transfer-Encoding", "7bit").strip()), str(len(body))]
+    if maintype == "text":
+        fields.append(str(body.count(b"\n")))
+    disposition = part.get_content_disposition()
+    if disposition:
+        filename = part.get_filename()
+        fields += ["NIL", f"({_string(disposition)} {_params([('filename', filename)] if filename else [])})"]
+    return "(" + " ".join(fields) + ")"
+
+
+def _headers(part, names=None):
+    lines = [f"{name}: {value}" for name, value in part.items() if names is None or name.lower() in names]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8", "surrogateescape")
+
+
+def _find_part(msg, numbers):
+    part = msg
+    for number in numbers:
+        if part.is_multipart():
+            part = part.get_payload()[number - 1]
+        elif number != 1:
+            raise KeyError(number)
+    return part
+
+
+def section_bytes(raw, msg, section):
+    """The bytes of BODY[section]."""
+    if section == "":
+        return raw
+    head, _, rest = section.partition(" ")
+    path = []
+    words = head.split(".")
+    while words and words[0].isdigit():
+        path.append(int(words.pop(0)))
+    spec = ".".join(words).upper()
+    part = _find_part(msg, path)
+    if spec == "":
+        return _raw_payload(part) if not part.is_multipart() else part.as_bytes().split(b"\n\n", 1)[-1]
+    if spec in ("HEADER", "MIME"):
+        return _headers(part)
+    if spec == "HEADER.FIELDS":
+        return _headers(part, {name.decode().lower() for name in parse_values(rest.encode())[0]})
+    if spec == "TEXT":
+        return raw.split(b"\n\n", 1)[-1] if not path else _raw_payload(part)
+    raise KeyError(section)
+
+
+class Mailbox:
+    def __init__(self, raw_messages):
+        self.raw = raw_messages
+        self.parsed = [email.message_from_bytes(raw, policy=email.policy.compat32) for raw in raw_messages]
+
+    def uids(self):
+        return range(1, len(self.raw) + 1) # UID n is message n
+
+
+@lru_cache(maxsize=64) # a search evaluates the same set for every message
+def _uid_set(text, last):
+    uids = set()
+    for item in text.split(","):
+        low, _, high = item.partition(":")
+        low = last if low == "*" else int(low)
+        high = low if not high else last if high == "*" else int(high)
+        low, high = min(low, high), max(low, high)
+        uids.update(range(low, high + 1)) # "n:*" past the end still matches the last message
+    return frozenset(uid for uid in uids if 1 <= uid <= last)
+
+
+def _criteria(tokens, box, uid):
+    """Whether message `uid` matches the search keys at the front of `tokens`; consumes them."""
+    key = tokens.pop(0).decode().upper()
+    if key == "ALL":
+        return True
+    if key == "UID":
+        return uid in _uid_set(tokens.pop(0).decode(), len(box.raw))
+    if key == "FROM":
+        return tokens.pop(0).decode().lower() in (box.parsed[uid - 1].get("From") or "").lower()
+    if key == "NOT":
+        return not _criteria(tokens, box, uid)
+    if key == "OR":
+        first = _criteria(tokens, box, uid)
+        second = _criteria(tokens, box, uid)
+        return first or second
+    raise ValueError(f"Unsupported search key {key}")
+
+
+def search(box, tokens):
+    found = []
+    for uid in box.uids():
+        remaining = list(tokens)
+        matched = True
+        while remaining:
+            matched = _criteria(remaining, box, uid) and matched
+        if matched:
+            found.append(uid)
+    return found
+
+
+class ImapHandler(socketserver.StreamRequestHandler):
+    def send(self, text):
+        data = text.encode("utf-8") if isinstance(text, str) else text
+        if self.server.delay and data.startswith(b"* "):
+            time.sleep(self.server.delay) # one round trip per response: ahead of its first line
+        self.sent += len(data)
+        self.wfile.write(data)
+
+    def handle(self):
+        self.sent = 0
+        self.send("* OK [CAPABILITY IMAP4rev1] mock-imap ready\r\n")
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                tag, _, rest = line.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+                command, _, arguments = rest.partition(" ")
+                command = command.upper()
+                if command == "UID":
+                    command, _, arguments = arguments.partition(" ")
+                    command = "UID " + command.upper()
+                try:
+                    if self.dispatch(tag, command, arguments):
+                        return
+                except (ValueError, KeyError, IndexError) as e:
+                    self.send(f"{tag} BAD {type(e).__name__}: {e}\r\n")
+        finally:
+            if not self.server.quiet:
+                print(f"mock-imap: connection closed after {self.sent} bytes sent", file=sys.stderr)
+
+    def dispatch(self, tag, command, arguments):
+        box = self.server.mailbox
+        if command == "CAPABILITY":
+            self.send("* CAPABILITY IMAP4rev1\r\n" f"{tag} OK CAPABILITY completed\r\n")
+        elif command == "LOGIN":
+            user, password = parse_values(arguments.encode())
+            if self.server.password is not None and password.decode() != self.server.password:
+                self.send(f"{tag} NO [AUTHENTICATIONFAILED] Invalid credentials\r\n")
+            else:
+                self.send(f"{tag} OK LOGIN completed\r\n")
+        elif command in ("SELECT", "EXAMINE"):
+            name = parse_values(arguments.encode())[0].decode()
+            if name.upper() != "INBOX":
+                self.send(f"{tag} NO Mailbox does not exist\r\n")
+                return False
+            self.send(f"* {len(box.raw)} EXISTS\r\n* 0 RECENT\r\n* FLAGS (\\Seen)\r\n"
+                      f"* OK [UIDVALIDITY {UIDVALIDITY}] UIDs valid\r\n* OK [UIDNEXT {len(box.raw) + 1}] Predicted next UID\r\n"
+                      f"{tag} OK [READ-ONLY] {command} completed\r\n")
+        elif command == "UID SEARCH":
+            found = search(box, parse_values(arguments.encode()))
+            self.send("* SEARCH" + "".join(f" {uid}" for uid in found) + f"\r\n{tag} OK SEARCH completed\r\n")
+        elif command == "UID FETCH":
+            uid_text, _, items = arguments.partition(" ")
+            items = parse_values(items.encode())
+            items = items[0] if items and isinstance(items[0], list) else items
+            for uid in sorted(_uid_set(uid_text, len(box.raw))):
+                self.send_fetch(uid, [item.decode() for item in items])
+            self.send(f"{tag} OK FETCH completed\r\n")
+        elif command in ("NOOP", "CLOSE"):
+            self.send(f"{tag} OK {command} completed\r\n")
+        elif command == "LOGOUT":
+            self.send(f"* BYE mock-imap logging out\r\n{tag} OK LOGOUT completed\r\n")
+            return True
+        else:
+            self.send(f"{tag} BAD Unsupported command {command}\r\n")
+        return False
+
+    def send_fetch(self, uid, items):
+        box = self.server.mailbox
+        raw, msg = box.raw[uid - 1], box.parsed[uid - 1]
+        out = [f"* {uid} FETCH (UID {uid}".encode()]
+        for item in items:
+            name = item.upper()
+            if name == "UID":
+                continue
+            if name == "FLAGS":
+                out.append(b" FLAGS ()")
+            elif name == "RFC822.SIZE":
+                out.append(f" RFC822.SIZE {len(raw)}".encode())
+            elif name == "BODYSTRUCTURE":
+                out.append(b" BODYSTRUCTURE " + bodystructure(msg).encode("utf-8"))
+            elif name == "RFC822" or name.startswith(("BODY[", "BODY.PEEK[")):
+                section = "" if name == "RFC822" else item[item.index("[") + 1:item.rindex("]")]
+                data = section_bytes(raw, msg, section)
+                label = "RFC822" if name == "RFC822" else f"BODY[{section}]"
+                out.append(f" {label} {{{len(data)}}}\r\n".encode() + data)
+            else:
+                raise ValueError(f"Unsupported fetch item {item}")
+        out.append(b")\r\n")
+        self.send(b"".join(out))
+
+
+class ImapServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local IMAP stand-in with synthetic bill notices, for body-reader.py --imap.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1143)
+    parser.add_argument("--bills", type=int, default=100, help="Bill notices in the INBOX (default: %(default)s).")
+    parser.add_argument("--noise", type=int, default=100, help="Messages from other senders (default: %(default)s).")
+    parser.add_argument("--new", type=int, default=0, help="Notices appended after the others, as if they had just arrived (default: %(default)s).")
+    parser.add_argument("--attachment-kb", type=int, default=100, help="Size of each notice's PDF attachment (default: %(default)s; 0 for none).")
+    parser.add_argument("--mbox", help="Serve the messages of this mbox instead of synthetic ones.")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds before every response (simulates a distant server).")
+    parser.add_argument("--password", help="Accept only this password (default: any).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not log connections.")
+    args = parser.parse_args()
+
+    if args.mbox:
+        raw_messages = [bytes(message) for message in mailbox.mbox(args.mbox, create=False)]
+    else:
+        raw_messages = build_messages(args.bills, args.noise, args.new, args.attachment_kb, args.seed)
+    server = ImapServer((args.host, args.port), ImapHandler)
+    server.mailbox = Mailbox(raw_messages)
+    server.password = args.password
+    server.delay = args.delay
+    server.quiet = args.quiet
+    print(f"Mock IMAP on imap://{args.host}:{server.server_address[1]}/INBOX ({len(raw_messages)} messages)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
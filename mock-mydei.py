@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the parts of mydei.dei.gr that auto-dei.py uses: the
+OneTrust cookie banner, the "Κοινόχρηστα" button, the ContractAccount form
+and the "Λήψη" link to the bill PDF. The PDF is a synthetic DEI bill for the
+submitted account, so it can be parsed with electricity-reader.py.
+
+    python3 mock-mydei.py --port 8000 &
+    python3 auto-dei.py --base-url http://127.0.0.1:8000 -a 300004254333
+"""
+import argparse
+import html
+import sys
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic_pdf import dei_bill_pages, make_pdf
+
+MAIN_PAGE = """<!DOCTYPE html>
+<html lang="el"><head><meta charset="utf-8"><title>myΔΕΗ</title></head>
+<body>
+<div id="onetrust-banner-sdk">
+  <p>Χρησιμοποιούμε cookies.</p>
+  <button id="onetrust-accept-btn-handler"
+          onclick="document.cookie='OptanonAlertBoxClosed=1; path=/'; document.getElementById('onetrust-banner-sdk').remove();">Αποδοχή</button>
+</div>
+<button type="button" onclick="document.getElementById('koinoxrista-panel').style.display='block';"><div>Κοινόχρηστα</div></button>
+<div id="koinoxrista-panel" style="display:none">
+  <form method="post" action="/el/koinoxrista">
+    <input id="ContractAccount" name="ContractAccount" type="text">
+    <input type="hidden" name="__RequestVerificationToken" value="mock-token">
+    <button class="b-login-panel__submit" type="submit">Αναζήτηση</button>
+  </form>
+</div>
+</body></html>
+"""
+
+RESULT_PAGE = """<!DOCTYPE html>
+<html lang="el"><head><meta charset="utf-8"><title>Λογαριασμός</title></head>
+<body>
+<p>Λογαριασμός συμβολαίου {account}</p>
+<a href="/el/koinoxrista/bill.pdf?account={account_q}">Λήψη</a>
+</body></html>
+"""
+
+
+class MockMyDeiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real site
+    delay = 0.0
+    bill_dates = {} # payment_due, next_measurement of the synthetic bill (default: synthetic_pdf's)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8", headers=None):
+        time.sleep(self.delay)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path in ("/", "/el"):
+            page = MAIN_PAGE
+            if "OptanonAlertBoxClosed" in (self.headers.get("Cookie") or ""):
+                # Banner already accepted in this profile: the real site does not show it again.
+                start = page.index('<div id="onetrust-banner-sdk">')
+                end = page.index("</div>", start) + len("</div>")
+                page = page[:start] + page[end:]
+            self._send(200, page.encode("utf-8"), headers={"Set-Cookie": "ASP.NET_SessionId=mock-session; Path=/; HttpOnly"})
+        elif url.path == "/el/koinoxrista/bill.pdf":
+            account = urllib.parse.parse_qs(url.query).get("account", [""])[0]
+            if not account.isdigit():
+                self._send(404, b"Not found", "text/plain")
+                return
+            pdf = make_pdf(dei_bill_pages(account, **self.bill_dates), info={"Producer": "mock-mydei", "Title": "DEI bill"})
+            self._send(200, pdf, "application/pdf",
+                       {"Content-Disposition": f'attachment; filename="{account}.pdf"'})
+        else:
+            self._send(404, b"Not found", "text/plain")
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8"))
+        account = form.get("ContractAccount", [""])[0].strip()
+        if url.path != "/el/koinoxrista" or form.get("__RequestVerificationToken") != ["mock-token"]:
+            self._send(400, b"Bad request", "text/plain")
+            return
+        if not account.isdigit():
+            self._send(200, "<p>Μη έγκυρος λογαριασμός</p>".encode("utf-8"))
+            return
+        page = RESULT_PAGE.format(account=html.escape(account), account_q=urllib.parse.quote(account))
+        self._send(200, page.encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the myDEI pages used by auto-dei.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before every response (simulates a slow site).")
+    parser.add_argument("--payment-due", metavar="DD/MM/YYYY", help="Payment due date printed on the bill.")
+    parser.add_argument("--next-measurement", metavar="DD/MM/YYYY", help="Next measurement date printed on the bill.")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not log requests.")
+    args = parser.parse_args()
+
+    MockMyDeiHandler.delay = args.delay
+    MockMyDeiHandler.bill_dates = {name: value for name, value in
+                                   (("payment_due", args.payment_due), ("next_measurement", args.next_measurement)) if value}
+    server = ThreadingHTTPServer((args.host, args.port), MockMyDeiHandler)
+    server.quiet = args.quiet
+    print(f"Mock myDEI on http://{args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
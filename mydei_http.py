@@ -0,0 +1,177 @@
+"""
+Browser-free download of a DEI bill: replays the myDEI "Κοινόχρηστα" form
+submission and the "Λήψη" download with plain HTTP.
+
+HttpSession keeps one keep-alive connection per host and a cookie jar, so a
+multi-account run costs a few round trips per bill instead of a browser
+session. Whenever the pages do not look the way this code expects (no form
+with a ContractAccount field, no "Λήψη" link, a non-PDF response) it raises
+FlowChanged, and auto-dei.py falls back to driving Firefox.
+"""
+import http.client
+import http.cookiejar
+import os
+import urllib.parse
+import urllib.request
+from html.parser import HTMLParser
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:140.0) Gecko/20100101 Firefox/140.0"
+CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+
+
+class FlowChanged(Exception):
+    """The myDEI pages no longer match the flow this module replays."""
+
+
+class HttpSession:
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.connections = {} # (scheme, netloc) -> keep-alive connection
+
+    def _connection(self, scheme, netloc):
+        key = (scheme, netloc)
+        if key not in self.connections:
+            connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            self.connections[key] = connection_class(netloc, timeout=self.timeout)
+        return self.connections[key]
+
+    def _send(self, method, url, body, headers):
+        parts = urllib.parse.urlsplit(url)
+        path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        cookie_request = urllib.request.Request(url, method=method)
+        self.cookies.add_cookie_header(cookie_request)
+        headers = dict({"User-Agent": USER_AGENT, "Accept-Language": "el"}, **headers)
+        headers.update(cookie_request.unredirected_hdrs)
+        for attempt in (1, 2):
+            connection = self._connection(parts.scheme, parts.netloc)
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle keep-alive connection: reconnect once.
+                connection.close()
+                del self.connections[(parts.scheme, parts.netloc)]
+                if attempt == 2:
+                    raise
+        self.cookies.extract_cookies(response, cookie_request)
+        return response
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Sends one request and follows redirects. Returns the final
+        http.client.HTTPResponse; the caller must read it to the end before
+        the next request, so the connection can be reused.
+        """
+        url = urllib.parse.urljoin(self.base_url + "/", url)
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send(method, url, body, headers or {})
+            if response.status not in (301, 302, 303, 307, 308):
+                return response
+            response.read()
+            url = urllib.parse.urljoin(url, response.getheader("Location", ""))
+            if response.status in (301, 302, 303):
+                method, body, headers = "GET", None, None
+        raise FlowChanged(f"Too many redirects ({url})")
+
+    def get_text(self, url, body=None, headers=None, method="GET"):
+        response = self.request(method, url, body, headers)
+        content = response.read()
+        if response.status != 200:
+            raise FlowChanged(f"{method} {url}: HTTP {response.status}")
+        charset = response.headers.get_content_charset() or "utf-8"
+        return content.decode(charset, errors="replace"), response
+
+    def clear_cookies(self):
+        """Forgets the previous account's session; the connections stay open."""
+        self.cookies.clear()
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.connections.clear()
+
+
+class _PageParser(HTMLParser):
+    """Collects the forms (action, method, input values) and the links of a page."""
+
+    def __init__(self):
+        super().__init__()
+        self.forms = []
+        self.links = [] # [href, text]
+        self._form = None
+        self._link = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "form":
+            self._form = {"action": attrs.get("action") or "", "method": (attrs.get("method") or "get").upper(), "inputs": {}}
+            self.forms.append(self._form)
+        elif tag == "input" and self._form is not None and attrs.get("name"):
+            self._form["inputs"][attrs["name"]] = attrs.get("value") or ""
+        elif tag == "a" and attrs.get("href"):
+            self._link = [attrs["href"], ""]
+            self.links.append(self._link)
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._form = None
+        elif tag == "a":
+            self._link = None
+
+    def handle_data(self, data):
+        if self._link is not None:
+            self._link[1] += data
+
+
+def _parse_page(html):
+    parser = _PageParser()
+    parser.feed(html)
+    parser.close()
+    return parser
+
+
+def fetch_bill(session, account_number, target_path):
+    """
+    Downloads the bill of `account_number` into `target_path` and returns it.
+    The PDF is streamed to `<target_path>.part` and renamed when complete.
+    Raises FlowChanged when the pages differ from the expected flow.
+    """
+    page_url = f"{session.base_url}/el"
+    html, _ = session.get_text(page_url)
+    form = next((f for f in _parse_page(html).forms if "ContractAccount" in f["inputs"]), None)
+    if form is None:
+        raise FlowChanged("No form with a ContractAccount field on the main page")
+
+    fields = dict(form["inputs"], ContractAccount=account_number)
+    action = urllib.parse.urljoin(page_url, form["action"])
+    body = urllib.parse.urlencode(fields).encode("utf-8")
+    if form["method"] == "POST":
+        html, _ = session.get_text(action, body, {"Content-Type": "application/x-www-form-urlencoded"}, method="POST")
+    else:
+        html, _ = session.get_text(f"{action}?{body.decode('ascii')}")
+    link = next((href for href, text in _parse_page(html).links if text.strip() == "Λήψη"), None)
+    if link is None:
+        raise FlowChanged("No 'Λήψη' link after submitting the form")
+
+    response = session.request("GET", urllib.parse.urljoin(action, link))
+    first_chunk = response.read(CHUNK_SIZE)
+    if response.status != 200 or not first_chunk.startswith(b"%PDF"):
+        response.read()
+        raise FlowChanged(f"The 'Λήψη' link did not return a PDF (HTTP {response.status})")
+    partial_path = target_path + ".part"
+    try:
+        with open(partial_path, "wb") as f:
+            chunk = first_chunk
+            while chunk:
+                f.write(chunk)
+                chunk = response.read(CHUNK_SIZE)
+        os.replace(partial_path, target_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return target_path
@@ -0,0 +1,130 @@
+"""
+Incremental, page-bounded PDF text extraction, and page-parallel
+extraction of long documents.
+
+The fields the readers need (RF code, amount, due date, consumer number) are
+almost always on the first page, so there is no point in extracting every
+page of a long bill before running the regexes.
+
+Yearly statements and multi-supply bills can run to dozens of pages, which
+are needed whole. read_pages_parallel() splits their pages into contiguous
+ranges, one per worker process. Each worker opens the file itself: pypdf
+reads it through a memory map, so the workers share the page cache instead
+of each holding a copy, and PDFium reads it from the path on its own. Only
+the range goes to a worker and only its text comes back; the ranges are
+joined in page order. Documents under `min_pages` pages stay on the serial
+path, where starting workers would cost more than it saves.
+"""
+import mmap
+import os
+from contextlib import ExitStack
+
+import text_backends
+import timings
+
+DEFAULT_MAX_PAGES = 3
+DEFAULT_PARALLEL_MIN_PAGES = 16
+
+_pool = None
+_pool_jobs = None
+
+
+def read_pages_until(pdf_path, is_complete, max_pages=DEFAULT_MAX_PAGES):
+    """
+    Extracts text page by page and stops as soon as `is_complete(text_so_far)`
+    is true, so later pages are never decoded.
+
+    Only the first `max_pages` pages are checked one at a time. If the fields
+    are still missing after that, the rest of the document is extracted in one
+    go (full-document fallback), so the result is never worse than a full
+    extraction. The returned text has the same layout as a full extraction
+    (one "\\n" after each page), just possibly shorter.
+    """
+    document = text_backends.open_document(pdf_path)
+    try:
+        return extract_pages(document, is_complete, max_pages)
+    finally:
+        document.close()
+
+
+def extract_pages(document, is_complete=None, max_pages=DEFAULT_MAX_PAGES, first_page_text=None):
+    """
+    read_pages_until() on an already open document (text_backends.py).
+    Without `is_complete` every page is extracted. `first_page_text` is the
+    first page's text when the caller already extracted it (pdf_router.py),
+    so it is not decoded twice.
+    """
+    parts = []
+    for page_num in range(len(document)):
+        if page_num == 0 and first_page_text is not None:
+            parts.append(first_page_text + "\n")
+        else:
+            with timings.stage("extract"):
+                parts.append(document.page_text(page_num) + "\n")
+        if is_complete is not None and page_num < max_pages:
+            with timings.stage("early_exit_check"):
+                complete = is_complete("".join(parts))
+            if complete:
+                break
+    return "".join(parts)
+
+
+def _page_range_text(source, backend, start, stop):
+    """Worker of read_pages_parallel(): text of pages start..stop-1 of a path or bytes, one "\\n" after each."""
+    with ExitStack() as stack:
+        if isinstance(source, str) and backend == "pypdf":
+            f = stack.enter_context(open(source, "rb"))
+            source = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        document = text_backends.open_document(source, backend)
+        stack.callback(document.close)
+        return "".join(document.page_text(page_num) + "\n" for page_num in range(start, stop))
+
+
+def _page_pool(jobs):
+    """One pool per process, kept for the next document (bill-daemon, bill-watch)."""
+    global _pool, _pool_jobs
+    if _pool is None or _pool_jobs != jobs:
+        if _pool is not None:
+            _pool.shutdown()
+        from concurrent.futures import ProcessPoolExecutor
+        _pool = ProcessPoolExecutor(max_workers=jobs)
+        _pool_jobs = jobs
+    return _pool
+
+
+def extract_pages_parallel(document, source, jobs=None, min_pages=DEFAULT_PARALLEL_MIN_PAGES, first_page_text=None):
+    """
+    Every page of an open document, like extract_pages() without
+    `is_complete`, but with the pages split across `jobs` worker processes
+    (default: CPU count) when there are at least `min_pages` of them.
+    `source` is the same document as a path or bytes, for the workers to open.
+    """
+    jobs = min(jobs or os.cpu_count() or 1, len(document))
+    if len(document) < min_pages or jobs < 2 or not document.page_parallel:
+        return extract_pages(document, first_page_text=first_page_text)
+    start = 0 if first_page_text is None else 1
+    bounds = [start + (len(document) - start) * index // jobs for index in range(jobs + 1)]
+    with timings.stage("extract"):
+        pool = _page_pool(jobs)
+        futures = [pool.submit(_page_range_text, source, document.name, low, high)
+                   for low, high in zip(bounds, bounds[1:]) if low < high]
+        parts = [future.result() for future in futures]
+    if first_page_text is not None:
+        parts.insert(0, first_page_text + "\n")
+    return "".join(parts)
+
+
+def read_pages_parallel(pdf_path, jobs=None, min_pages=DEFAULT_PARALLEL_MIN_PAGES):
+    """
+    Full-document text of a path, bytes or binary stream, in the same layout
+    as text_backends.read_text(), extracted by extract_pages_parallel().
+    """
+    if hasattr(pdf_path, "read"):
+        pdf_path = pdf_path.read()
+    elif isinstance(pdf_path, os.PathLike):
+        pdf_path = os.fspath(pdf_path)
+    document = text_backends.open_document(pdf_path)
+    try:
+        return extract_pages_parallel(document, pdf_path, jobs, min_pages)
+    finally:
+        document.close()
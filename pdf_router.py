@@ -0,0 +1,189 @@
+"""
+Identifies which provider issued a bill PDF from cheap signals, then parses
+it with that provider's reader, extracting the text only once.
+
+The signals are tried in order of cost and the first one that matches wins:
+
+    metadata    Producer/Creator/Title/Author/Subject of the document
+                information dict (read from the trailer, no page is decoded)
+    fonts       BaseFont names in the first page's resources (no content
+                stream is decoded)
+    text        the first page's text only
+
+The first page's text is kept and reused by the full extraction, so routing
+by text costs one regex search more than knowing the provider. The routing
+overhead is the "route" timings stage; compare it with "extract"
+(`bill-reader.py --timings`, or the "route" stage of benchmark.py).
+
+Metadata and fonts are always read with pypdf; the text comes from the
+active text backend (text_backends.py), which for pypdf shares the reader.
+
+Font names are empty in SIGNATURES until they are known from real bills:
+`python3 bill-reader.py --inspect bill.pdf` prints the metadata and fonts of
+a file.
+"""
+import io
+import re
+from collections import namedtuple
+
+from bill_service import load_reader
+from extraction_cache import cached_extract_and_parse
+from page_extract import DEFAULT_MAX_PAGES, DEFAULT_PARALLEL_MIN_PAGES, extract_pages, extract_pages_parallel
+from region_extract import layout_parser_key, process_layout_file
+import text_backends
+import timings
+
+Route = namedtuple("Route", "provider signal first_page_text")
+
+METADATA_KEYS = ("/Producer", "/Creator", "/Title", "/Author", "/Subject")
+
+# Checked in this order, so the more specific signatures come first (a
+# Zenith bill may mention ΔΕΗ, the reverse does not happen).
+SIGNATURES = {
+    "eyath": {
+        "metadata": re.compile(r"ΕΥΑΘ|(?i:eyath)"),
+        "fonts": None,
+        "text": re.compile(r"ΕΥΑΘ|eyath\.gr|ΑΡ\s*\.ΠΑΡΑΣΤΑΤΙΚΟΥ"),
+    },
+    "zenith": {
+        "metadata": re.compile(r"(?i)zenith"),
+        "fonts": None,
+        "text": re.compile(r"(?i)zenith"),
+    },
+    "dei": {
+        "metadata": re.compile(r"\bΔΕΗ\b|\bDEI\b|\bPPC\b|(?i:public power)"),
+        "fonts": None,
+        "text": re.compile(r"\bΔΕΗ\b|dei\.gr|ΕΞΟΦΛΗΣΗ ΕΩΣ"),
+    },
+}
+
+# provider -> (reader script, parse function, early-exit completeness check)
+PARSERS = {
+    "eyath": ("eyath-reader", "parse_raw_text", "fields_complete"),
+    "dei": ("electricity-reader", "parse_dei_data", "dei_fields_complete"),
+    "zenith": ("electricity-reader", "parse_zenith_data", "zenith_fields_complete"),
+}
+
+
+def document_metadata(reader):
+    """The metadata fields the router looks at, as {key: text}."""
+    try:
+        info = reader.metadata or {}
+    except Exception: # a broken information dict must not stop routing
+        return {}
+    return {key: str(info[key]) for key in METADATA_KEYS if info.get(key)}
+
+
+def first_page_fonts(reader):
+    """BaseFont names of the first page, without the subset prefix (ABCDEF+)."""
+    try:
+        fonts = reader.pages[0]["/Resources"]["/Font"]
+        names = [str(font.get_object().get("/BaseFont", "")) for font in fonts.values()]
+    except (KeyError, IndexError, AttributeError, TypeError):
+        return []
+    return [name.lstrip("/").split("+", 1)[-1] for name in names if name]
+
+
+def _match(signal, values):
+    for provider, signatures in SIGNATURES.items():
+        pattern = signatures[signal]
+        if pattern is not None and any(pattern.search(value) for value in values):
+            return provider
+    return None
+
+
+def open_pdf(source):
+    """
+    (PdfReader, text_backends document) of a path or bytes. With the pypdf
+    backend the document wraps the same reader.
+    """
+    from pypdf import PdfReader # imported on first use, not at startup
+    with timings.stage("open"):
+        reader = PdfReader(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    if text_backends.active_backend() == "pypdf":
+        return reader, text_backends.PypdfDocument(reader)
+    return reader, text_backends.open_document(source)
+
+
+def identify(reader, document=None):
+    """
+    Route of an open PdfReader; provider is None when no signature matched.
+    The first page's text comes from `document` (text_backends.py) when
+    given, else from the reader itself. The "route" stage is the routing
+    overhead only: the first page's extraction is timed as "extract", since
+    the full extraction reuses it.
+    """
+    with timings.stage("route"):
+        provider = _match("metadata", document_metadata(reader).values())
+        if provider:
+            return Route(provider, "metadata", None)
+        provider = _match("fonts", first_page_fonts(reader))
+        if provider:
+            return Route(provider, "fonts", None)
+        if not reader.pages:
+            return Route(None, None, None)
+    with timings.stage("extract"):
+        text = (document or text_backends.PypdfDocument(reader)).page_text(0)
+    with timings.stage("route"):
+        provider = _match("text", [text])
+    return Route(provider, "text" if provider else None, text)
+
+
+def provider_parser(provider):
+    """(parse, is_complete, parser_key) of a provider, from its reader."""
+    script, parse_name, complete_name = PARSERS[provider]
+    reader_module = load_reader(script)
+    return (getattr(reader_module, parse_name), getattr(reader_module, complete_name),
+            f"{provider}:{reader_module.PARSER_VERSION}")
+
+
+def ledger_parser_key(layout=False):
+    """Parser key for the bill ledger: changes whenever any routed reader's PARSER_VERSION (or REGIONS_VERSION) does."""
+    if layout:
+        return "auto:" + ",".join(layout_parser_key(provider) for provider in PARSERS)
+    return "auto:" + ",".join(provider_parser(provider)[2] for provider in PARSERS)
+
+
+def process_auto_file(source, early_exit=False, max_pages=DEFAULT_MAX_PAGES, layout=False,
+                      page_jobs=None, parallel_min_pages=DEFAULT_PARALLEL_MIN_PAGES):
+    """
+    Batch worker: routes one PDF (path, bytes or binary stream) and returns
+    {"provider", "routedBy", ...the provider reader's fields}. Raises
+    ValueError when the provider cannot be identified. With `layout` the
+    fields are read from the provider's regions (region_extract.py). With
+    `page_jobs` a long PDF is extracted by that many processes
+    (page_extract.extract_pages_parallel()).
+
+    Routing happens before the extraction cache lookup, because the cached
+    result is keyed by the provider's parser.
+    """
+    if hasattr(source, "read"):
+        source = source.read()
+    reader, document = open_pdf(source)
+    try:
+        return _process_routed(source, reader, document, early_exit, max_pages, layout, page_jobs, parallel_min_pages)
+    finally:
+        document.close()
+
+
+def _process_routed(source, reader, document, early_exit, max_pages, layout, page_jobs, parallel_min_pages):
+    route = identify(reader, document)
+    if route.provider is None:
+        raise ValueError(f"Could not identify the provider (no {', '.join(SIGNATURES)} signature in the metadata, fonts or first page)")
+
+    def parse_text(source):
+        parse, is_complete, parser_key = provider_parser(route.provider)
+
+        def extract(_content):
+            # The document is already open.
+            if page_jobs and not early_exit:
+                return extract_pages_parallel(document, source, page_jobs, parallel_min_pages, route.first_page_text)
+            return extract_pages(document, is_complete if early_exit else None, max_pages, route.first_page_text)
+
+        return cached_extract_and_parse(source, extract, timings.timed("parse", parse), parser_key, cache_text=not early_exit)
+
+    if layout:
+        data = process_layout_file(source, route.provider, parse_text, reader)
+    else:
+        data = parse_text(source)
+    return dict({"provider": route.provider, "routedBy": route.signal}, **data)
@@ -0,0 +1,212 @@
+"""
+Layout-aware field extraction: only the text runs inside per-provider
+regions of the page are kept, and every field is read from its own region.
+
+The text readers flatten the whole document and find fields by their order
+in it (the 5th date of a Zenith bill, the 5th and 6th of an EYATH bill), so
+one extra date anywhere on the page moves every field. Here each region is a
+box on a page, in PDF points with the origin at the bottom left:
+
+    Region(name, page, box, fields)   box = (x0, y0, x1, y1)
+    Field(name, pattern, normalizer)  group 1 of the first match in the
+                                      region's text, then the normalizer
+
+pypdf hands every text run to a visitor (extract_text(visitor_text=...))
+with its position. Runs whose starting point is outside every region are
+dropped without being joined into any string, and pages without regions
+are not visited at all. pypdf itself still decodes the runs of the pages
+it visits.
+
+Experimental: the boxes match only the layout of the synthetic bills
+(synthetic_pdf.py), so a real bill falls back and is extracted twice;
+the readers accept --layout for single files only. To fit
+them to a real bill, print its runs with
+`python3 region_extract.py bill.pdf` and adjust REGIONS; bump
+REGIONS_VERSION so cached results are re-parsed. A bill whose regions do not
+give every field of the text reader (FIELDS) is read by the text reader
+instead, with a warning, so a layout that does not fit never yields a partial
+result. The fields come out with the text reader's keys, in its order.
+"""
+import argparse
+import io
+import json
+import re
+import sys
+from collections import namedtuple
+from functools import partial
+
+from extraction_cache import cached_extract_and_parse
+import timings
+
+REGIONS_VERSION = 1
+
+Region = namedtuple("Region", "name page box fields")
+Field = namedtuple("Field", "name pattern normalizer", defaults=(None,))
+
+DATE = r"(\d{2}/\d{2}/\d{4})"
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _strip_spaces(value):
+    return _WHITESPACE.sub("", value)
+
+
+def _to_float(value):
+    return float(value.replace(",", "."))
+
+
+REGIONS = {
+    "dei": [
+        Region("totals", 0, (40, 743, 560, 757), [Field("amountToPay", r"([\d.,]+)\s*€")]),
+        Region("due", 0, (40, 715, 560, 743), [Field("paymentDue", r"(\d{1,2}[./]\d{1,2}[./]\d{4})")]),
+        Region("meter", 0, (40, 687, 560, 715), [Field("nextMeasurement", r"(\d{1,2}[./]\d{1,2}[./]\d{4})")]),
+        Region("payment_slip", 0, (40, 673, 560, 687), [Field("RFcode", r"(RF\d{20,})")]),
+    ],
+    "zenith": [
+        Region("payment_slip", 0, (40, 687, 560, 729), [
+            Field("paymentDue", DATE),
+            Field("amountToPay", r"([\d.,]+)\s*€"),
+            Field("RFcode", r"(RF\d{20,})"),
+        ]),
+    ],
+    "eyath": [
+        Region("header", 0, (40, 743, 560, 757), [Field("consumerNumber", r"(\d{2}-\d{2}-\d{3}-\d{2}-\d{2})")]),
+        Region("totals", 0, (40, 729, 560, 743), [Field("amount", r"ΑΡ\s*\.ΠΑΡΑΣΤΑΤΙΚΟΥ\s*:\s*(\d+(?:[.,]\d{1,2})?)", _to_float)]),
+        Region("meter_period", 0, (40, 715, 560, 729), [
+            Field("startMeasurement", DATE + r"\s*-"),
+            Field("endMeasurement", r"-\s*" + DATE),
+        ]),
+        Region("payment_slip", 0, (40, 645, 560, 687), [
+            Field("duePayment", DATE),
+            Field("RFpayment", r"\*\s*(RF[^*]+?)\s*\*", _strip_spaces),
+        ]),
+    ],
+}
+
+# The keys of the text readers' output, in their order: layout mode returns the same.
+FIELDS = {
+    "dei": ("amountToPay", "RFcode", "contractNumber", "paymentDue", "nextMeasurement"),
+    "zenith": ("paymentDue", "amountToPay", "RFcode", "contractNumber"),
+    "eyath": ("RFpayment", "startMeasurement", "endMeasurement", "duePayment", "amount", "consumerNumber"),
+}
+
+_COMPILED = {provider: [region._replace(fields=[field._replace(pattern=re.compile(field.pattern)) for field in region.fields])
+                        for region in regions]
+             for provider, regions in REGIONS.items()}
+
+
+def _run_point(cm, tm):
+    """Where a text run starts on the page (text matrix origin through the CTM)."""
+    x, y = tm[4], tm[5]
+    return x * cm[0] + y * cm[2] + cm[4], x * cm[1] + y * cm[3] + cm[5]
+
+
+def extract_region_text(source, regions):
+    """
+    {region name: text} of a PDF (path, bytes, binary stream or an open
+    PdfReader). The runs of a region are joined with newlines in content
+    stream order.
+    """
+    from pypdf import PdfReader # layout mode is pypdf only; imported on first use
+    if isinstance(source, PdfReader):
+        reader = source
+    else:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        with timings.stage("open"):
+            reader = PdfReader(source)
+    runs = {region.name: [] for region in regions}
+    by_page = {}
+    for region in regions:
+        by_page.setdefault(region.page, []).append(region)
+
+    for page_num, page_regions in sorted(by_page.items()):
+        if page_num >= len(reader.pages):
+            continue
+        boxes = [(region.box, runs[region.name]) for region in page_regions]
+
+        def visit(text, cm, tm, font_dict, font_size):
+            if not text or text == "\n":
+                return
+            x, y = _run_point(cm, tm)
+            for (x0, y0, x1, y1), region_runs in boxes:
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    region_runs.append(text)
+
+        with timings.stage("extract"):
+            reader.pages[page_num].extract_text(visitor_text=visit)
+    return {name: "\n".join(parts) for name, parts in runs.items()}
+
+
+def parse_regions(provider, region_text):
+    """Fields of a provider from its region texts, in FIELDS order; missing fields are left out."""
+    found = {}
+    for region in _COMPILED[provider]:
+        text = region_text.get(region.name, "")
+        for field in region.fields:
+            match = field.pattern.search(text)
+            if match:
+                found[field.name] = field.normalizer(match.group(1)) if field.normalizer else match.group(1)
+    if provider in ("dei", "zenith") and "RFcode" in found:
+        found["contractNumber"] = found["RFcode"][-12:] # Contract Number: last 12 digits of RFcode
+    return {name: found[name] for name in FIELDS[provider] if name in found}
+
+
+def missing_fields(provider, data):
+    return [name for name in FIELDS[provider] if name not in data]
+
+
+def layout_parser_key(provider):
+    return f"{provider}-layout:{REGIONS_VERSION}"
+
+
+def process_layout_file(pdf_path, provider, fallback, reader=None):
+    """
+    Batch worker of the readers' --layout mode: the fields of one PDF from
+    its regions, through the extraction cache when it is on. When a field
+    is missing, the regions do not fit this bill and fallback(pdf_path), the
+    text reader, gives the result instead. `reader` is an already open
+    PdfReader of the same document (pdf_router.py).
+    """
+    regions = _COMPILED[provider]
+    extract = partial(extract_region_text, regions=regions)
+    if reader is not None:
+        extract = lambda _content: extract_region_text(reader, regions)
+    data = cached_extract_and_parse(pdf_path, extract, timings.timed("parse", partial(parse_regions, provider)),
+                                    layout_parser_key(provider), text_layer=False)
+    missing = missing_fields(provider, data)
+    if missing:
+        print(f"Warning: no {', '.join(missing)} in the {provider} layout regions (fit them with region_extract.py); "
+              "reading the whole text instead.", file=sys.stderr)
+        return fallback(pdf_path)
+    return data
+
+
+def page_runs(source, page=0):
+    """Every text run of a page as (x, y, text), for fitting REGIONS to a real bill."""
+    from pypdf import PdfReader
+    reader = PdfReader(source)
+    runs = []
+
+    def visit(text, cm, tm, font_dict, font_size):
+        if text.strip():
+            x, y = _run_point(cm, tm)
+            runs.append((round(x, 1), round(y, 1), text))
+
+    reader.pages[page].extract_text(visitor_text=visit)
+    return runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the positioned text runs of a PDF page, to fit the REGIONS boxes.")
+    parser.add_argument("pdf_file", help="PDF file.")
+    parser.add_argument("--page", type=int, default=0, help="Page number, from 0 (default: %(default)s).")
+    parser.add_argument("--provider", choices=sorted(REGIONS), help="Also print the region texts and fields of this provider.")
+    args = parser.parse_args()
+    for x, y, text in page_runs(args.pdf_file, args.page):
+        print(f"{x:7.1f} {y:7.1f}  {text}")
+    if args.provider:
+        region_text = extract_region_text(args.pdf_file, _COMPILED[args.provider])
+        data = parse_regions(args.provider, region_text)
+        print(json.dumps({"regions": region_text, "data": data, "missing": missing_fields(args.provider, data)},
+                         indent=4, ensure_ascii=False))
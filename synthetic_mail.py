@@ -0,0 +1,58 @@
+"""
+Synthetic EYATH and DEI notification emails (benchmarks and local stand-in
+servers). Like the real ones, the text is in a base64 text/plain part, which
+is what body-reader.py looks for.
+"""
+from email.message import EmailMessage
+from email.utils import format_datetime, make_msgid
+import datetime
+
+EYATH_SENDER = "noreply@eyath.gr"
+DEI_SENDER = "noreply@dei.gr"
+
+
+def _message(sender, subject, text, html=None, date=None, attachment=None, message_id=None):
+    msg = EmailMessage()
+    msg["From"] = sender
+    msg["To"] = "customer@example.com"
+    msg["Subject"] = subject
+    msg["Date"] = format_datetime(date or datetime.datetime(2025, 10, 1, 9, 0, tzinfo=datetime.timezone.utc))
+    msg["Message-ID"] = message_id or make_msgid(domain=sender.split("@", 1)[1])
+    msg.set_content(text, charset="utf-8", cte="base64")
+    if html is not None:
+        msg.add_alternative(html, subtype="html", charset="utf-8")
+    if attachment is not None:
+        filename, content = attachment
+        msg.add_attachment(content, maintype="application", subtype="pdf", filename=filename)
+    return msg
+
+
+def eyath_email(consumer_number="38-17-077-50-90", account_number="ΑΚΝ32848900", rf_code="RF08906109000012800574097",
+                amount="32,63", payment_due="27/10/2025", **kwargs):
+    """An EYATH bill notification as an email.message.EmailMessage (use bytes(msg) for the raw email)."""
+    text = (
+        "Αγαπητέ πελάτη,\n\n"
+        "Ο λογαριασμός νερού σας εκδόθηκε.\n\n"
+        f"Αριθμός καταναλωτή: {consumer_number}\n"
+        f"Αριθμός παραστατικού: {account_number}\n"
+        f"Κωδ. Εντολής Πληρωμής: {rf_code}\n"
+        f"Ποσό πληρωμής: {amount}\n"
+        f"Ημερομηνία λήξης: {payment_due}\n\n"
+        "ΕΥΑΘ Α.Ε. - https://www.eyath.gr\n"
+    )
+    return _message(EYATH_SENDER, "Νέος λογαριασμός ΕΥΑΘ", text, **kwargs)
+
+
+def dei_email(contract_account="300004254333", amount="45,10", payment_due="05/11/2025", **kwargs):
+    """A DEI bill notification as an email.message.EmailMessage (use bytes(msg) for the raw email)."""
+    rf_code = f"RF12{'0' * 10}{contract_account}"
+    rf_spaced = " ".join(rf_code[i:i + 4] for i in range(0, len(rf_code), 4))
+    text = (
+        "Αγαπητέ πελάτη,\n\n"
+        "Ο νέος λογαριασμός ρεύματος είναι διαθέσιμος στο myΔΕΗ.\n\n"
+        f"Κωδικός Ηλεκτρονικής Πληρωμής\n{rf_spaced}\n"
+        f"Τελικό Ποσό Πληρωμής\n{amount} €\n"
+        f"Ημερομηνία Λήξης\n{payment_due}\n\n"
+        "ΔΕΗ - https://www.dei.gr\n"
+    )
+    return _message(DEI_SENDER, "Ο λογαριασμός σας ΔΕΗ", text, **kwargs)
@@ -0,0 +1,163 @@
+"""
+Minimal PDF writer for synthetic bills (mock servers and benchmarks).
+
+Writes text-only PDFs with the standard Helvetica font. Greek letters and
+"€" are mapped to spare byte codes through the font's /Differences encoding
+using Adobe glyph names, which pypdf (and other extractors) turn back into
+the original characters. No third-party dependency is needed.
+"""
+import unicodedata
+
+_GREEK_NAME_FIXES = {"Delta": "Deltagreek", "Omega": "Omegagreek", "mu": "mugreek", "lamda": "lambda", "Lamda": "Lambda"}
+
+
+def glyph_name(ch):
+    """Adobe glyph name of a character outside ASCII."""
+    if ch == "€":
+        return "Euro"
+    name = unicodedata.name(ch, "")
+    if name.startswith("GREEK CAPITAL LETTER ") or name.startswith("GREEK SMALL LETTER "):
+        capital = name.startswith("GREEK CAPITAL")
+        letter = name.split("LETTER ", 1)[1]
+        if letter == "FINAL SIGMA":
+            return "sigma1"
+        base, _, accents = letter.partition(" WITH ")
+        base = base.lower()
+        base = base.capitalize() if capital else base
+        base = _GREEK_NAME_FIXES.get(base, base)
+        if accents:
+            suffix = {"TONOS": "tonos", "DIALYTIKA": "dieresis", "DIALYTIKA AND TONOS": "dieresistonos"}[accents]
+            base = base.replace("greek", "") + suffix
+        return base
+    return "uni%04X" % ord(ch)
+
+
+def _encode_line(text, codes):
+    out = bytearray()
+    for ch in text:
+        if ch in codes:
+            out.append(codes[ch])
+        elif ord(ch) < 128:
+            if ch in "()\\":
+                out.append(ord("\\"))
+            out.append(ord(ch))
+        else:
+            raise ValueError(f"Character {ch!r} is not in the font encoding")
+    return bytes(out)
+
+
+def _pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def make_pdf(pages, info=None, page_size=(595, 842)):
+    """
+    Returns the bytes of a PDF with one page per item of `pages`.
+
+    A page is a list of lines. A line is either a string, placed below the
+    previous line from the top-left corner, or an (x, y, text) tuple placed
+    at that position (PDF points, origin at the bottom left). `info` is an
+    optional document information dict, e.g. {"Producer": "..."} (ASCII).
+    """
+    width, height = page_size
+    special = sorted({ch for page in pages for line in page
+                      for ch in (line if isinstance(line, str) else line[2]) if ord(ch) > 127})
+    if len(special) > 128:
+        raise ValueError("Too many distinct non-ASCII characters for one font encoding")
+    codes = {ch: 128 + i for i, ch in enumerate(special)}
+    differences = " ".join(f"/{glyph_name(ch)}" for ch in special)
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None, # page tree, filled in below
+        ("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding << /Type /Encoding "
+         f"/BaseEncoding /WinAnsiEncoding /Differences [128 {differences}] >> >>").encode("ascii"),
+    ]
+    page_ids = []
+    for page in pages:
+        y = height - 50
+        stream = bytearray()
+        for line in page:
+            if isinstance(line, str):
+                x, text = 50, line
+                y -= 14
+                line_y = y
+            else:
+                x, line_y, text = line
+            stream += b"BT /F1 10 Tf %d %d Td (" % (x, line_y) + _encode_line(text, codes) + b") Tj ET\n"
+        page_ids.append(len(objects) + 1)
+        objects.append((f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+                        f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects) + 2} 0 R >>").encode("ascii"))
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + bytes(stream) + b"endstream")
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("ascii")
+    trailer_info = ""
+    if info:
+        objects.append(("<< " + " ".join(f"/{key} {_pdf_string(value)}" for key, value in info.items()) + " >>").encode("ascii"))
+        trailer_info = f" /Info {len(objects)} 0 R"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R{trailer_info} >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+    return bytes(out)
+
+
+def dei_bill_pages(contract_account, amount="45,10", payment_due="05/11/2025", next_measurement="15/12/2025", extra_pages=0):
+    """Pages of a synthetic DEI bill that parse_dei_data understands."""
+    rf_code = f"RF12{'0' * 10}{contract_account}" # contractNumber = last 12 characters
+    first = [
+        "ΔΕΗ Λογαριασμός Ρεύματος",
+        f"Αριθμός Λογαριασμού {contract_account}",
+        f"ΠΟΣΟ ΠΛΗΡΩΜΗΣ * {amount} €",
+        "ΕΞΟΦΛΗΣΗ ΕΩΣ",
+        payment_due,
+        "Επόμενη καταμέτρηση",
+        next_measurement,
+        rf_code,
+    ]
+    details = [["Ανάλυση χρεώσεων", f"Σελίδα {n + 2}", "Κατανάλωση 350 kWh 01/06/2025 - 01/08/2025"] for n in range(extra_pages)]
+    return [first] + details
+
+
+def zenith_bill_pages(contract_account, amount="61,20", issue_date="01/10/2025", period_start="01/08/2025",
+                      period_end="30/09/2025", next_measurement="30/11/2025", payment_due="24/10/2025", extra_pages=0):
+    """Pages of a synthetic Zenith bill that parse_zenith_data understands (payment due is the 5th date)."""
+    rf_code = f"RF34{'0' * 10}{contract_account}"
+    first = [
+        "ZENITH Λογαριασμός Ηλεκτρικής Ενέργειας",
+        f"Ημερομηνία έκδοσης {issue_date}",
+        f"Περίοδος κατανάλωσης {period_start} - {period_end}",
+        f"Επόμενη καταμέτρηση {next_measurement}",
+        f"Λήξη προθεσμίας πληρωμής {payment_due}",
+        f"Ποσό πληρωμής {amount} €",
+        f"Κωδικός ηλεκτρονικής πληρωμής {rf_code}",
+    ]
+    details = [["Ανάλυση χρεώσεων", f"Σελίδα {n + 2}", "Ενέργεια 420 kWh"] for n in range(extra_pages)]
+    return [first] + details
+
+
+def eyath_bill_pages(consumer_number="38-17-077-50-90", amount="32,63", start_measurement="11/04/2025",
+                     end_measurement="10/08/2025", next_start="11/08/2025", issue_date="01/10/2025",
+                     payment_due="27/10/2025", rf_code="RF08906109000012800574097", extra_pages=0):
+    """Pages of a synthetic EYATH bill that parse_eyath_data understands (payment due is the 5th and 6th date)."""
+    rf_spaced = " ".join(rf_code[i:i + 4] for i in range(0, len(rf_code), 4))
+    first = [
+        "ΕΥΑΘ Α.Ε. www.eyath.gr",
+        "ΛΟΓΑΡΙΑΣΜΟΣ ΥΔΡΕΥΣΗΣ",
+        f"Αριθμός καταναλωτή {consumer_number}",
+        f"ΑΡ.ΠΑΡΑΣΤΑΤΙΚΟΥ: {amount}",
+        f"Περίοδος κατανάλωσης {start_measurement} - {end_measurement}",
+        f"Επόμενη περίοδος από {issue_date}",
+        f"Επόμενη καταμέτρηση {next_start}",
+        f"{payment_due} ΠΑΓΙΟ ΤΕΛΟΣ",
+        f"{payment_due} ΠΟΛΗ",
+        f"* {rf_spaced} *",
+    ]
+    details = [["Ανάλυση χρεώσεων", f"Σελίδα {n + 2}", "Κατανάλωση 18 m3"] for n in range(extra_pages)]
+    return [first] + details
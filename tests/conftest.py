@@ -0,0 +1,54 @@
+"""
+Shared fixtures. Every test runs with the cache, the ledger and timings off,
+pypdf as the PDF text backend and a private $XDG_CACHE_HOME, whatever the
+environment of the person running them.
+
+    python3 -m pytest -q
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bill_service # noqa: E402
+import extraction_cache # noqa: E402
+import text_backends # noqa: E402
+from synthetic_pdf import make_pdf # noqa: E402
+
+CLEARED_ENV = (
+    extraction_cache.CACHE_ENV,
+    extraction_cache.CACHE_SIZE_ENV,
+    "AUTO_UTILITY_LEDGER",
+    "AUTO_UTILITY_TIMINGS",
+    "AUTO_UTILITY_PROFILE",
+)
+
+
+@pytest.fixture(autouse=True)
+def isolated_environment(monkeypatch, tmp_path):
+    for name in CLEARED_ENV:
+        monkeypatch.setenv(name, "") # set, so monkeypatch restores what enable_*() write
+        monkeypatch.delenv(name)
+    monkeypatch.setenv(text_backends.BACKEND_ENV, "pypdf")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg-cache"))
+    monkeypatch.setattr(text_backends, "_active", None)
+    monkeypatch.setattr(extraction_cache, "_default_cache", None)
+    monkeypatch.setattr(extraction_cache, "_extractor_version", None)
+
+
+@pytest.fixture
+def load_reader():
+    """The reader scripts (dashes in their names) by name, e.g. load_reader("eyath-reader")."""
+    return bill_service.load_reader
+
+
+@pytest.fixture
+def write_pdf(tmp_path):
+    """write_pdf(name, pages, **make_pdf kwargs) -> path of a synthetic PDF in tmp_path."""
+    def write(name, pages, **kwargs):
+        path = tmp_path / name
+        path.write_bytes(make_pdf(pages, **kwargs))
+        return str(path)
+    return write
@@ -0,0 +1,85 @@
+import pytest
+
+np = pytest.importorskip("numpy") # only bill_analytics.py needs it
+import bill_analytics
+from bill_analytics import NO_AMOUNT, NO_DATE, BillColumns
+
+DEI = "300004254333"
+EYATH = "38-17-077-50-90"
+
+
+def dei_bill(amount, due, paid=True, next_reading=None):
+    data = {"amountToPay": amount, "contractNumber": DEI, "paymentDue": due}
+    if next_reading:
+        data["nextMeasurement"] = next_reading
+    return "dei", data, paid
+
+
+def eyath_bill(amount, due, paid=False):
+    data = {"consumerNumber": EYATH, "amount": amount, "duePayment": due,
+            "startMeasurement": "11/04/2025", "endMeasurement": "10/08/2025"}
+    return "eyath", data, paid
+
+
+# Six ordinary DEI bills, a second one in June, then one far above the usual amount
+RECORDS = [dei_bill("45,10", f"05/{month:02d}/2025") for month in range(1, 7)] + [
+    dei_bill("44,90", "20/06/2025"),
+    dei_bill("1.234,56", "05/07/2025", paid=False, next_reading="15/08/2025"),
+    eyath_bill(32.63, "27/10/2025"),
+    ("dei", {"contractNumber": DEI}, False), # nothing but the contract
+]
+
+
+@pytest.fixture
+def bills():
+    return BillColumns.from_records(RECORDS)
+
+
+def day(iso):
+    return int(np.datetime64(iso, "D").astype(np.int64))
+
+
+def test_from_records_normalizes_every_reader_format(bills):
+    assert len(bills) == len(RECORDS)
+    assert bills.providers == ["dei", "eyath"] and bills.accounts == [DEI, EYATH]
+    assert bills.provider.dtype == np.int8 and bills.account.dtype == np.int32
+    assert bills.amount[[0, 7, 8, 9]].tolist() == [4510, 123456, 3263, NO_AMOUNT]
+    assert bills.due[[0, 8, 9]].tolist() == [day("2025-01-05"), day("2025-10-27"), NO_DATE]
+    assert bills.period_start[8] - bills.period_end[8] == day("2025-04-11") - day("2025-08-10")
+    assert bills.next_reading[7] == day("2025-08-15") and bills.next_reading[0] == NO_DATE
+    assert bills.paid.tolist() == [True] * 7 + [False] * 3
+
+
+def test_monthly_spend(bills):
+    spend = {(row["account"], row["month"]): (row["bills"], row["amount"]) for row in bill_analytics.monthly_spend(bills)}
+    assert spend[(DEI, "2025-06")] == (2, 90.0)
+    assert spend[(DEI, "2025-07")] == (1, 1234.56)
+    assert spend[(EYATH, "2025-10")] == (1, 32.63)
+    assert len(spend) == 8 # the bill without an amount or a due date is left out
+
+
+def test_anomalies_flag_only_the_outlier(bills):
+    flagged = bill_analytics.anomalies(bills)
+    assert [(row["account"], row["due"], row["amount"]) for row in flagged] == [(DEI, "2025-07-05", 1234.56)]
+    assert flagged[0]["baseline"] == round((45.10 * 5 + 44.90) / 6, 2)
+    assert bill_analytics.anomalies(bills, min_history=10) == []
+
+
+def test_upcoming_due_counts_only_unpaid_bills(bills):
+    due = bill_analytics.upcoming_due(bills, today="2025-10-01", days=30)
+    assert due["upcoming"] == {"bills": 1, "amount": 32.63, "byProvider": {"eyath": {"bills": 1, "amount": 32.63}}}
+    assert due["overdue"] == {"bills": 1, "amount": 1234.56, "byProvider": {"dei": {"bills": 1, "amount": 1234.56}}}
+    assert bill_analytics.upcoming_due(bills, today="2025-10-01", days=7)["upcoming"]["bills"] == 0
+
+
+def test_npz_round_trip(bills, tmp_path):
+    path = str(tmp_path / "history.npz")
+    bill_analytics.save(bills, path)
+    loaded = bill_analytics.load(path)
+    assert (loaded.providers, loaded.accounts) == (bills.providers, bills.accounts)
+    assert loaded.columns.keys() == bills.columns.keys()
+    for name, values in bills.columns.items():
+        assert loaded.columns[name].dtype == values.dtype
+        assert np.array_equal(loaded.columns[name], values)
+    assert bill_analytics.report(loaded, bill_analytics.REPORTS, "2025-10-01") == \
+        bill_analytics.report(bills, bill_analytics.REPORTS, "2025-10-01")
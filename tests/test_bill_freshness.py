@@ -0,0 +1,65 @@
+import datetime
+import os
+
+import pytest
+
+import bill_freshness
+from synthetic_pdf import dei_bill_pages, make_pdf
+
+CONTRACT = "300004254333"
+TODAY = datetime.date(2025, 11, 20)
+
+
+@pytest.fixture
+def bill_dir(tmp_path):
+    return tmp_path / "dei"
+
+
+def write_bill(path, info=None, **fields):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(make_pdf(dei_bill_pages(CONTRACT, **fields), info=info))
+    return str(path)
+
+
+def contents(directory):
+    return sorted(path.read_bytes() for path in directory.iterdir())
+
+
+def test_latest_bill_and_when_a_new_one_can_exist(bill_dir):
+    write_bill(bill_dir / f"{CONTRACT}_2025-11.pdf", next_measurement="15/12/2025")
+    known = bill_freshness.latest_bill(str(bill_dir), CONTRACT, TODAY)
+    assert known.path.endswith(f"{CONTRACT}_2025-11.pdf")
+    assert not bill_freshness.new_bill_possible(known.data, TODAY)
+    assert bill_freshness.new_bill_possible(known.data, datetime.date(2025, 12, 22))
+
+
+def test_dated_files_are_left_alone_until_asked(bill_dir):
+    dated = write_bill(bill_dir / "2025-10-20_08-00-00.pdf")
+    assert bill_freshness.latest_bill(str(bill_dir), CONTRACT, TODAY) is None
+    assert os.listdir(bill_dir) == [os.path.basename(dated)]
+    assert bill_freshness.rename_dated_files(str(bill_dir)) == [(dated, str(bill_dir / f"{CONTRACT}_2025-11.pdf"))]
+    assert bill_freshness.latest_bill(str(bill_dir), CONTRACT, TODAY) is not None
+
+
+def test_same_bytes_take_the_place_of_the_filed_bill(bill_dir):
+    filed = write_bill(bill_dir / f"{CONTRACT}_2025-11.pdf")
+    download = write_bill(bill_dir / "2025-11-20_08-00-00.pdf")
+    before = contents(bill_dir)
+    assert bill_freshness.file_by_period(download, str(bill_dir)) == (filed, False)
+    assert os.listdir(bill_dir) == [os.path.basename(filed)]
+    assert contents(bill_dir) == before[:1]
+
+
+@pytest.mark.parametrize("fields, is_new", [
+    ({}, False), # the same bill in other bytes
+    ({"amount": "51,00"}, True), # a corrected bill of the same period
+])
+def test_other_bytes_keep_both_files(bill_dir, fields, is_new):
+    filed = write_bill(bill_dir / f"{CONTRACT}_2025-11.pdf")
+    download = write_bill(bill_dir / "2025-11-20_08-00-00.pdf", info={"Producer": "reissued"}, **fields)
+    before = contents(bill_dir)
+    assert bill_freshness.file_by_period(download, str(bill_dir)) == (filed, is_new)
+    assert contents(bill_dir) == before
+    assert len(os.listdir(bill_dir)) == 2
+    with open(filed, "rb") as f:
+        assert b"reissued" in f.read() # the download took the name
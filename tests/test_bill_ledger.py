@@ -0,0 +1,106 @@
+from bill_ledger import BillLedger, amount_cents, bill_key, file_hash, iso_date
+from synthetic_mail import dei_email
+from synthetic_pdf import dei_bill_pages
+
+
+def test_normalised_keys():
+    assert iso_date("27/10/2025") == iso_date("27.10.2025") == "2025-10-27"
+    assert iso_date("31/02/2025") is None
+    assert amount_cents("45,10") == amount_cents(45.1) == 4510
+    assert amount_cents("1.234,56") == 123456
+    assert bill_key({"RFpayment": "RF1", "consumerNumber": "38", "amount": 32.63, "duePayment": "27/10/2025"}) == \
+        ("RF1", "38", 3263, "2025-10-27")
+
+
+def test_same_pdf_is_parsed_once(tmp_path, write_pdf, load_reader):
+    reader = load_reader("electricity-reader")
+    path = write_pdf("bill.pdf", dei_bill_pages("300004254333"))
+    calls = []
+
+    def parse(pdf_path):
+        calls.append(pdf_path)
+        return reader.process_dei_file(pdf_path)
+
+    with BillLedger(str(tmp_path / "ledger.sqlite3")) as ledger:
+        first = ledger.parse_once(path, "dei", "dei:1", parse)
+        again = ledger.parse_once(path, "dei", "dei:1", parse)
+        assert first == again
+        assert len(calls) == 1
+        assert ledger.stats() == {"bills": 1, "unpaid": 1, "sources": 1}
+
+
+def test_skip_known_drops_parsed_files(tmp_path, write_pdf):
+    known = write_pdf("known.pdf", dei_bill_pages("300004254333"))
+    new = write_pdf("new.pdf", dei_bill_pages("300004254334"))
+    with BillLedger(str(tmp_path / "ledger.sqlite3")) as ledger:
+        ledger.add(file_hash(known), known, "pdf", "dei", "dei:1", {"RFcode": "RF12", "paymentDue": "05/11/2025"})
+        ledger.flush()
+        remaining, hashes, skipped = ledger.skip_known([known, new], "dei:1")
+        assert (remaining, skipped) == ([new], 1)
+        assert set(hashes) == {known, new}
+        assert ledger.skip_known([known, new], "dei:2")[2] == 0 # a new parser version reads everything again
+
+
+def test_email_and_pdf_of_one_bill_are_merged(tmp_path, write_pdf, load_reader):
+    body_reader = load_reader("body-reader")
+    electricity_reader = load_reader("electricity-reader")
+    pdf_path = write_pdf("bill.pdf", dei_bill_pages("300004254333", payment_due="05/11/2025"))
+    email_data = body_reader.parse_message(dei_email("300004254333", payment_due="05/11/2025"))
+    pdf_data = electricity_reader.process_dei_file(pdf_path)
+
+    with BillLedger(str(tmp_path / "ledger.sqlite3")) as ledger:
+        ledger.add("email-digest", "notice.eml", "email", "dei", "email:1", email_data)
+        ledger.add(file_hash(pdf_path), pdf_path, "pdf", "dei", "dei:1", pdf_data)
+        ledger.flush()
+        assert ledger.stats() == {"bills": 1, "unpaid": 1, "sources": 2}
+        [bill] = ledger.outstanding()
+        assert (bill["account"], bill["amountCents"], bill["dueDate"]) == ("300004254333", 4510, "2025-11-05")
+
+
+def test_outstanding_by_due_date_and_paid(tmp_path):
+    with BillLedger(str(tmp_path / "ledger.sqlite3")) as ledger:
+        for number, due in enumerate(("27/10/2025", "05/09/2025", None)):
+            ledger.add(f"digest-{number}", None, "pdf", "eyath", "eyath:1",
+                       {"RFpayment": f"RF{number}", "duePayment": due, "amount": 10.0})
+        ledger.flush()
+        due_dates = [row["dueDate"] for row in ledger.outstanding()]
+        assert due_dates == ["2025-09-05", "2025-10-27", None]
+        ledger.mark_paid([ledger.outstanding()[0]["id"]])
+        assert [row["dueDate"] for row in ledger.outstanding()] == ["2025-10-27", None]
+        assert len(ledger.outstanding(include_paid=True)) == 3
+
+
+def test_every_parser_of_a_document_is_kept(tmp_path, write_pdf):
+    path = write_pdf("bill.pdf", dei_bill_pages("300004254333"))
+    digest = file_hash(path)
+    with BillLedger(str(tmp_path / "ledger.sqlite3")) as ledger:
+        ledger.add(digest, path, "pdf", "dei", "dei:1", {"RFcode": "RF12", "paymentDue": "05/11/2025", "by": "text"})
+        ledger.add(digest, path, "pdf", "dei", "layout:dei:1", {"RFcode": "RF12", "paymentDue": "05/11/2025", "by": "layout"})
+        ledger.flush()
+        assert ledger.lookup(digest, "dei:1")["by"] == "text"
+        assert ledger.lookup(digest, "layout:dei:1")["by"] == "layout"
+        assert ledger.known([digest], "dei:1") == ledger.known([digest], "layout:dei:1") == {digest}
+        assert ledger.stats() == {"bills": 1, "unpaid": 1, "sources": 1}
+
+
+def test_ledger_keyed_by_content_hash_alone_is_upgraded(tmp_path):
+    import sqlite3
+    path = str(tmp_path / "ledger.sqlite3")
+    with BillLedger(path) as ledger:
+        ledger.add("digest", "bill.pdf", "pdf", "dei", "dei:1", {"RFcode": "RF12", "paymentDue": "05/11/2025"})
+    db = sqlite3.connect(path)
+    columns = "content_hash, bill_id, source, kind, parser, data, seen"
+    db.executescript(f"""
+        CREATE TABLE old_sources (content_hash TEXT PRIMARY KEY, bill_id INTEGER NOT NULL REFERENCES bills (id),
+            source TEXT, kind TEXT NOT NULL, parser TEXT NOT NULL, data TEXT NOT NULL, seen REAL NOT NULL);
+        INSERT INTO old_sources SELECT {columns} FROM sources;
+        DROP TABLE sources;
+        ALTER TABLE old_sources RENAME TO sources;
+    """)
+    db.close()
+    with BillLedger(path) as ledger:
+        assert ledger.lookup("digest", "dei:1")["RFcode"] == "RF12"
+        ledger.add("digest", "bill.pdf", "pdf", "dei", "dei:2", {"RFcode": "RF12", "paymentDue": "05/11/2025"})
+        ledger.flush()
+        assert ledger.lookup("digest", "dei:1") is not None
+        assert ledger.lookup("digest", "dei:2") is not None
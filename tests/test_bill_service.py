@@ -0,0 +1,114 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import pytest
+
+import bill_service
+from synthetic_mail import dei_email
+from synthetic_pdf import dei_bill_pages, make_pdf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_email_in_a_greek_8bit_charset():
+    message = dei_email()
+    message.set_content(message.get_content(), charset="iso-8859-7", cte="8bit")
+    raw = message.as_bytes()
+    with pytest.raises(UnicodeDecodeError):
+        raw.decode("utf-8")
+    result = bill_service.handle_request({"kind": "email"}, raw)
+    assert result["RFcode"] == "RF120000000000300004254333"
+    assert result["paymentDue"] == "05/11/2025"
+
+
+def test_auto_routed_pdf_request():
+    pdf = make_pdf(dei_bill_pages("300004254333"))
+    result = bill_service.handle_request({"kind": "pdf", "provider": None}, pdf)
+    assert (result["provider"], result["contractNumber"]) == ("dei", "300004254333")
+
+
+def test_memory_mode_requests_do_not_overlap(monkeypatch):
+    running, overlapping, tracing = [], [], []
+    handle = bill_service._handle_request
+
+    def slow(header, content):
+        running.append(header)
+        overlapping.append(len(running))
+        time.sleep(0.05)
+        tracing.append(tracemalloc.is_tracing())
+        running.remove(header)
+        return handle(header, content)
+
+    monkeypatch.setattr(bill_service, "_handle_request", slow)
+    pdf = make_pdf(dei_bill_pages("300004254333"))
+    replies = []
+    threads = [threading.Thread(target=lambda: replies.append(bill_service.handle_request(
+        {"kind": "pdf", "provider": "dei", "timings": "memory"}, pdf))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlapping == [1] * 4 and tracing == [True] * 4
+    assert all("peak_kb" in reply["timings"]["stages"]["parse"] for reply in replies)
+    assert not tracemalloc.is_tracing()
+
+
+def test_errors_are_replies():
+    assert "error" in bill_service.handle_request({"kind": "pdf", "provider": "dei"}, b"not a pdf")
+    assert "error" in bill_service.handle_request({"kind": "fax"}, b"")
+
+
+@pytest.mark.parametrize("flags, start, kind", [
+    ({"auto": True}, b"%PDF-1.4", "pdf"),
+    ({"auto": True}, b"From: noreply@dei.gr", "email"),
+    ({"auto": True, "email": True}, b"%PDF-1.4", "email"),
+    ({"auto": True, "pdf": True}, b"From: x", "pdf"),
+    ({"dei": True}, b"From: x", "pdf"),
+])
+def test_client_request_kind(load_reader, tmp_path, flags, start, kind):
+    client = load_reader("bill-client")
+    path = tmp_path / "input"
+    path.write_bytes(start)
+    args = SimpleNamespace(**dict({"auto": False, "email": False, "pdf": False, "file": str(path)}, **flags))
+    assert client.request_kind(args) == kind
+    assert client.request_kind(args, start) == kind
+
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to about 100 bytes, more than tmp_path may leave.
+    path = os.path.join("/tmp", f"auto-utility-test-{os.getpid()}.sock")
+    yield path
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def test_daemon_keeps_a_live_socket_and_replaces_a_stale_one(load_reader, socket_path):
+    daemon = load_reader("bill-daemon")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path) # bound but never listening: what a killed daemon leaves behind
+    stale.close()
+    assert not daemon.socket_in_use(socket_path)
+
+    command = [sys.executable, os.path.join(ROOT, "bill-daemon.py"), "-q", "-s", socket_path]
+    first = subprocess.Popen(command)
+    try:
+        deadline = time.monotonic() + 30
+        while not daemon.socket_in_use(socket_path):
+            assert first.poll() is None and time.monotonic() < deadline
+            time.sleep(0.05)
+        second = subprocess.run(command, stderr=subprocess.PIPE, timeout=30)
+        assert second.returncode != 0
+        assert b"already listening" in second.stderr
+        reply = load_reader("bill-client").send_request(socket_path, {"kind": "pdf", "provider": "dei"},
+                                                        make_pdf(dei_bill_pages("300004254333")))
+        assert reply["contractNumber"] == "300004254333"
+    finally:
+        first.terminate()
+        first.wait(timeout=30)
@@ -0,0 +1,81 @@
+import os
+import time
+
+import pytest
+
+SETTLE = 0.3
+
+
+@pytest.fixture
+def bill_watch(load_reader):
+    return load_reader("bill-watch")
+
+
+@pytest.fixture
+def folders(bill_watch, tmp_path):
+    watcher = bill_watch.FolderWatcher([(str(tmp_path), "auto")], settle=SETTLE)
+    yield watcher
+    watcher.close()
+
+
+def poll_until_ready(folders, timeout=5.0):
+    """Everything reported ready until nothing is pending (or the timeout)."""
+    ready = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ready += folders.poll()
+        if ready and not folders.pending:
+            break
+    return ready
+
+
+def test_request_for_by_kind(bill_watch):
+    assert bill_watch.request_for("/in/bill.pdf", "auto") == {"kind": "pdf", "provider": None, "path": "/in/bill.pdf"}
+    assert bill_watch.request_for("/in/bill.PDF", "dei")["provider"] == "dei"
+    assert bill_watch.request_for("/in/notice.eml", "auto")["kind"] == "email"
+    assert bill_watch.request_for("/in/notice.eml", "dei") is None
+    assert bill_watch.request_for("/in/bill.pdf", "email") is None
+    assert bill_watch.request_for("/in/.bill.pdf", "auto") is None
+
+
+def test_file_written_twice_is_reported_once_after_the_last_write(folders, tmp_path):
+    path = tmp_path / "bill.pdf"
+    path.write_bytes(b"%PDF-" + b"a" * 100)
+    assert folders.poll() == []
+    time.sleep(SETTLE / 2)
+    with open(path, "ab") as f: # a second write inside the settle time restarts it
+        f.write(b"b" * 100)
+    ready = poll_until_ready(folders)
+    assert [item[0] for item in ready] == [str(path)]
+    assert folders.done[str(path)][0] == 205
+
+
+def test_part_companion_holds_the_file_back(folders, tmp_path):
+    path = tmp_path / "bill.pdf"
+    part = tmp_path / "bill.pdf.part"
+    part.write_bytes(b"")
+    path.write_bytes(b"%PDF-1")
+    deadline = time.monotonic() + SETTLE * 3
+    while time.monotonic() < deadline:
+        assert folders.poll() == []
+    os.remove(part)
+    assert [item[0] for item in poll_until_ready(folders)] == [str(path)]
+
+
+def test_empty_and_unrelated_files_are_ignored(folders, tmp_path):
+    (tmp_path / "empty.pdf").write_bytes(b"")
+    (tmp_path / "notes.txt").write_text("x")
+    (tmp_path / "bill.pdf").write_bytes(b"%PDF-1")
+    assert [os.path.basename(item[0]) for item in poll_until_ready(folders)] == ["bill.pdf"]
+
+
+def test_existing_files_only_with_initial(bill_watch, tmp_path):
+    (tmp_path / "old.pdf").write_bytes(b"%PDF-1")
+    skipped = bill_watch.FolderWatcher([(str(tmp_path), "auto")], settle=0.05)
+    initial = bill_watch.FolderWatcher([(str(tmp_path), "auto")], settle=0.05, initial=True)
+    try:
+        assert skipped.pending == {}
+        assert [os.path.basename(item[0]) for item in poll_until_ready(initial)] == ["old.pdf"]
+    finally:
+        skipped.close()
+        initial.close()
@@ -0,0 +1,76 @@
+"""Early exit (--early-exit) must return what a full parse returns, on any page layout."""
+import pytest
+
+from synthetic_pdf import dei_bill_pages, eyath_bill_pages, zenith_bill_pages
+
+RF_LINE = "* RF08 9061 0900 0012 8005 7409 7 *"
+FILLER = [["Ανάλυση χρεώσεων", "Κατανάλωση 18 m3"]]
+
+EYATH_LAYOUTS = {
+    "standard": eyath_bill_pages(extra_pages=4),
+    # 5th and 6th dates differ: duePayment falls back to the date before ΠΑΓΙΟ ΤΕΛΟΣ, on page 2
+    "pagio-on-a-later-page": [
+        ["ΕΥΑΘ Α.Ε.", "Αριθμός καταναλωτή 38-17-077-50-90", "ΑΡ.ΠΑΡΑΣΤΑΤΙΚΟΥ: 32,63",
+         "Περίοδος 11/04/2025 - 10/08/2025", "Έκδοση 01/10/2025", "Επόμενη 11/08/2025",
+         "20/10/2025 ΠΟΛΗ", "Λήξη 27/10/2025", RF_LINE],
+        ["27/10/2025 ΠΑΓΙΟ ΤΕΛΟΣ"],
+    ] + FILLER * 2,
+    # Only four dates on the first page: the 5th/6th rule is decided on page 2
+    "dates-across-pages": [
+        ["ΕΥΑΘ Α.Ε.", "Αριθμός καταναλωτή 38-17-077-50-90", "ΑΡ.ΠΑΡΑΣΤΑΤΙΚΟΥ: 32,63",
+         "Περίοδος 11/04/2025 - 10/08/2025", "Έκδοση 01/10/2025", "Επόμενη 11/08/2025", RF_LINE],
+        ["20/10/2025 ΠΟΛΗ", "27/10/2025 ΠΑΓΙΟ ΤΕΛΟΣ"],
+        ["27/10/2025 ΠΑΓΙΟ ΤΕΛΟΣ", "27/10/2025 ΠΟΛΗ"],
+    ] + FILLER,
+    # The consumer number only on page 3
+    "consumer-number-late": [
+        eyath_bill_pages()[0][:2] + eyath_bill_pages()[0][3:],
+    ] + FILLER + [["Αριθμός καταναλωτή 38-17-077-50-90"]] + FILLER,
+    # Nothing the rules need: both modes read everything and agree on the gaps
+    "no-fields": FILLER * 5,
+}
+
+
+@pytest.mark.parametrize("max_pages", [1, 3, 10])
+@pytest.mark.parametrize("layout", sorted(EYATH_LAYOUTS))
+def test_eyath_early_exit_equals_full_parse(layout, max_pages, write_pdf, load_reader):
+    eyath = load_reader("eyath-reader")
+    path = write_pdf(f"{layout}.pdf", EYATH_LAYOUTS[layout])
+    full = eyath.process_pdf_file(path)
+    assert eyath.process_pdf_file(path, early_exit=True, max_pages=max_pages) == full
+
+
+def test_eyath_fallback_layout_really_depends_on_page_2(write_pdf, load_reader):
+    eyath = load_reader("eyath-reader")
+    path = write_pdf("bill.pdf", EYATH_LAYOUTS["pagio-on-a-later-page"])
+    assert eyath.process_pdf_file(path)["duePayment"] == "27/10/2025"
+    first_page_only = eyath.parse_raw_text(eyath.text_backends.open_document(path).page_text(0) + "\n")
+    assert first_page_only["duePayment"] == "20/10/2025"
+
+
+def test_eyath_early_exit_stops_on_the_first_page(write_pdf, load_reader, monkeypatch):
+    eyath = load_reader("eyath-reader")
+    path = write_pdf("bill.pdf", eyath_bill_pages(extra_pages=4))
+    checked = []
+    fields_complete = eyath.fields_complete
+
+    def counting(text):
+        checked.append(text)
+        return fields_complete(text)
+
+    monkeypatch.setattr(eyath, "fields_complete", counting)
+    assert eyath.process_pdf_file(path, early_exit=True) == eyath.process_pdf_file(path)
+    assert len(checked) == 1
+
+
+@pytest.mark.parametrize("provider, pages", [
+    ("dei", dei_bill_pages("300004254333", extra_pages=4)),
+    ("dei", FILLER + dei_bill_pages("300004254333")),
+    ("zenith", zenith_bill_pages("300004254333", extra_pages=4)),
+    ("zenith", FILLER + zenith_bill_pages("300004254333")),
+])
+def test_electricity_early_exit_equals_full_parse(provider, pages, write_pdf, load_reader):
+    electricity = load_reader("electricity-reader")
+    process = electricity.process_dei_file if provider == "dei" else electricity.process_zenith_file
+    path = write_pdf("bill.pdf", pages)
+    assert process(path, early_exit=True, max_pages=2) == process(path)
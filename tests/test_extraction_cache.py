@@ -0,0 +1,125 @@
+import pytest
+
+import extraction_cache
+from extraction_cache import ExtractionCache, cached_extract_and_parse
+
+
+class Counting:
+    """extract() and parse() stand-ins that count their calls."""
+
+    def __init__(self, text="ΠΟΣΟ 12,30"):
+        self.text = text
+        self.extracted = 0
+        self.parsed = 0
+
+    def extract(self, stream):
+        self.extracted += 1
+        stream.read()
+        return self.text
+
+    def parse(self, text):
+        self.parsed += 1
+        return {"length": len(text)}
+
+
+def test_second_read_comes_from_the_cache(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    calls = Counting()
+    first = cached_extract_and_parse(b"%PDF-1", calls.extract, calls.parse, "test:1", cache)
+    second = cached_extract_and_parse(b"%PDF-1", calls.extract, calls.parse, "test:1", cache)
+    assert first == second == {"length": 10}
+    assert (calls.extracted, calls.parsed) == (1, 1)
+
+
+def test_parser_version_bump_reparses_the_cached_text(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    calls = Counting()
+    cached_extract_and_parse(b"%PDF-1", calls.extract, calls.parse, "test:1", cache)
+    cached_extract_and_parse(b"%PDF-1", calls.extract, calls.parse, "test:2", cache)
+    assert (calls.extracted, calls.parsed) == (1, 2)
+
+
+def test_other_content_is_a_miss(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    calls = Counting()
+    cached_extract_and_parse(b"%PDF-1", calls.extract, calls.parse, "test:1", cache)
+    cached_extract_and_parse(b"%PDF-2", calls.extract, calls.parse, "test:1", cache)
+    assert calls.extracted == 2
+
+
+def test_extractor_change_invalidates_both_layers(tmp_path, monkeypatch):
+    cache = ExtractionCache(str(tmp_path))
+    calls = Counting()
+    cached_extract_and_parse(b"%PDF-1", calls.extract, calls.parse, "test:1", cache)
+    monkeypatch.setattr(extraction_cache, "_extractor_version", "other-backend-1.0-r1")
+    cached_extract_and_parse(b"%PDF-1", calls.extract, calls.parse, "test:1", cache)
+    assert (calls.extracted, calls.parsed) == (2, 2)
+
+
+def test_partial_text_is_not_kept_for_other_parsers(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    calls = Counting()
+    cached_extract_and_parse(b"%PDF-1", calls.extract, calls.parse, "test:1", cache, cache_text=False)
+    cached_extract_and_parse(b"%PDF-1", calls.extract, calls.parse, "test:2", cache)
+    assert calls.extracted == 2
+
+
+def test_size_stays_within_the_budget_and_recent_entries_survive(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_bytes=1000)
+    for number in range(20):
+        cache.put_text(f"digest-{number}", "x" * 100)
+        assert cache.get_text("digest-0") is not None # kept in use, so never the least recent
+    stats = cache.stats()
+    assert stats["bytes"] <= 1000
+    assert cache.get_text("digest-19") is not None
+    assert cache.get_text("digest-1") is None
+
+
+def test_enabled_by_environment(tmp_path):
+    assert extraction_cache.default_cache() is None
+    extraction_cache.enable_cache(str(tmp_path))
+    assert extraction_cache.default_cache().path.startswith(str(tmp_path))
+
+
+def test_lookups_do_not_write_until_flushed(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    cache.put_text("digest", "text")
+    changes = cache.db.total_changes
+    for _ in range(10):
+        assert cache.get_text("digest") == "text"
+        assert cache.get_text("other") is None
+    assert cache.db.total_changes == changes
+    assert cache.stats()["text"] == {"hits": 10, "misses": 10}
+
+
+def test_running_totals_follow_replacements_and_reopening(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    cache.put_text("a", "x" * 10)
+    cache.put_text("b", "x" * 20)
+    cache.put_text("a", "x" * 5) # replaced, not added
+    assert (cache.stats()["entries"], cache.stats()["bytes"]) == (2, 25)
+    cache.close()
+    reopened = ExtractionCache(str(tmp_path))
+    assert (reopened.stats()["entries"], reopened.stats()["bytes"]) == (2, 25)
+    reopened.clear()
+    assert (reopened.stats()["entries"], reopened.stats()["bytes"]) == (0, 0)
+
+
+def test_totals_of_a_cache_made_before_them(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    cache.put_text("a", "x" * 10)
+    cache.db.execute("DROP TABLE totals")
+    cache.db.commit()
+    cache.close()
+    assert ExtractionCache(str(tmp_path)).stats()["bytes"] == 10
+
+
+def test_dei_reader_goes_through_the_cache(tmp_path, write_pdf, load_reader, monkeypatch):
+    from synthetic_pdf import dei_bill_pages
+    dei_reader = load_reader("dei-reader")
+    path = write_pdf("dei.pdf", dei_bill_pages("300004254333"))
+    extraction_cache.enable_cache(str(tmp_path / "cache"))
+    first = dei_reader.process_pdf_file(path)
+    monkeypatch.setattr(dei_reader, "read_pdf_text", lambda source: pytest.fail("extracted again"))
+    assert dei_reader.process_pdf_file(path) == first
+    assert first["contractNumber"] == "300004254333"
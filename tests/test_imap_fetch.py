@@ -0,0 +1,159 @@
+import asyncio
+import email
+import imaplib
+import io
+import json
+import threading
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+
+import imap_fetch
+import mime_stream
+from synthetic_mail import dei_email
+
+
+@pytest.fixture
+def mock_imap(load_reader):
+    return load_reader("mock-imap")
+
+
+@pytest.fixture
+def imap_server(mock_imap):
+    server = mock_imap.ImapServer(("127.0.0.1", 0), mock_imap.ImapHandler)
+    server.mailbox = mock_imap.Mailbox(mock_imap.build_messages(6, 4, attachment_kb=1))
+    server.password, server.delay, server.quiet = None, 0.0, True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def target(imap_server):
+    return imap_fetch.ImapTarget("127.0.0.1", imap_server.server_address[1], False, "me", "secret", "INBOX")
+
+
+def ingest(body, target, state_path):
+    out = io.StringIO()
+    body.ingest_imap(target, out, str(state_path), connections=2)
+    return [json.loads(line)["key"] for line in out.getvalue().splitlines()]
+
+
+def test_watermark_only_passes_handled_uids():
+    watermark = imap_fetch.Watermark(10, [11, 12, 14])
+    watermark.done(12)
+    assert watermark.value == 10
+    watermark.done(11)
+    assert watermark.value == 12
+    watermark.done(14)
+    assert watermark.value == 14
+
+
+def test_state_is_kept_per_mailbox(tmp_path):
+    path = str(tmp_path / "imap.state")
+    assert imap_fetch.load_state(path, "imap://a") == (None, 0)
+    imap_fetch.save_state(path, "imap://a", 7, 120)
+    imap_fetch.save_state(path, "imap://b", 3, 5)
+    assert imap_fetch.load_state(path, "imap://a") == (7, 120)
+    assert imap_fetch.load_state(path, "imap://b") == (3, 5)
+
+
+def test_runs_read_only_new_mail(imap_server, target, mock_imap, load_reader, tmp_path):
+    body = load_reader("body-reader")
+    state = tmp_path / "imap.state"
+    assert len(ingest(body, target, state)) == 6 # the bill notices, not the noise
+    assert ingest(body, target, state) == []
+    imap_server.mailbox = mock_imap.Mailbox(mock_imap.build_messages(6, 4, new=2, attachment_kb=1))
+    assert ingest(body, target, state) == ["11", "12"]
+    assert imap_fetch.load_state(str(state), imap_fetch.display_url(target)) == (mock_imap.UIDVALIDITY, 12)
+
+
+def test_new_uidvalidity_reads_the_mailbox_again(target, mock_imap, load_reader, tmp_path, monkeypatch):
+    body = load_reader("body-reader")
+    state = tmp_path / "imap.state"
+    first = ingest(body, target, state)
+    monkeypatch.setattr(mock_imap, "UIDVALIDITY", mock_imap.UIDVALIDITY + 1)
+    assert ingest(body, target, state) == first
+    assert imap_fetch.load_state(str(state), imap_fetch.display_url(target))[0] == mock_imap.UIDVALIDITY
+
+
+def _mixed(*parts):
+    message = MIMEMultipart("mixed")
+    for part in parts:
+        message.attach(part)
+    message["From"] = "noreply@dei.gr"
+    message["Message-ID"] = "<bill@dei.gr>"
+    return message
+
+
+def _attachment(text):
+    part = MIMEText(text, "plain", "utf-8")
+    part.add_header("Content-Disposition", "attachment", filename="notes.txt")
+    return part
+
+
+def _alternative(text):
+    alternative = MIMEMultipart("alternative")
+    alternative.attach(MIMEText(text, "plain", "iso-8859-7"))
+    alternative.attach(MIMEText(f"<p>{text}</p>", "html", "utf-8"))
+    return alternative
+
+
+TEXT = dei_email().get_content()
+MESSAGES = {
+    # an attached text file first, the body inside multipart/alternative
+    "2.1": _mixed(_attachment("not the bill"), _alternative(TEXT)),
+    # the base64 text/plain part wins over an earlier one in another encoding
+    "2": _mixed(MIMEText("plain ascii first", "plain", "us-ascii"), MIMEText(TEXT, "plain", "utf-8")),
+    "1": dei_email(attachment=("bill.pdf", b"%PDF-1.4 x")),
+}
+
+
+@pytest.mark.parametrize("section", sorted(MESSAGES))
+def test_bodystructure_section_is_the_part_mime_stream_reads(section, mock_imap):
+    raw = MESSAGES[section].as_bytes()
+    structure = imap_fetch.parse_values(mock_imap.bodystructure(email.message_from_bytes(raw)).encode())[0]
+    assert imap_fetch.find_text_part(structure)[0] == section
+
+
+def test_fetched_text_equals_mime_stream(imap_server, target, mock_imap):
+    raws = [MESSAGES[section].as_bytes() for section in sorted(MESSAGES)]
+    imap_server.mailbox = mock_imap.Mailbox(raws)
+
+    async def fetch():
+        async with imap_fetch.ImapFetcher(target, ("dei.gr",)) as fetcher:
+            _uidvalidity, uids = await fetcher.search()
+            return {message.uid: message.text async for message in fetcher.messages(uids)}
+
+    texts = asyncio.run(fetch())
+    assert texts == {uid: mime_stream.read_plain_text(io.BytesIO(raw))[1] for uid, raw in enumerate(raws, 1)}
+
+
+def test_failed_connection_is_logged_out_and_replaced(target, monkeypatch):
+    fetch_chunk = imap_fetch._fetch_chunk
+    failures = []
+
+    def failing_once(connection, uids):
+        if not failures:
+            failures.append(connection)
+            raise imaplib.IMAP4.error("UID FETCH failed: NO")
+        return fetch_chunk(connection, uids)
+
+    monkeypatch.setattr(imap_fetch, "_fetch_chunk", failing_once)
+
+    async def run():
+        async with imap_fetch.ImapFetcher(target, connections=1) as fetcher:
+            _uidvalidity, uids = await fetcher.search()
+            with pytest.raises(imaplib.IMAP4.error):
+                [message async for message in fetcher.messages(uids)]
+            assert fetcher.opened == []
+            messages = [message async for message in fetcher.messages(uids)]
+            assert len(messages) == len(uids) and len(fetcher.opened) == 1
+            assert fetcher.opened[0] is not failures[0]
+            assert fetcher.bytes_received > fetcher.opened[0].received
+
+    asyncio.run(run())
+    assert failures[0].state == "LOGOUT"
@@ -0,0 +1,161 @@
+import email
+import io
+import json
+
+import pytest
+
+import bill_service
+import mime_stream
+import pdf_router
+from batch_runner import run_batch
+from synthetic_mail import dei_email, eyath_email
+from synthetic_pdf import dei_bill_pages, eyath_bill_pages, make_pdf, zenith_bill_pages
+
+EYATH_FIELDS = {
+    "RFpayment": "RF08906109000012800574097",
+    "startMeasurement": "11/04/2025",
+    "endMeasurement": "10/08/2025",
+    "duePayment": "27/10/2025",
+    "amount": 32.63,
+    "consumerNumber": "38-17-077-50-90",
+}
+DEI_FIELDS = {
+    "amountToPay": "45,10",
+    "RFcode": "RF120000000000300004254333",
+    "contractNumber": "300004254333",
+    "paymentDue": "05/11/2025",
+    "nextMeasurement": "15/12/2025",
+}
+ZENITH_FIELDS = {
+    "paymentDue": "24/10/2025",
+    "amountToPay": "61,20",
+    "RFcode": "RF340000000000300004254333",
+    "contractNumber": "300004254333",
+}
+
+
+@pytest.fixture
+def bills(write_pdf):
+    return {
+        "eyath": write_pdf("eyath.pdf", eyath_bill_pages(extra_pages=2)),
+        "dei": write_pdf("dei.pdf", dei_bill_pages("300004254333", extra_pages=2)),
+        "zenith": write_pdf("zenith.pdf", zenith_bill_pages("300004254333", extra_pages=2)),
+    }
+
+
+def test_pdf_readers(bills, load_reader):
+    eyath = load_reader("eyath-reader")
+    electricity = load_reader("electricity-reader")
+    assert eyath.process_pdf_file(bills["eyath"]) == EYATH_FIELDS
+    assert electricity.process_dei_file(bills["dei"]) == DEI_FIELDS
+    assert electricity.process_zenith_file(bills["zenith"]) == ZENITH_FIELDS
+
+
+def test_pdf_from_memory_equals_pdf_from_file(bills, load_reader):
+    eyath = load_reader("eyath-reader")
+    with open(bills["eyath"], "rb") as f:
+        content = f.read()
+    assert eyath.process_pdf_file(content) == eyath.process_pdf_file(io.BytesIO(content)) == EYATH_FIELDS
+
+
+@pytest.mark.parametrize("provider", ["eyath", "dei", "zenith"])
+def test_routing_by_text(bills, provider):
+    data = pdf_router.process_auto_file(bills[provider])
+    assert (data.pop("provider"), data.pop("routedBy")) == (provider, "text")
+    assert data == bill_service.parse_pdf(bills[provider], provider)
+
+
+def test_routing_by_metadata(write_pdf):
+    path = write_pdf("dei.pdf", dei_bill_pages("300004254333"), info={"Producer": "DEI billing"})
+    assert pdf_router.process_auto_file(path)["routedBy"] == "metadata"
+
+
+def test_unknown_pdf_is_an_error(write_pdf):
+    path = write_pdf("other.pdf", [["Some other document"]])
+    with pytest.raises(ValueError):
+        pdf_router.process_auto_file(path)
+
+
+def test_batch_results_equal_single_runs(bills, load_reader, tmp_path):
+    electricity = load_reader("electricity-reader")
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a pdf")
+    paths = [bills["dei"], str(broken)] + [bills["dei"]] * 3
+    results = {path: (data, error) for path, data, error, _ in run_batch(electricity.process_dei_file, paths, jobs=2)}
+    assert results[bills["dei"]] == (DEI_FIELDS, None)
+    assert results[str(broken)][0] is None and results[str(broken)][1]
+
+
+def test_page_parallel_extraction_equals_serial(write_pdf, load_reader):
+    eyath = load_reader("eyath-reader")
+    path = write_pdf("long.pdf", eyath_bill_pages(extra_pages=20))
+    serial = eyath.read_pdf_text(path)
+    assert eyath.process_pdf_file(path, page_jobs=2, parallel_min_pages=4) == eyath.parse_raw_text(serial)
+
+
+@pytest.mark.parametrize("message", [
+    eyath_email(),
+    dei_email(),
+    dei_email(attachment=("bill.pdf", make_pdf(dei_bill_pages("300004254333")))),
+], ids=["eyath", "dei", "dei-with-pdf"])
+def test_streaming_email_equals_full_parse(message, load_reader):
+    body = load_reader("body-reader")
+    raw = bytes(message)
+    full = body.parse_message(email.message_from_bytes(raw))
+    message_id, streamed = body.parse_stream(io.BytesIO(raw))
+    assert "error" not in full
+    assert streamed == full
+    assert message_id == message["Message-ID"]
+
+
+def test_email_fields(load_reader):
+    body = load_reader("body-reader")
+    assert body.parse_message(dei_email()) == {
+        "type": "electricity", "company": "dei", "RFcode": "RF120000000000300004254333",
+        "contractNumber": "300004254333", "amount": "45.10", "paymentDue": "05/11/2025",
+    }
+    assert body.parse_message(eyath_email())["consumerNumber"] == "38-17-077-50-90"
+
+
+def test_quoted_printable_greek_text_part():
+    message = dei_email()
+    message.set_content(message.get_content(), charset="iso-8859-7", cte="quoted-printable")
+    headers, text = mime_stream.read_plain_text(io.BytesIO(bytes(message)))
+    assert "Τελικό Ποσό Πληρωμής" in text
+
+
+def test_single_email_closes_its_ledger(tmp_path, load_reader, monkeypatch):
+    import bill_ledger
+    body = load_reader("body-reader")
+    closed = []
+    close = bill_ledger.BillLedger.close
+
+    def counting_close(ledger):
+        closed.append(ledger.path)
+        close(ledger)
+
+    monkeypatch.setattr(bill_ledger.BillLedger, "close", counting_close)
+    parses = []
+    monkeypatch.setattr(body, "parse_email_content", lambda *args, parse=body.parse_email_content: parses.append(1) or parse(*args))
+    path = tmp_path / "notice.eml"
+    path.write_bytes(bytes(dei_email()))
+    args = body.argparse.Namespace(file=str(path), stream=False, debug=False, eyath=False, dei=True,
+                                   ledger=str(tmp_path / "ledger.sqlite3"))
+    body.parse_single(args) # parsed and added
+    body.parse_single(args) # found in the ledger
+    assert closed == [args.ledger] * 2
+    assert len(parses) == 1
+
+
+@pytest.mark.parametrize("charset", ["iso-8859-7", "utf-8"])
+@pytest.mark.parametrize("stream", [False, True], ids=["default", "stream"])
+def test_8bit_notice_from_a_file(charset, stream, tmp_path, load_reader, capsys):
+    body = load_reader("body-reader")
+    message = eyath_email()
+    message.set_content(message.get_content(), charset=charset, cte="8bit")
+    path = tmp_path / "notice.eml"
+    path.write_bytes(message.as_bytes())
+    args = body.argparse.Namespace(file=str(path), stream=stream, debug=False, eyath=False, dei=False, ledger=None)
+    result = json.loads(body.parse_single(args))
+    assert result["consumerNumber"] == "38-17-077-50-90"
+    assert result["paymentDue"] == "27/10/2025"
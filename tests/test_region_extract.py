@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bill_service
+import pdf_router
+import region_extract
+from synthetic_pdf import dei_bill_pages, eyath_bill_pages, make_pdf, zenith_bill_pages
+
+BILLS = {
+    "eyath": eyath_bill_pages(),
+    "dei": dei_bill_pages("300004254333"),
+    "zenith": zenith_bill_pages("300004254333"),
+}
+
+
+def text_reader(provider):
+    return lambda source: bill_service.parse_pdf(source, provider)
+
+
+def shifted(pages):
+    """The same bill with one more line at the top, so every run is below its region."""
+    return [["Νέα διάταξη λογαριασμού"] + pages[0]] + pages[1:]
+
+
+@pytest.mark.parametrize("provider", sorted(BILLS))
+def test_layout_gives_the_text_readers_keys_in_order(provider):
+    pdf = make_pdf(BILLS[provider])
+    layout = region_extract.process_layout_file(pdf, provider, lambda source: pytest.fail("fell back"))
+    assert list(layout.items()) == list(bill_service.parse_pdf(pdf, provider).items())
+
+
+@pytest.mark.parametrize("provider", sorted(BILLS))
+def test_layout_that_does_not_fit_falls_back_to_the_text(provider, capsys):
+    pdf = make_pdf(shifted(BILLS[provider]))
+    text = bill_service.parse_pdf(pdf, provider)
+    assert region_extract.process_layout_file(pdf, provider, text_reader(provider)) == text
+    assert "reading the whole text instead" in capsys.readouterr().err
+
+
+def test_routed_layout_falls_back_to_the_text(capsys):
+    pdf = make_pdf(shifted(BILLS["dei"]))
+    data = pdf_router.process_auto_file(pdf, layout=True)
+    assert data == pdf_router.process_auto_file(pdf)
+    assert "layout regions" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("script", [["bill-reader.py"], ["electricity-reader.py", "--dei"], ["eyath-reader.py"]])
+def test_batch_runs_refuse_layout(script, tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, os.path.join(root, script[0])] + script[1:] + ["--layout", str(tmp_path)]
+    result = subprocess.run(command, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 2
+    assert "error: --layout" in result.stderr or "error: το --layout" in result.stderr
@@ -0,0 +1,77 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pypdf import PdfReader
+
+import benchmark
+import bill_service
+import text_backends
+from synthetic_pdf import dei_bill_pages, eyath_bill_pages, make_pdf, zenith_bill_pages
+
+BILLS = {
+    "eyath": make_pdf(eyath_bill_pages(extra_pages=2)),
+    "dei": make_pdf(dei_bill_pages("300004254333", extra_pages=2)),
+    "zenith": make_pdf(zenith_bill_pages("300004254333", extra_pages=2)),
+}
+
+
+PARITY_DOCS = 20
+
+
+def parsed_with(backend, provider):
+    text_backends.select_backend(backend)
+    return bill_service.parse_pdf(BILLS[provider], provider)
+
+
+def installed(backend):
+    if backend not in text_backends.available_backends():
+        pytest.skip(f"{backend} is not installed")
+
+
+@pytest.mark.parametrize("provider", sorted(BILLS))
+@pytest.mark.parametrize("backend", sorted(text_backends.BACKENDS))
+def test_every_backend_parses_the_same_fields(backend, provider):
+    installed(backend)
+    assert parsed_with(backend, provider) == parsed_with("pypdf", provider)
+    assert parsed_with("auto", provider) == parsed_with("pypdf", provider)
+
+
+@pytest.mark.parametrize("provider", benchmark.PDF_PROVIDERS)
+@pytest.mark.parametrize("backend", sorted(text_backends.BACKENDS))
+def test_parity_on_random_bills(backend, provider):
+    # benchmark.py --parity on a small corpus: the normalized text of every
+    # backend must give the readers' rules exactly what pypdf's text gives them
+    installed(backend)
+    _extract, parse = benchmark.stage_functions(provider)
+    for doc in benchmark.make_corpus(provider, PARITY_DOCS, seed=1, extra_pages=2):
+        assert parse(text_backends.read_text(doc, backend)) == parse(text_backends.read_text(doc, "pypdf"))
+
+
+def test_auto_never_picks_pdftotext(monkeypatch):
+    probed = []
+
+    def probe(names=None, repeat=text_backends.PROBE_REPEAT):
+        probed.append(list(names))
+        return {name: 0.0 if name == "pdftotext" else 1.0 for name in names}
+
+    monkeypatch.setattr(text_backends, "available_backends", lambda: ["pypdf", "pypdfium2", "pdftotext"])
+    monkeypatch.setattr(text_backends, "probe", probe)
+    text_backends.select_backend("auto")
+    assert text_backends.active_backend() in ("pypdf", "pypdfium2")
+    assert probed == [["pypdf", "pypdfium2"]]
+
+
+def test_pypdf_text_is_not_rewritten():
+    reader = PdfReader(io.BytesIO(BILLS["dei"]))
+    expected = "".join(page.extract_text() + "\n" for page in reader.pages)
+    assert text_backends.read_text(BILLS["dei"], "pypdf") == expected
+
+
+@pytest.mark.parametrize("backend", text_backends.available_backends())
+def test_threads_share_a_backend(backend):
+    # bill-daemon.py answers requests on threads
+    expected = text_backends.read_text(BILLS["eyath"], backend)
+    with ThreadPoolExecutor(8) as pool:
+        texts = list(pool.map(lambda content: text_backends.read_text(content, backend), [BILLS["eyath"]] * 64))
+    assert texts == [expected] * 64
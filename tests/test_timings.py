@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from synthetic_mail import eyath_email
+from synthetic_pdf import dei_bill_pages, eyath_bill_pages, make_pdf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(script, *args, stdin=None):
+    command = [sys.executable, os.path.join(ROOT, script)] + [str(arg) for arg in args]
+    return subprocess.run(command, input=stdin, capture_output=True, timeout=60, check=True, text=stdin is None)
+
+
+def stage_record(stderr):
+    return json.loads([line for line in stderr.splitlines() if line.startswith("{")][-1])["timings"]
+
+
+def test_timings_flag_leaves_the_input_positional(tmp_path):
+    path = tmp_path / "ey.eml"
+    path.write_bytes(bytes(eyath_email()))
+    result = run("body-reader.py", "--timings", path)
+    assert json.loads(result.stdout)["consumerNumber"] == "38-17-077-50-90"
+    assert "mime" in stage_record(result.stderr)["stages"]
+
+
+@pytest.mark.parametrize("mode", ["wall", "memory"])
+def test_timings_mode(write_pdf, mode):
+    path = write_pdf("ey.pdf", eyath_bill_pages())
+    result = run("eyath-reader.py", "--timings-mode", mode, path)
+    assert json.loads(result.stdout)["amount"] == 32.63
+    record = stage_record(result.stderr)
+    assert ("peak_kb" in record["stages"]["parse"]) == (mode == "memory")
+
+
+def test_dei_reader_timings(write_pdf, tmp_path):
+    path = write_pdf("dei.pdf", dei_bill_pages("300004254333"))
+    profile = tmp_path / "dei.prof"
+    result = run("dei-reader.py", "--timings", "--profile", profile, path)
+    assert json.loads(result.stdout)["contractNumber"] == "300004254333"
+    assert {"extract", "parse", "serialize"} <= set(stage_record(result.stderr)["stages"])
+    assert profile.stat().st_size > 0
+
+
+def test_one_profile_for_an_email_with_several_pdfs(tmp_path):
+    message = eyath_email(attachment=("first.pdf", make_pdf(eyath_bill_pages())))
+    message.add_attachment(make_pdf(eyath_bill_pages()), maintype="application", subtype="pdf", filename="second.pdf")
+    profile = tmp_path / "eyath.prof"
+    result = run("eyath-reader.py", "--profile", profile, "-", stdin=bytes(message))
+    stderr = result.stderr.decode()
+    assert stderr.count("Processing attached PDF") == 2
+    assert stderr.count("Profile written") == 1
+    assert profile.stat().st_size > 0
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Pluggable PDF text backends behind the readers' text extraction.
+
+    pypdf       pure Python, always present
+    pypdfium2   PDFium bindings, when the pypdfium2 package is installed
+    pdftotext   poppler's command line tool, run as a subprocess, when it is
+                on PATH
+
+A backend opens a document (path, bytes or binary stream) and gives the text
+of one page at a time. pypdf's text is passed on as it is, exactly what the
+readers have always seen. The other backends' output differs from it in
+small ways (PDFium ends lines with \\r\\n and leaves the last line of a page
+open, pdftotext ends every page with a form feed), so their pages go through
+normalize() and the rules of bill_rules.py see the same text whichever
+backend produced it.
+
+PDFium is not thread safe: every call into it, for any document, holds
+_pdfium_lock, so threaded callers (bill-daemon.py) can use it.
+
+The backend is chosen with the readers' --pdf-backend option or the
+AUTO_UTILITY_PDF_BACKEND environment variable. "auto" (the default) chooses
+among AUTO_BACKENDS only: it keeps pypdf when pypdfium2 is not installed;
+otherwise a startup probe times both on a small synthetic bill and the
+faster one is used for the rest of the process. pdftotext is used only when
+it is named: tests/test_text_backends.py checks every installed backend's
+JSON against pypdf's, and pdftotext has not been through it yet. The
+probe's winner is kept in ~/.cache/auto-utility/pdf-backend.json (or under
+$XDG_CACHE_HOME), keyed by the installed backends, so one-shot runs do not
+probe again until a backend is installed, removed or upgraded.
+
+    python3 text_backends.py             installed backends and probe times
+    python3 -m pytest tests/test_text_backends.py
+                                         same JSON from every installed backend?
+    python3 benchmark.py --parity        the same on a larger corpus
+
+Layout mode (region_extract.py) needs pypdf's positioned text runs and
+always uses pypdf.
+"""
+import argparse
+import importlib.util
+import io
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import unicodedata
+
+import timings
+
+BACKEND_ENV = "AUTO_UTILITY_PDF_BACKEND"
+AUTO_BACKENDS = ("pypdf", "pypdfium2") # what "auto" may pick; the others only when named
+PROBE_REPEAT = 3
+
+_active = None
+_versions = {}
+_pdfium_lock = threading.Lock()
+
+
+def _is_pdf_reader(source):
+    # pypdf is only imported once a pypdf document is opened; a PdfReader
+    # cannot exist before that.
+    pypdf = sys.modules.get("pypdf")
+    return pypdf is not None and isinstance(source, pypdf.PdfReader)
+
+
+def normalize(text):
+    """
+    Page text of another backend in the form pypdf gives it: "\\n" line ends,
+    no form feeds, no trailing blanks on a line or trailing line ends on the
+    page, NFC.
+    """
+    text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\f", "")
+    text = text.replace("\xa0", " ").replace("\ufffe", "").replace("\x02", "") # PDFium's soft hyphen markers
+    if " \n" in text or "\t\n" in text:
+        text = "\n".join(line.rstrip(" \t") for line in text.split("\n"))
+    return unicodedata.normalize("NFC", text.rstrip(" \t\n"))
+
+
+class PypdfDocument:
+    name = "pypdf"
+    page_parallel = True
+
+    def __init__(self, source):
+        from pypdf import PdfReader
+        # An already open PdfReader (pdf_router.py) is used as it is.
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        self.reader = source if isinstance(source, PdfReader) else PdfReader(source)
+
+    def __len__(self):
+        return len(self.reader.pages)
+
+    def page_text(self, index):
+        return self.reader.pages[index].extract_text()
+
+    def close(self):
+        pass
+
+
+class PdfiumDocument:
+    name = "pypdfium2"
+    page_parallel = True
+
+    def __init__(self, source):
+        import pypdfium2
+        if _is_pdf_reader(source):
+            source = source.stream
+            source.seek(0)
+        if hasattr(source, "read"):
+            source = source.read()
+        with _pdfium_lock:
+            self.pdf = pypdfium2.PdfDocument(bytes(source) if isinstance(source, memoryview) else source)
+            self.page_count = len(self.pdf)
+
+    def __len__(self):
+        return self.page_count
+
+    def page_text(self, index):
+        with _pdfium_lock:
+            page = self.pdf[index]
+            try:
+                textpage = page.get_textpage()
+                try:
+                    text = textpage.get_text_range()
+                finally:
+                    textpage.close()
+            finally:
+                page.close()
+        return normalize(text)
+
+    def close(self):
+        with _pdfium_lock:
+            self.pdf.close()
+
+
+class PdftotextDocument:
+    """
+    One pdftotext run for the whole document, on first use; -raw keeps the
+    content stream order, as pypdf does. Sources that are not files are
+    written to a temporary file first.
+    """
+    name = "pdftotext"
+    page_parallel = False # one run reads every page
+
+    def __init__(self, source):
+        self.pages = None
+        self.temp_path = None
+        if _is_pdf_reader(source):
+            source = source.stream
+            source.seek(0)
+        if isinstance(source, (str, os.PathLike)):
+            self.path = os.fspath(source)
+            return
+        if hasattr(source, "read"):
+            source = source.read()
+        import tempfile
+        fd, self.temp_path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(source)
+        self.path = self.temp_path
+
+    def _pages(self):
+        if self.pages is None:
+            import subprocess
+            result = subprocess.run(["pdftotext", "-q", "-enc", "UTF-8", "-raw", self.path, "-"],
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+            if result.returncode != 0:
+                raise ValueError(f"pdftotext failed with exit status {result.returncode}: {result.stderr.decode(errors='replace').strip()}")
+            self.pages = result.stdout.decode("utf-8", errors="replace").split("\f")[:-1] # every page ends with \f
+        return self.pages
+
+    def __len__(self):
+        return len(self._pages())
+
+    def page_text(self, index):
+        return normalize(self._pages()[index])
+
+    def close(self):
+        if self.temp_path:
+            os.unlink(self.temp_path)
+            self.temp_path = None
+
+
+BACKENDS = {document.name: document for document in (PypdfDocument, PdfiumDocument, PdftotextDocument)}
+CHOICES = ("auto",) + tuple(BACKENDS)
+
+
+def available_backends():
+    """Names of the installed backends, pypdf first."""
+    names = ["pypdf"]
+    if importlib.util.find_spec("pypdfium2") is not None:
+        names.append("pypdfium2")
+    if shutil.which("pdftotext"):
+        names.append("pdftotext")
+    return names
+
+
+def backend_version(name):
+    """Version of a backend's library or tool, without importing it."""
+    if name not in _versions:
+        try:
+            if name == "pdftotext":
+                import subprocess
+                result = subprocess.run(["pdftotext", "-v"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+                _versions[name] = result.stdout.decode(errors="replace").split("\n", 1)[0].split()[-1]
+            else:
+                from importlib.metadata import version
+                _versions[name] = version(name)
+        except Exception:
+            _versions[name] = "unknown"
+    return _versions[name]
+
+
+def _sample_pdf():
+    from synthetic_pdf import dei_bill_pages, make_pdf
+    return make_pdf(dei_bill_pages("300004254333", extra_pages=1))
+
+
+def probe(names=None, repeat=PROBE_REPEAT):
+    """{backend: best seconds} for a full extraction of a small synthetic bill, fastest first."""
+    sample = _sample_pdf()
+    results = {}
+    for name in names or available_backends():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            read_text(sample, name)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best
+    return dict(sorted(results.items(), key=lambda item: item[1]))
+
+
+def _probe_cache_path():
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "auto-utility", "pdf-backend.json")
+
+
+def _installed_key(names):
+    """Where every installed backend lives and when it was last changed: a new key means probe again."""
+    key = []
+    for name in names:
+        path = shutil.which(name) if name == "pdftotext" else importlib.util.find_spec(name).origin
+        try:
+            key.append([name, path, os.stat(path).st_mtime_ns])
+        except (OSError, TypeError):
+            key.append([name, path, None])
+    return key
+
+
+def fastest_backend(names):
+    """The fastest of `names`, from the persisted probe result when it was made for the same installed backends."""
+    key = _installed_key(names)
+    path = _probe_cache_path()
+    try:
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved["key"] == key and saved["backend"] in names:
+            return saved["backend"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    name = next(iter(probe(names)))
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "backend": name}, f)
+        os.replace(temp_path, path)
+    except OSError: # a read-only home only costs a probe per run
+        pass
+    return name
+
+
+def select_backend(name):
+    """Sets the backend for this process and for worker processes it starts."""
+    if name not in CHOICES:
+        raise ValueError(f"Unknown PDF text backend: {name!r} (expected one of {', '.join(CHOICES)})")
+    if name != "auto" and name not in available_backends():
+        raise ValueError(f"PDF text backend {name} is not installed")
+    global _active
+    os.environ[BACKEND_ENV] = name
+    _active = None
+
+
+def active_backend():
+    """Name of the backend in use, probing the installed ones the first time when the choice is "auto"."""
+    global _active
+    if _active is None:
+        name = os.environ.get(BACKEND_ENV) or "auto"
+        if name == "auto":
+            names = [name for name in available_backends() if name in AUTO_BACKENDS]
+            name = names[0] if len(names) == 1 else fastest_backend(names)
+            os.environ[BACKEND_ENV] = name # worker processes started later skip the probe
+        elif name not in BACKENDS:
+            raise ValueError(f"Unknown PDF text backend in {BACKEND_ENV}: {name!r} (expected one of {', '.join(CHOICES)})")
+        _active = name
+    return _active
+
+
+def open_document(source, backend=None):
+    """A document of the active backend (or of `backend`) on a path, bytes, binary stream or open PdfReader."""
+    document_class = BACKENDS[backend or active_backend()]
+    with timings.stage("open"):
+        return document_class(source)
+
+
+def read_text(source, backend=None):
+    """Text of every page, each followed by "\\n" (the layout the readers have always used)."""
+    document = open_document(source, backend)
+    try:
+        with timings.stage("extract"):
+            return "".join(document.page_text(index) + "\n" for index in range(len(document)))
+    finally:
+        document.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the installed PDF text backends and time them on a synthetic bill.")
+    parser.add_argument("pdf_file", nargs="?", help="Also print this PDF's text from every backend.")
+    args = parser.parse_args()
+    report = {name: {"version": backend_version(name), "probe_ms": round(seconds * 1000, 2)} for name, seconds in probe().items()}
+    print(json.dumps({"backends": report, "active": active_backend()}, indent=4))
+    if args.pdf_file:
+        for name in available_backends():
+            print(f"--- {name}")
+            print(read_text(args.pdf_file, name), end="")
@@ -0,0 +1,187 @@
+"""
+Per-stage wall time and memory for the readers, plus an optional cProfile dump.
+
+Code marks its stages with `with timings.stage("extract"): ...`. Nothing is
+recorded (and the cost is one function call) unless timings are on, either
+with a reader's --timings option or the AUTO_UTILITY_TIMINGS environment
+variable:
+
+    wall    wall time and call count per stage, and the process's peak RSS
+    memory  the same plus the peak Python allocation of every stage
+            (tracemalloc; this slows the stages down, so do not compare its
+            wall times with a "wall" run)
+
+A record covers one document: `with timings.record(path) as record:`. The
+single-file readers print it as one JSON line on stderr, batch runs as an
+extra {"file", "timings"} line after the file's result.
+
+--profile FILE (or AUTO_UTILITY_PROFILE) writes a cProfile dump of a single
+run, to be read with `python3 -m pstats FILE`.
+"""
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError: # not on Windows
+    resource = None
+
+TIMINGS_ENV = "AUTO_UTILITY_TIMINGS"
+PROFILE_ENV = "AUTO_UTILITY_PROFILE"
+MODES = ("wall", "memory")
+
+_NO_STAGE = contextlib.nullcontext()
+_state = threading.local() # .current: the Record of the document this thread is processing
+
+
+def enable_timings(mode="wall"):
+    """Turns timings on for this process and for worker processes it starts."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown timings mode: {mode!r} (expected one of {', '.join(MODES)})")
+    os.environ[TIMINGS_ENV] = mode
+
+
+def timings_mode():
+    """"wall", "memory" or None (off), from AUTO_UTILITY_TIMINGS ("1" means "wall")."""
+    value = os.environ.get(TIMINGS_ENV, "").strip().lower()
+    if not value or value in ("0", "off", "no"):
+        return None
+    return value if value in MODES else "wall"
+
+
+def _max_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak # bytes on macOS, KiB elsewhere
+
+
+class Record:
+    def __init__(self, label=None, memory=False):
+        self.label = label
+        self.memory = memory
+        self.stages = {} # name -> {"wall_ms", "calls"[, "peak_kb"]}, in first-seen order
+        self._memory_stack = [] # [traced size at stage start, peak carried over from inner stages]
+        self._start = time.perf_counter()
+        self._total_ms = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            if self._memory_stack:
+                self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._memory_stack.append([current, 0])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            entry = self.stages.setdefault(name, {"wall_ms": 0.0, "calls": 0})
+            entry["wall_ms"] += elapsed * 1000
+            entry["calls"] += 1
+            if self.memory:
+                start_size, carried = self._memory_stack.pop()
+                peak = max(tracemalloc.get_traced_memory()[1], carried)
+                if self._memory_stack:
+                    self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+                entry["peak_kb"] = max(entry.get("peak_kb", 0), (peak - start_size) // 1024)
+
+    def finish(self):
+        if self._total_ms is None:
+            self._total_ms = (time.perf_counter() - self._start) * 1000
+        return self
+
+    def as_dict(self):
+        result = {}
+        if self.label is not None:
+            result["file"] = self.label
+        result["total_ms"] = round(self.finish()._total_ms, 3)
+        result["stages"] = {name: dict(entry, wall_ms=round(entry["wall_ms"], 3)) for name, entry in self.stages.items()}
+        result["max_rss_kb"] = _max_rss_kb()
+        return result
+
+
+def stage(name):
+    """Context manager timing one stage of the current document (a no-op when timings are off)."""
+    current = getattr(_state, "current", None)
+    if current is None:
+        return _NO_STAGE
+    return current.stage(name)
+
+
+def timed(name, function):
+    """Wraps `function` so every call is timed as stage `name`."""
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+@contextlib.contextmanager
+def record(label=None, mode=None):
+    """
+    Collects the stages of one document in this thread. Yields the Record,
+    or None when timings are off. `mode` overrides AUTO_UTILITY_TIMINGS.
+    """
+    mode = mode or timings_mode()
+    if mode is None:
+        yield None
+        return
+    if mode == "memory":
+        import tracemalloc # only memory mode pays for it
+    started_tracing = mode == "memory" and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    previous = getattr(_state, "current", None)
+    current = _state.current = Record(label, memory=mode == "memory")
+    try:
+        yield current
+    finally:
+        current.finish()
+        _state.current = previous
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def emit(record, out=None):
+    """Prints a finished record as one JSON line (stderr by default)."""
+    if record is not None:
+        out = out or sys.stderr
+        out.write(json.dumps({"timings": record.as_dict()}, ensure_ascii=False) + "\n")
+        out.flush()
+
+
+def timed_call(worker, path, mode=None):
+    """Batch worker wrapper: returns (worker(path), timings dict)."""
+    with record(path, mode) as current:
+        result = worker(path)
+    return result, current.as_dict() if current is not None else None
+
+
+def enable_profile(path):
+    os.environ[PROFILE_ENV] = path
+
+
+@contextlib.contextmanager
+def profiled():
+    """cProfile around the block when AUTO_UTILITY_PROFILE names an output file."""
+    path = os.environ.get(PROFILE_ENV)
+    if not path:
+        yield
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"Profile written to {path} (python3 -m pstats {path})", file=sys.stderr)